@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the STT audio preprocessing stage (medAI/audio.py).
+
+Runs preprocess_audio on the bundled wikipediaOcelot.wav and on derived
+variants a browser or phone might upload (44.1 kHz stereo 16-bit, 48 kHz
+24-bit with silence around the speech, 32-bit float), reporting bytes
+in/out, audio duration trimmed and processing time percentiles.
+
+With --base-url, each variant is also posted to /speech-to-text of a
+running app (e.g. one pointed at azure_stub.py) to measure end-to-end
+latency; compare runs with MEDAI_AUDIO_PREPROCESS=0 and =1.
+
+    python audio_benchmark.py --iterations 20
+    python audio_benchmark.py --base-url http://localhost:5000 --output audio.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "medAI"))
+import audio  # noqa: E402
+
+DEFAULT_AUDIO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "wikipediaOcelot.wav")
+
+
+def wav_bytes(samples, rate, sample_format):
+    """Encode (frames, channels) float samples as a WAV in the given format ('pcm16', 'pcm24', 'float32')."""
+    np = audio.np
+    _, channels = samples.shape
+    clipped = np.clip(samples, -1.0, 1.0).reshape(-1)
+    if sample_format == "pcm16":
+        tag, bits, data = audio.WAVE_FORMAT_PCM, 16, (clipped * 32767).astype("<i2").tobytes()
+    elif sample_format == "pcm24":
+        ints = (clipped * 8388607).astype("<i4")
+        data = np.stack([ints & 255, (ints >> 8) & 255, (ints >> 16) & 255], axis=1).astype(np.uint8).tobytes()
+        tag, bits = audio.WAVE_FORMAT_PCM, 24
+    else:
+        tag, bits, data = audio.WAVE_FORMAT_IEEE_FLOAT, 32, clipped.astype("<f4").tobytes()
+    block_align = channels * bits // 8
+    fmt = struct.pack("<HHIIHH", tag, channels, rate, rate * block_align, block_align, bits)
+    return (b"RIFF" + struct.pack("<I", 4 + 8 + len(fmt) + 8 + len(data)) + b"WAVE"
+            + b"fmt " + struct.pack("<I", len(fmt)) + fmt
+            + b"data" + struct.pack("<I", len(data)) + data)
+
+
+def build_variants(path):
+    """The bundled file plus re-encoded variants of the same speech."""
+    np = audio.np
+    with open(path, "rb") as f:
+        original = f.read()
+    samples, rate = audio.parse_wav(original)
+    mono = audio.downmix(samples)
+    at_44k = audio.resample(mono, rate, 44100)
+    at_48k = audio.resample(mono, rate, 48000)
+    silence = np.zeros(48000 * 2, dtype=np.float32)
+    padded_48k = np.concatenate([silence, at_48k, silence])
+    return {
+        "bundled (as uploaded)": original,
+        "44.1kHz stereo pcm16": wav_bytes(np.stack([at_44k, at_44k * 0.8], axis=1), 44100, "pcm16"),
+        "48kHz mono pcm24 + 2s silence each side": wav_bytes(padded_48k[:, None], 48000, "pcm24"),
+        "16kHz mono float32": wav_bytes(mono[:, None], rate, "float32"),
+    }
+
+
+def time_preprocessing(data, iterations):
+    timings = []
+    info = None
+    for _ in range(iterations):
+        started = time.perf_counter()
+        _, info = audio.preprocess_audio(data)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "bytes_in": info["bytes_in"],
+        "bytes_out": info["bytes_out"],
+        "reduction": round(1 - info["bytes_out"] / info["bytes_in"], 4),
+        "duration_in_s": info.get("duration_in_s"),
+        "duration_out_s": info.get("duration_out_s"),
+        "skipped": info.get("skipped"),
+        "p50_ms": round(statistics.median(timings), 2),
+        "max_ms": round(timings[-1], 2),
+    }
+
+
+def time_endpoint(base_url, data, iterations):
+    import httpx
+    timings = []
+    with httpx.Client(base_url=base_url, timeout=120) as client:
+        for _ in range(iterations):
+            started = time.perf_counter()
+            response = client.post("/speech-to-text", files={"file": ("upload.wav", data, "audio/wav")})
+            timings.append((time.perf_counter() - started) * 1000)
+            response.raise_for_status()
+    timings.sort()
+    return {"endpoint_p50_ms": round(statistics.median(timings), 1), "endpoint_max_ms": round(timings[-1], 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark STT audio preprocessing on the bundled WAV.")
+    parser.add_argument("--audio", default=DEFAULT_AUDIO, help="WAV file to derive the variants from")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--base-url", help="Also time /speech-to-text on a running app")
+    parser.add_argument("--output", help="Write JSON results to this file (default: stdout)")
+    args = parser.parse_args()
+
+    if not audio.available():
+        sys.exit("numpy is required for audio preprocessing: pip install numpy")
+
+    results = {"iterations": args.iterations, "variants": {}}
+    for name, data in build_variants(args.audio).items():
+        stats = time_preprocessing(data, args.iterations)
+        if args.base_url:
+            stats.update(time_endpoint(args.base_url, data, args.iterations))
+        results["variants"][name] = stats
+        print(f"{name:42s} {stats['bytes_in']:>10,d} -> {stats['bytes_out']:>10,d} bytes "
+              f"({stats['reduction']:.0%} smaller) p50={stats['p50_ms']}ms", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
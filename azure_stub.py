@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Azure upstreams used by medAI/app.py, for offline load testing.
+
+Implements:
+- Azure OpenAI chat completions (streaming and non-streaming)
+- the TTS endpoint called by text_to_speech() (silent audio in the requested
+  response_format: mp3, opus, wav or pcm)
+- both STT response shapes handled by speech_to_text():
+  Whisper ({"text": ...}) and Azure Speech Services ({"DisplayText": ...})
+
+Latency is drawn from a log-normal distribution per upstream (given as median
+and p95 in milliseconds), errors are injected at configurable rates, and
+streamed replies are paced at a configurable token throughput.
+
+Usage:
+    python azure_stub.py --port 5055 --llm-latency 300:900 --error-rate 0.01
+    MEDAI_UPSTREAM=stub MEDAI_STUB_URL=http://127.0.0.1:5055 python medAI/app.py
+
+GET /stub/stats returns request counters; POST /stub/config updates settings at runtime.
+"""
+
+import argparse
+import io
+import json
+import math
+import struct
+import random
+import threading
+import time
+import uuid
+import wave
+from flask import Flask, Response, request, jsonify
+# The STT/TTS paths are shared with the stub-mode secrets in secret_loader
+from secret_loader import (
+    STUB_TTS_PATH as TTS_PATH,
+    STUB_WHISPER_STT_PATH as WHISPER_STT_PATH,
+    STUB_AZURE_STT_PATH as AZURE_STT_PATH,
+)
+
+app = Flask(__name__)
+
+# Canned content for generated replies
+REPLY_SENTENCES = [
+    "Thank you for sharing that with me.",
+    "I have noted that in your record.",
+    "That is helpful information for your care team.",
+    "Could you tell me a little more about how long this has been going on?",
+    "On a scale of 1 to 10, how would you rate your pain right now?",
+    "Are you currently taking any prescribed medications?",
+    "Do you have any known allergies to medications or foods?",
+    "How would you describe your sleep over the past few weeks?",
+]
+TRANSCRIPTION_TEXT = "The ocelot is a medium-sized wild cat native to the southwestern United States, Mexico, and Central and South America."
+TTS_CHUNK_BYTES = 4096  # Size of the chunks TTS audio is streamed in
+
+CONFIG = {
+    # Latency per upstream as (median ms, p95 ms); for the LLM this is time to first token
+    "latency": {"llm": (300.0, 900.0), "stt": (400.0, 1200.0), "tts": (250.0, 800.0)},
+    "error_rate": 0.0,         # Fraction of requests answered with a 500
+    "rate_limit_rate": 0.0,    # Fraction of requests answered with a 429 + Retry-After
+    "retry_after": 1,          # Seconds advertised in Retry-After on 429s
+    "tokens_per_second": 60.0, # LLM generation speed (streaming pace and non-streaming duration)
+    "reply_tokens": 40,        # Words per chat reply (capped by max_tokens)
+    "tts_chars_per_second": 15.0,  # Audio duration generated per character of TTS input
+}
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+
+def count(endpoint, outcome):
+    with _stats_lock:
+        bucket = _stats.setdefault(endpoint, {})
+        bucket[outcome] = bucket.get(outcome, 0) + 1
+
+
+def parse_latency(value):
+    """'median:p95' in milliseconds -> (median, p95)."""
+    median, _, p95 = value.partition(":")
+    median = float(median)
+    return median, float(p95) if p95 else median
+
+
+def sample_latency(upstream):
+    """Log-normal latency sample in seconds with the configured median and p95."""
+    median, p95 = CONFIG["latency"][upstream]
+    if median <= 0:
+        return 0.0
+    sigma = math.log(p95 / median) / 1.645 if p95 > median else 0.0
+    return random.lognormvariate(math.log(median), sigma) / 1000.0
+
+
+def injected_error(endpoint):
+    """Return an error response for a configured fraction of requests, else None."""
+    roll = random.random()
+    if roll < CONFIG["rate_limit_rate"]:
+        count(endpoint, "429")
+        response = jsonify({"error": {"code": "429", "message": "Rate limit exceeded (stub)."}})
+        response.status_code = 429
+        response.headers["Retry-After"] = str(CONFIG["retry_after"])
+        return response
+    if roll < CONFIG["rate_limit_rate"] + CONFIG["error_rate"]:
+        count(endpoint, "500")
+        response = jsonify({"error": {"code": "500", "message": "Internal server error (stub)."}})
+        response.status_code = 500
+        return response
+    return None
+
+
+def reply_words(max_tokens):
+    """Words for a generated reply, one word standing in for one token."""
+    limit = min(CONFIG["reply_tokens"], max_tokens or CONFIG["reply_tokens"])
+    words = []
+    while len(words) < limit:
+        words.extend(random.choice(REPLY_SENTENCES).split())
+    return words[:limit]
+
+
+def estimate_prompt_tokens(messages):
+    return sum(len(m.get("content") or "") for m in messages) // 4
+
+
+def completion_chunk(completion_id, model, content=None, finish_reason=None):
+    return {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "delta": {"role": "assistant", "content": content} if content is not None else {},
+            "finish_reason": finish_reason,
+        }],
+    }
+
+
+@app.route("/openai/deployments/<deployment>/chat/completions", methods=["POST"])
+def chat_completions(deployment):
+    """Azure OpenAI chat completions, streaming or not."""
+    body = request.get_json(silent=True) or {}
+    time.sleep(sample_latency("llm"))
+    error = injected_error("chat")
+    if error is not None:
+        return error
+
+    words = reply_words(body.get("max_tokens"))
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    prompt_tokens = estimate_prompt_tokens(body.get("messages", []))
+    token_delay = 1.0 / CONFIG["tokens_per_second"] if CONFIG["tokens_per_second"] > 0 else 0.0
+
+    if body.get("stream"):
+        count("chat_stream", "200")
+
+        def generate():
+            # Azure sends a leading chunk with prompt filter results and no choices
+            yield "data: " + json.dumps({"id": "", "object": "", "created": 0, "model": "", "choices": [],
+                                         "prompt_filter_results": []}) + "\n\n"
+            for index, word in enumerate(words):
+                if token_delay:
+                    time.sleep(token_delay)
+                text = word if index == 0 else " " + word
+                yield "data: " + json.dumps(completion_chunk(completion_id, deployment, text)) + "\n\n"
+            yield "data: " + json.dumps(completion_chunk(completion_id, deployment, finish_reason="stop")) + "\n\n"
+            yield "data: [DONE]\n\n"
+
+        return Response(generate(), mimetype="text/event-stream")
+
+    count("chat", "200")
+    time.sleep(token_delay * len(words))
+    return jsonify({
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": deployment,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": " ".join(words)},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(words),
+            "total_tokens": prompt_tokens + len(words),
+        },
+    })
+
+
+def silent_wav(seconds, sample_rate=8000):
+    """8-bit mono WAV of silence, standing in for synthesized speech."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(1)
+        wav.setframerate(sample_rate)
+        wav.writeframes(b"\x80" * int(seconds * sample_rate))
+    return buffer.getvalue()
+
+
+def silent_mp3(seconds):
+    """MPEG-1 Layer III frames (128 kbit/s, 44.1 kHz, mono) with empty side info, which decode to silence."""
+    header = bytes([0xFF, 0xFB, 0x90, 0xC4])
+    frame = header + bytes(144 * 128000 // 44100 - len(header))
+    return frame * max(1, int(seconds * 44100 / 1152))
+
+
+def _ogg_crc(data):
+    crc = 0
+    for byte in data:
+        crc ^= byte << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7 if crc & 0x80000000 else crc << 1) & 0xFFFFFFFF
+    return crc
+
+
+def _ogg_page(packets, granule, sequence, flags=0, serial=0x4D454441):
+    segments = b"".join(bytes([len(packet)]) for packet in packets)  # Every packet here is under 255 bytes
+    page = struct.pack("<4sBBqIIIB", b"OggS", 0, flags, granule, serial, sequence, 0, len(packets)) + segments + b"".join(packets)
+    return page[:22] + struct.pack("<I", _ogg_crc(page)) + page[26:]
+
+
+def silent_opus(seconds):
+    """Ogg Opus stream of 20 ms silent CELT frames."""
+    pre_skip = 312
+    pages = [
+        _ogg_page([b"OpusHead" + struct.pack("<BBHIhB", 1, 1, pre_skip, 48000, 0, 0)], 0, 0, flags=0x02),
+        _ogg_page([b"OpusTags" + struct.pack("<I", 4) + b"stub" + struct.pack("<I", 0)], 0, 1),
+    ]
+    frames = max(1, int(seconds * 50))
+    for start in range(0, frames, 50):
+        count_in_page = min(50, frames - start)
+        granule = pre_skip + (start + count_in_page) * 960
+        last = start + count_in_page >= frames
+        pages.append(_ogg_page([b"\xf8\xff\xfe"] * count_in_page, granule, len(pages), flags=0x04 if last else 0))
+    return b"".join(pages)
+
+
+def silent_pcm(seconds, sample_rate=24000):
+    """Raw 16-bit mono PCM of silence."""
+    return bytes(2 * int(seconds * sample_rate))
+
+
+# TTS response_format -> (silent audio generator, content type)
+TTS_FORMATS = {
+    "mp3": (silent_mp3, "audio/mpeg"),
+    "opus": (silent_opus, "audio/ogg"),
+    "wav": (silent_wav, "audio/wav"),
+    "pcm": (silent_pcm, "audio/pcm"),
+}
+
+
+@app.route(TTS_PATH, methods=["POST"])
+def text_to_speech():
+    """TTS: returns audio whose duration scales with the input text."""
+    body = request.get_json(silent=True) or {}
+    time.sleep(sample_latency("tts"))
+    error = injected_error("tts")
+    if error is not None:
+        return error
+    text = body.get("input", "")
+    if not text:
+        count("tts", "400")
+        return jsonify({"error": {"message": "input is required"}}), 400
+    audio_format = body.get("response_format") or "mp3"
+    if audio_format not in TTS_FORMATS:
+        count("tts", "400")
+        return jsonify({"error": {"message": f"Unsupported response_format: {audio_format}"}}), 400
+    count("tts", "200")
+    seconds = max(0.5, len(text) / CONFIG["tts_chars_per_second"])
+    silent_audio, mimetype = TTS_FORMATS[audio_format]
+    audio = silent_audio(seconds)
+
+    def generate():
+        # Chunked like the real service, which streams audio as it is synthesized
+        for start in range(0, len(audio), TTS_CHUNK_BYTES):
+            yield audio[start:start + TTS_CHUNK_BYTES]
+
+    return Response(generate(), mimetype=mimetype)
+
+
+def uploaded_audio(field):
+    upload = request.files.get(field)
+    return upload.read() if upload is not None else b""
+
+
+@app.route(WHISPER_STT_PATH, methods=["POST"])
+def whisper_transcription():
+    """STT, OpenAI Whisper response shape."""
+    audio = uploaded_audio("file")
+    time.sleep(sample_latency("stt"))
+    error = injected_error("stt_whisper")
+    if error is not None:
+        return error
+    if not audio:
+        count("stt_whisper", "400")
+        return jsonify({"error": {"message": "file is required"}}), 400
+    count("stt_whisper", "200")
+    return jsonify({"text": TRANSCRIPTION_TEXT})
+
+
+@app.route(AZURE_STT_PATH, methods=["POST"])
+def azure_speech_transcription():
+    """STT, Azure Speech Services 'simple' response shape."""
+    audio = uploaded_audio("audio")
+    time.sleep(sample_latency("stt"))
+    error = injected_error("stt_azure")
+    if error is not None:
+        return error
+    if not audio:
+        count("stt_azure", "400")
+        return jsonify({"RecognitionStatus": "NoMatch"}), 400
+    count("stt_azure", "200")
+    return jsonify({
+        "RecognitionStatus": "Success",
+        "DisplayText": TRANSCRIPTION_TEXT,
+        "Offset": 0,
+        "Duration": 50000000,
+    })
+
+
+@app.route("/stub/stats", methods=["GET"])
+def stats():
+    with _stats_lock:
+        return jsonify({"requests": _stats, "config": CONFIG})
+
+
+@app.route("/stub/config", methods=["POST"])
+def update_config():
+    """Change stub behaviour at runtime, e.g. {"error_rate": 0.2, "latency": {"llm": "100:300"}}."""
+    body = request.get_json(silent=True) or {}
+    for key, value in body.items():
+        if key == "latency":
+            for upstream, spec in value.items():
+                CONFIG["latency"][upstream] = parse_latency(spec) if isinstance(spec, str) else tuple(spec)
+        elif key in CONFIG:
+            CONFIG[key] = type(CONFIG[key])(value)
+    with _stats_lock:
+        if body.get("reset_stats"):
+            _stats.clear()
+    return jsonify({"config": CONFIG})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local Azure OpenAI / Speech stand-in for load testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--llm-latency", default="300:900", help="LLM time to first token, median:p95 in ms")
+    parser.add_argument("--stt-latency", default="400:1200", help="STT latency, median:p95 in ms")
+    parser.add_argument("--tts-latency", default="250:800", help="TTS latency, median:p95 in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests failing with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds on 429 responses")
+    parser.add_argument("--tokens-per-second", type=float, default=60.0, help="LLM token throughput")
+    parser.add_argument("--reply-tokens", type=int, default=40, help="Tokens per chat reply")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible runs")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    CONFIG["latency"] = {
+        "llm": parse_latency(args.llm_latency),
+        "stt": parse_latency(args.stt_latency),
+        "tts": parse_latency(args.tts_latency),
+    }
+    CONFIG.update({
+        "error_rate": args.error_rate,
+        "rate_limit_rate": args.rate_limit_rate,
+        "retry_after": args.retry_after,
+        "tokens_per_second": args.tokens_per_second,
+        "reply_tokens": args.reply_tokens,
+    })
+
+    print(f"Azure stub listening on http://{args.host}:{args.port}")
+    print(f"Point the app at it with: MEDAI_UPSTREAM=stub MEDAI_STUB_URL=http://{args.host}:{args.port}")
+    app.run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
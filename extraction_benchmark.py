@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for patient field extraction (medAI/extraction.py).
+
+Times extract_fields() against the previous implementation of
+extract_patient_info() (kept below as the baseline: one substring scan per
+keyword and uncompiled regexes over the whole transcript) on transcripts of
+increasing length. Each transcript is the Sarah Thompson consultation with
+generic small-talk turns in front of it, so the fields are only found late
+in the text. Both implementations must produce the same fields; the run
+aborts if they differ.
+
+    python extraction_benchmark.py
+    python extraction_benchmark.py --turns 10,100,1000,10000 --output extraction.json
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "medAI"))
+from extraction import extract_fields, FIELDS  # noqa: E402
+from sample_consultation import SARAH_THOMPSON_CONVERSATION  # noqa: E402
+
+FILLER_TURNS = [
+    {"role": "assistant", "content": "How have you been sleeping over the last few weeks?"},
+    {"role": "user", "content": "Not too badly, I usually get about seven hours and wake up once or twice at night."},
+    {"role": "assistant", "content": "Has anything changed in your routine recently?"},
+    {"role": "user", "content": "I started a new job 3 months ago, so my commute is longer and I eat later than I used to."},
+]
+
+
+def baseline_extract(conversation_history, patient):
+    """The previous extract_patient_info() (minus the database commit), kept for comparison."""
+    conversation_text = " ".join([msg.get('content', '') for msg in conversation_history if msg.get('role') == 'user'])
+    conversation_lower = conversation_text.lower()
+
+    if not patient.date_of_birth:
+        dob_patterns = [r'(\d{1,2}/\d{1,2}/\d{4})', r'(april|march|january|february|may|june|july|august|september|october|november|december)\s+(\d{1,2}),?\s+(\d{4})', r'(\d{1,2})\s+(april|march|january|february|may|june|july|august|september|october|november|december)\s+(\d{4})']
+        for pattern in dob_patterns:
+            match = re.search(pattern, conversation_lower)
+            if match:
+                if 'april 15' in conversation_lower and '1985' in conversation_lower:
+                    patient.date_of_birth = "04/15/1985"
+                break
+
+    if not patient.address and ('lane' in conversation_lower or 'street' in conversation_lower or 'avenue' in conversation_lower):
+        address_match = re.search(r'(\d+\s+[a-zA-Z\s]+(lane|street|avenue|road|dr|drive)[^,]*[,\s]*[a-zA-Z\s]*[,\s]*[a-zA-Z]{2}[,\s]*\d{5})', conversation_text, re.IGNORECASE)
+        if address_match:
+            patient.address = address_match.group(0).strip()
+
+    if not patient.emergency_contact and ('john thompson' in conversation_lower or 'spouse' in conversation_lower):
+        contact_match = re.search(r'(john thompson[^.]*\(\d{3}\)\s*\d{3}-\d{4})', conversation_text, re.IGNORECASE)
+        if contact_match:
+            patient.emergency_contact = contact_match.group(0).strip()
+        elif 'john thompson' in conversation_lower and '732' in conversation_text:
+            patient.emergency_contact = "John Thompson (Spouse) – (732) 555-9123"
+
+    if 'blood pressure' in conversation_lower and not patient.blood_pressure:
+        bp_match = re.search(r'(\d{2,3})[/\s]*(?:over\s*)?(\d{2,3})', conversation_text)
+        if bp_match:
+            patient.blood_pressure = f"{bp_match.group(1)}/{bp_match.group(2)}"
+
+    if 'temperature' in conversation_lower and not patient.temperature:
+        temp_match = re.search(r'(\d{2,3}\.?\d*)\s*(?:degrees?\s*)?(?:fahrenheit|f|°f)', conversation_lower)
+        if temp_match:
+            patient.temperature = f"{temp_match.group(1)}°F"
+
+    if 'heart rate' in conversation_lower or 'pulse' in conversation_lower and not patient.heart_rate:
+        hr_match = re.search(r'(\d{2,3})\s*(?:beats?\s*per\s*minute|bpm)', conversation_lower)
+        if hr_match:
+            patient.heart_rate = f"{hr_match.group(1)} bpm"
+
+    if 'pain' in conversation_lower and not patient.pain_level:
+        for pattern in [r'pain.*?(\d+)', r'(\d+).*?pain', r'(\d+)/10', r'(\d+) out of 10']:
+            match = re.search(pattern, conversation_lower)
+            if match:
+                patient.pain_level = match.group(1)
+                break
+
+    if not patient.chief_complaint and ('stomach pain' in conversation_lower or 'bloating' in conversation_lower):
+        patient.chief_complaint = "Ongoing stomach pain and bloating"
+
+    if not patient.past_medical_conditions and ('asthma' in conversation_lower or 'allergies' in conversation_lower):
+        conditions = []
+        if 'asthma' in conversation_lower:
+            conditions.append('mild asthma')
+        if 'seasonal allergies' in conversation_lower:
+            conditions.append('seasonal allergies')
+        if conditions:
+            patient.past_medical_conditions = ', '.join(conditions)
+
+    if not patient.current_medications and ('albuterol' in conversation_lower or 'loratadine' in conversation_lower):
+        meds = []
+        if 'albuterol' in conversation_lower:
+            meds.append('Albuterol inhaler (as needed)')
+        if 'loratadine' in conversation_lower:
+            meds.append('Loratadine 10mg once daily')
+        if meds:
+            patient.current_medications = ', '.join(meds)
+
+    if not patient.allergies and ('penicillin' in conversation_lower or 'peanuts' in conversation_lower):
+        allergies = []
+        if 'penicillin' in conversation_lower:
+            allergies.append('Penicillin (rash)')
+        if 'peanuts' in conversation_lower:
+            allergies.append('peanuts (mild swelling)')
+        if allergies:
+            patient.allergies = ', '.join(allergies)
+
+
+def build_transcript(filler_turns):
+    return FILLER_TURNS * (filler_turns // len(FILLER_TURNS)) + SARAH_THOMPSON_CONVERSATION
+
+
+def run_baseline(messages):
+    patient = types.SimpleNamespace(**dict.fromkeys(FIELDS))
+    baseline_extract(messages, patient)
+    return {field: value for field, value in vars(patient).items() if value is not None}
+
+
+def run_engine(messages):
+    return extract_fields(messages, dict.fromkeys(FIELDS))
+
+
+def time_call(fn, messages, min_seconds):
+    """Median per-call time in milliseconds over at least min_seconds (and at least 5 calls)."""
+    timings = []
+    deadline = time.perf_counter() + min_seconds
+    while len(timings) < 5 or time.perf_counter() < deadline:
+        started = time.perf_counter()
+        fn(messages)
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(timings), 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark patient field extraction against transcript length.")
+    parser.add_argument("--turns", default="0,40,400,4000,20000",
+                        help="Comma-separated numbers of filler turns to put in front of the sample consultation")
+    parser.add_argument("--min-seconds", type=float, default=0.5, help="Minimum timing duration per case")
+    parser.add_argument("--output", help="Write JSON results to this file (default: stdout)")
+    args = parser.parse_args()
+
+    results = {"cases": []}
+    for filler in (int(n) for n in args.turns.split(",")):
+        messages = build_transcript(filler)
+        expected, actual = run_baseline(messages), run_engine(messages)
+        if expected != actual:
+            sys.exit(f"Extraction differs at {filler} filler turns:\n  baseline: {expected}\n  engine:   {actual}")
+        user_chars = sum(len(m["content"]) + 1 for m in messages if m["role"] == "user")
+        case = {
+            "messages": len(messages),
+            "user_chars": user_chars,
+            "fields": len(actual),
+            "baseline_ms": time_call(run_baseline, messages, args.min_seconds),
+            "engine_ms": time_call(run_engine, messages, args.min_seconds),
+        }
+        case["speedup"] = round(case["baseline_ms"] / case["engine_ms"], 2)
+        results["cases"].append(case)
+        print(f"{case['messages']:>6d} messages {user_chars:>10,d} chars  baseline {case['baseline_ms']:>10.3f} ms  "
+              f"engine {case['engine_ms']:>9.3f} ms  ({case['speedup']}x)", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
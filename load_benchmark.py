@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+End-to-end HTTP load benchmark for the consultation workflow.
+
+Each virtual user replays full consultations against a running app:
+    lookup_patient -> speech-to-text (wikipediaOcelot.wav) -> N consultation chat turns
+    (Sarah Thompson transcript) with text-to-speech of every reply -> save_patient -> generate_report
+
+Results (throughput, per-endpoint p50/p95/p99 latency, status codes and error
+rates) are written as JSON for regression tracking. Combine with azure_stub.py
+to benchmark without Azure quota:
+
+    python azure_stub.py &
+    (cd medAI && MEDAI_UPSTREAM=stub python app.py) &
+    python load_benchmark.py --users 8 --consultations 2 --output results.json
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+import httpx
+from sample_consultation import SARAH_THOMPSON_CONVERSATION
+
+DEFAULT_AUDIO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "wikipediaOcelot.wav")
+PATIENT_NAME = "Sarah Thompson"
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(math.ceil(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    """Thread-safe per-endpoint latency and status collection."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def record(self, endpoint, seconds, status, error=None):
+        with self._lock:
+            entry = self.samples.setdefault(endpoint, {"latencies": [], "statuses": {}, "errors": 0, "error_messages": {}})
+            entry["latencies"].append(seconds)
+            entry["statuses"][str(status)] = entry["statuses"].get(str(status), 0) + 1
+            if error:
+                entry["errors"] += 1
+                entry["error_messages"][error] = entry["error_messages"].get(error, 0) + 1
+
+    def summary(self, duration):
+        result = {}
+        for endpoint, entry in sorted(self.samples.items()):
+            latencies = sorted(entry["latencies"])
+            count = len(latencies)
+            result[endpoint] = {
+                "count": count,
+                "errors": entry["errors"],
+                "error_rate": round(entry["errors"] / count, 4) if count else 0.0,
+                "status_codes": entry["statuses"],
+                "throughput_rps": round(count / duration, 3) if duration else None,
+                "mean_ms": round(sum(latencies) / count * 1000, 1) if count else None,
+                "p50_ms": round(percentile(latencies, 0.50) * 1000, 1) if count else None,
+                "p95_ms": round(percentile(latencies, 0.95) * 1000, 1) if count else None,
+                "p99_ms": round(percentile(latencies, 0.99) * 1000, 1) if count else None,
+                "max_ms": round(latencies[-1] * 1000, 1) if count else None,
+                "top_errors": dict(sorted(entry["error_messages"].items(), key=lambda item: -item[1])[:5]),
+            }
+        return result
+
+
+class ConsultationUser:
+    """One virtual user replaying consultations with its own keep-alive connection pool."""
+
+    def __init__(self, user_id, args, recorder, audio_bytes):
+        self.user_id = user_id
+        self.args = args
+        self.recorder = recorder
+        self.audio_bytes = audio_bytes
+        self.client = httpx.Client(base_url=args.base_url, timeout=args.timeout)
+        self.patient_name = f"{PATIENT_NAME} {user_id}" if args.unique_patients else PATIENT_NAME
+
+    def call(self, endpoint, method, path, **kwargs):
+        """Send one request, record its latency/outcome and return the parsed JSON (or None on failure)."""
+        started = time.perf_counter()
+        try:
+            response = self.client.request(method, path, **kwargs)
+            elapsed = time.perf_counter() - started
+        except httpx.HTTPError as e:
+            self.recorder.record(endpoint, time.perf_counter() - started, "exception", type(e).__name__)
+            return None
+        if response.status_code >= 400:
+            self.recorder.record(endpoint, elapsed, response.status_code, f"HTTP {response.status_code}")
+            return None
+        try:
+            data = response.json()
+        except ValueError:
+            self.recorder.record(endpoint, elapsed, response.status_code, "invalid JSON")
+            return None
+        self.recorder.record(endpoint, elapsed, response.status_code)
+        return data
+
+    def stream_chat(self, payload):
+        """Streamed consultation turn: records time to first token and total time; returns the done payload."""
+        started = time.perf_counter()
+        first_token = None
+        done = None
+        try:
+            with self.client.stream("POST", "/consultation_chat_stream", json=payload) as response:
+                if response.status_code >= 400:
+                    response.read()
+                    self.recorder.record("consultation_chat_stream", time.perf_counter() - started,
+                                         response.status_code, f"HTTP {response.status_code}")
+                    return None
+                event = None
+                for line in response.iter_lines():
+                    if line.startswith("event: "):
+                        event = line[len("event: "):]
+                    elif line.startswith("data: "):
+                        if event == "delta" and first_token is None:
+                            first_token = time.perf_counter() - started
+                        elif event == "done":
+                            done = json.loads(line[len("data: "):])
+                        elif event == "error":
+                            break
+        except httpx.HTTPError as e:
+            self.recorder.record("consultation_chat_stream", time.perf_counter() - started, "exception", type(e).__name__)
+            return None
+        elapsed = time.perf_counter() - started
+        if done is None:
+            self.recorder.record("consultation_chat_stream", elapsed, 200, "stream ended without done event")
+            return None
+        self.recorder.record("consultation_chat_stream", elapsed, 200)
+        if first_token is not None:
+            self.recorder.record("consultation_chat_stream_first_token", first_token, 200)
+        return done
+
+    def run_consultation(self):
+        args = self.args
+        user_messages = [m["content"] for m in SARAH_THOMPSON_CONVERSATION if m["role"] == "user"]
+        turns = user_messages[:args.turns] if args.turns else user_messages
+
+        self.call("lookup_patient", "POST", "/lookup_patient", json={"name": self.patient_name})
+
+        if args.stt and self.audio_bytes:
+            self.call("speech_to_text", "POST", "/speech-to-text",
+                      files={"file": ("wikipediaOcelot.wav", self.audio_bytes, "audio/wav")})
+
+        session_key = None
+        history = []
+        for message in turns:
+            if self.args.unique_patients and message == f"My name is {PATIENT_NAME}":
+                message = f"My name is {self.patient_name}"
+            payload = {"message": message}
+            if session_key:
+                payload["session_key"] = session_key
+            else:
+                payload["history"] = history
+            data = self.stream_chat(payload) if args.stream else self.call(
+                "consultation_chat", "POST", "/consultation_chat", json=payload)
+            if data is None:
+                continue
+            session_key = data.get("session_key", session_key)
+            reply = data.get("response", "")
+            if not session_key:
+                history.extend([{"role": "user", "content": message}, {"role": "assistant", "content": reply}])
+            if args.tts and reply:
+                self.call("text_to_speech", "POST", "/text-to-speech", json={"text": reply})
+
+        conversation = {"session_key": session_key} if session_key else {"history": history}
+        self.call("save_patient", "POST", "/save_patient", json=dict(conversation, name=self.patient_name))
+        if args.report:
+            self.call("generate_report", "POST", "/generate_report", json=dict(conversation, mode=args.report_mode))
+
+    def run(self, completed):
+        try:
+            for _ in range(self.args.consultations):
+                started = time.perf_counter()
+                self.run_consultation()
+                self.recorder.record("consultation_total", time.perf_counter() - started, "complete")
+                completed.append(1)
+        finally:
+            self.client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay full consultations against the medical AI app and report latency percentiles.")
+    parser.add_argument("--base-url", default="http://localhost:5000")
+    parser.add_argument("--users", type=int, default=4, help="Concurrent virtual users")
+    parser.add_argument("--consultations", type=int, default=1, help="Consultations per user")
+    parser.add_argument("--turns", type=int, default=0, help="Chat turns per consultation (0 = whole transcript)")
+    parser.add_argument("--stream", action="store_true", help="Use /consultation_chat_stream for chat turns")
+    parser.add_argument("--report-mode", choices=["single", "sections"], default="sections")
+    parser.add_argument("--no-tts", dest="tts", action="store_false", help="Skip text-to-speech of replies")
+    parser.add_argument("--no-stt", dest="stt", action="store_false", help="Skip the speech-to-text upload")
+    parser.add_argument("--no-report", dest="report", action="store_false", help="Skip report generation")
+    parser.add_argument("--unique-patients", action="store_true", help="Give each virtual user its own patient name")
+    parser.add_argument("--audio", default=DEFAULT_AUDIO, help="WAV file uploaded to /speech-to-text")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--output", help="Write JSON results to this file (default: stdout)")
+    args = parser.parse_args()
+
+    audio_bytes = b""
+    if args.stt:
+        with open(args.audio, "rb") as f:
+            audio_bytes = f.read()
+
+    recorder = Recorder()
+    completed = []
+    users = [ConsultationUser(i + 1, args, recorder, audio_bytes) for i in range(args.users)]
+    threads = [threading.Thread(target=user.run, args=(completed,), daemon=True) for user in users]
+
+    print(f"Running {args.users} users x {args.consultations} consultations against {args.base_url}...", file=sys.stderr)
+    started_at = datetime.now().isoformat(timespec="seconds")
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+
+    endpoints = recorder.summary(duration)
+    total_requests = sum(v["count"] for k, v in endpoints.items() if k not in ("consultation_total", "consultation_chat_stream_first_token"))
+    total_errors = sum(v["errors"] for k, v in endpoints.items() if k not in ("consultation_total", "consultation_chat_stream_first_token"))
+    results = {
+        "started_at": started_at,
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "duration_s": round(duration, 3),
+        "consultations_completed": len(completed),
+        "consultations_per_minute": round(len(completed) / duration * 60, 3) if duration else None,
+        "requests": total_requests,
+        "throughput_rps": round(total_requests / duration, 3) if duration else None,
+        "error_rate": round(total_errors / total_requests, 4) if total_requests else 0.0,
+        "endpoints": endpoints,
+    }
+
+    for name, stats in endpoints.items():
+        print(f"{name:40s} n={stats['count']:5d} err={stats['error_rate']:.2%} "
+              f"p50={stats['p50_ms']}ms p95={stats['p95_ms']}ms p99={stats['p99_ms']}ms", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
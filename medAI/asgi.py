@@ -0,0 +1,690 @@
+"""Async (ASGI) serving path for the LLM and speech endpoints.
+
+The upstream-bound endpoints are reimplemented as async views using
+AsyncAzureOpenAI and httpx.AsyncClient, so one process can hold many
+in-flight Azure calls without tying up a thread each. Every other route
+(pages, static files, patient lookup/save, ...) is served by the existing
+Flask app mounted underneath.
+
+Run with:
+    uvicorn asgi:app --app-dir medAI --host 0.0.0.0 --port 5000
+
+The sync Flask app (python app.py, or any WSGI server) keeps working unchanged.
+"""
+import asyncio
+import base64
+import contextlib
+import json
+import math
+import os
+from tempfile import SpooledTemporaryFile
+import httpx
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
+
+from app import (
+    app as flask_app,
+    REPORT_MODES,
+    prepare_consultation_turn,
+    sse_event,
+    resolve_conversation,
+    tts_cache,
+    stt_cache,
+    prepare_stt_audio,
+    plan_stt_chunks,
+    stitched_transcription,
+)
+from sessions import SessionNotFound
+from cache import content_digest
+from uploads import upload_size, record_upload, record_rejected_upload
+from clients import get_async_openai_client, get_async_http_client, aclose_async_clients
+from upstream import UpstreamUnavailable, acreate_completion, apost, apost_stream
+from secret_loader import get_secrets
+from speech import (build_stt_request, parse_stt_result, build_tts_request, AsyncSpeechPipeline, stt_cache_key, cacheable_stt_result,
+                    tts_cache_key, negotiate_tts_response, TTS_FORMAT, TTS_FORMATS)
+from reports import (
+    agenerate_report_text,
+    astream_report_text,
+    agenerate_report_sections,
+    astream_report_sections,
+)
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'  # Disable proxy buffering (nginx)
+}
+
+
+async def _json_body(request):
+    try:
+        data = await request.json()
+    except json.JSONDecodeError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _prepare_consultation_turn(user_message, conversation, conversation_history):
+    """Run the (sync, database-backed) patient lookup and prompt budgeting inside a Flask app context."""
+    with flask_app.app_context():
+        return prepare_consultation_turn(user_message, conversation, conversation_history)
+
+
+def _resolve_conversation(data, create=True):
+    """Resolve the server-side session (may reload it from the database) inside a Flask app context."""
+    with flask_app.app_context():
+        return resolve_conversation(data, create)
+
+
+def _upstream_unavailable(error):
+    print(f"Upstream unavailable: {error}")
+    return JSONResponse(
+        {'error': f'The {error.upstream} service is temporarily unavailable. Please try again shortly.'},
+        status_code=503,
+        headers={'Retry-After': str(int(math.ceil(error.retry_after)))}
+    )
+
+
+def _upload_too_large():
+    record_rejected_upload()
+    limit_mb = flask_app.config['MAX_CONTENT_LENGTH'] / (1024 * 1024)
+    return JSONResponse({'error': f'Upload too large (limit {limit_mb:g} MB)'}, status_code=413)
+
+
+def _session_not_found():
+    return JSONResponse({'error': 'Unknown or expired session.'}, status_code=404)
+
+
+async def chat(request):
+    """Async version of /chat."""
+    data = await _json_body(request)
+    user_message = data.get("message", "")
+
+    if not user_message:
+        return JSONResponse({'error': 'Message is required.'}, status_code=400)
+
+    try:
+        secrets = get_secrets()
+    except Exception as e:
+        return JSONResponse({'error': f'Error loading secrets: {str(e)}'}, status_code=500)
+
+    try:
+        print("=== ASYNC CHAT API TASK STARTED ===")
+        client = get_async_openai_client()
+        response = await acreate_completion(
+            client,
+            model=secrets.AZURE_OPENAI_DEPLOYMENT,
+            messages=[
+                {"role": "system", "content": "You are a helpful medical assistant."},
+                {"role": "user", "content": user_message}
+            ],
+            max_tokens=128,
+            temperature=0.7
+        )
+        ai_message = response.choices[0].message.content
+        print("=== ASYNC CHAT API TASK COMPLETED ===")
+        return JSONResponse({"response": ai_message})
+    except UpstreamUnavailable as e:
+        return _upstream_unavailable(e)
+    except Exception as e:
+        print(f"Chat exception: {e}")
+        print("=== ASYNC CHAT API TASK FAILED ===")
+        return JSONResponse({'error': f'Error from OpenAI: {str(e)}'}, status_code=500)
+
+
+async def consultation_chat(request):
+    """Async version of /consultation_chat."""
+    data = await _json_body(request)
+    user_message = data.get("message", "")
+
+    if not user_message:
+        return JSONResponse({'error': 'Message is required.'}, status_code=400)
+
+    try:
+        conversation, conversation_history = await run_in_threadpool(_resolve_conversation, data)
+    except SessionNotFound:
+        return _session_not_found()
+
+    try:
+        secrets = get_secrets()
+    except Exception as e:
+        return JSONResponse({'error': f'Error loading secrets: {str(e)}'}, status_code=500)
+
+    try:
+        print("=== ASYNC CONSULTATION CHAT API TASK STARTED ===")
+        print(f"Conversation history length: {len(conversation_history)} messages")
+        messages, patient_payload, tokens_saved = await run_in_threadpool(
+            _prepare_consultation_turn, user_message, conversation, conversation_history)
+
+        client = get_async_openai_client()
+        response = await acreate_completion(
+            client,
+            model=secrets.AZURE_OPENAI_DEPLOYMENT,
+            messages=messages,
+            max_tokens=256,
+            temperature=0.7
+        )
+        ai_message = response.choices[0].message.content
+        conversation.append({"role": "user", "content": user_message}, {"role": "assistant", "content": ai_message})
+
+        response_data = {"response": ai_message, "session_key": conversation.id, "context_tokens_saved": tokens_saved}
+        if patient_payload:
+            response_data["existing_patient"] = patient_payload
+        print("=== ASYNC CONSULTATION CHAT API TASK COMPLETED ===")
+        return JSONResponse(response_data)
+    except UpstreamUnavailable as e:
+        return _upstream_unavailable(e)
+    except Exception as e:
+        print(f"Consultation chat exception: {e}")
+        print("=== ASYNC CONSULTATION CHAT API TASK FAILED ===")
+        return JSONResponse({'error': f'Error from OpenAI: {str(e)}'}, status_code=500)
+
+
+async def consultation_chat_stream(request):
+    """Async version of /consultation_chat_stream (same Server-Sent Events protocol)."""
+    return await _consultation_stream_response(await _json_body(request), speak=False)
+
+
+async def consultation_voice_stream(request):
+    """Async version of /consultation_voice_stream: reply deltas plus sentence-level audio segments."""
+    return await _consultation_stream_response(await _json_body(request), speak=True)
+
+
+async def _transcribe_audio(secrets, filename, body, content_type, hedge=False):
+    """Async version of app.transcribe_audio: returns (raw STT result, served from cache)."""
+    key = None
+    if stt_cache is not None:
+        # Hashing a spooled upload and cache file I/O run in the threadpool
+        key = stt_cache_key(secrets, await run_in_threadpool(content_digest, body))
+        cached = await run_in_threadpool(stt_cache.get, key)
+        if cached is not None:
+            return json.loads(cached), True
+
+    stt_request = build_stt_request(secrets, filename, body, content_type)
+    resp = await apost('stt', get_async_http_client('stt'), hedge=hedge, **stt_request)
+    result = resp.json()
+    if key is not None and cacheable_stt_result(result):
+        await run_in_threadpool(stt_cache.put, key, json.dumps(result).encode('utf-8'))
+    return result, False
+
+
+async def _transcribe_chunks(secrets, filename, chunks):
+    name = os.path.splitext(filename or 'audio')[0]
+    limit = asyncio.Semaphore(flask_app.config['STT_CHUNK_CONCURRENCY'])
+
+    async def transcribe(chunk):
+        async with limit:
+            result, _ = await _transcribe_audio(
+                secrets, f"{name}-part{chunk['index'] + 1}.wav", chunk['wav'], 'audio/wav', hedge=True
+            )
+            return parse_stt_result(result)
+
+    results = await asyncio.gather(*(transcribe(chunk) for chunk in chunks), return_exceptions=True)
+    for chunk, result in zip(chunks, results):
+        if isinstance(result, Exception):
+            print(f"Chunk {chunk['index'] + 1}/{len(chunks)} ({chunk['start_s']}-{chunk['end_s']}s) failed: {result}")
+    return stitched_transcription(chunks, results)
+
+
+async def _transcribe_upload(secrets, filename, stream, size, content_type):
+    """Preprocess and transcribe an uploaded file (chunked for long audio); returns the /speech-to-text body."""
+    audio_body, audio_type, preprocessing = await run_in_threadpool(prepare_stt_audio, stream, size, content_type)
+
+    chunks = await run_in_threadpool(plan_stt_chunks, audio_body)
+    if chunks:
+        result = await _transcribe_chunks(secrets, filename, chunks)
+        return dict(result, preprocessing=preprocessing)
+
+    result, cached = await _transcribe_audio(
+        secrets, filename, audio_body, audio_type, hedge=isinstance(audio_body, bytes)
+    )
+    return {"transcription": parse_stt_result(result), "cached": cached, "preprocessing": preprocessing}
+
+
+async def _synthesize_speech(secrets, text, audio_format=TTS_FORMAT):
+    # Cache file I/O runs in the threadpool so disk hits don't block the event loop
+    key = tts_cache_key(secrets, text, audio_format) if tts_cache is not None else None
+    if key is not None:
+        audio = await run_in_threadpool(tts_cache.get, key)
+        if audio is not None:
+            return audio
+    client = get_async_http_client('tts')
+    resp = await apost('tts', client, hedge=True, **build_tts_request(secrets, text, audio_format))
+    if key is not None:
+        await run_in_threadpool(tts_cache.put, key, resp.content)
+    return resp.content
+
+
+async def _speech_stream_response(secrets, text, audio_format):
+    """Binary audio response streamed as the upstream produces it (see app.open_speech_stream)."""
+    media_type = TTS_FORMATS[audio_format]
+    key = tts_cache_key(secrets, text, audio_format)
+    if tts_cache is not None:
+        audio = await run_in_threadpool(tts_cache.get, key)
+        if audio is not None:
+            return Response(audio, media_type=media_type)
+
+    resp = await apost_stream('tts', get_async_http_client('tts'), **build_tts_request(secrets, text, audio_format))
+
+    async def chunks():
+        received = []
+        try:
+            async for chunk in resp.aiter_bytes():
+                if tts_cache is not None:
+                    received.append(chunk)
+                yield chunk
+        except Exception as e:
+            print(f"TTS stream interrupted: {e}")
+            return
+        finally:
+            await resp.aclose()
+        if tts_cache is not None:
+            await run_in_threadpool(tts_cache.put, key, b''.join(received))
+
+    return StreamingResponse(chunks(), media_type=media_type, headers={'X-Accel-Buffering': 'no'})
+
+
+async def _consultation_stream_response(data, speak):
+    task_name = "ASYNC CONSULTATION VOICE STREAM" if speak else "ASYNC CONSULTATION CHAT STREAM"
+    user_message = data.get("message", "")
+
+    if not user_message:
+        return JSONResponse({'error': 'Message is required.'}, status_code=400)
+
+    try:
+        conversation, conversation_history = await run_in_threadpool(_resolve_conversation, data)
+    except SessionNotFound:
+        return _session_not_found()
+
+    try:
+        secrets = get_secrets()
+        print(f"=== {task_name} TASK STARTED ===")
+        turn = await _start_consultation_turn(secrets, user_message, conversation, conversation_history)
+    except UpstreamUnavailable as e:
+        return _upstream_unavailable(e)
+    except Exception as e:
+        print(f"Consultation chat stream exception: {e}")
+        print(f"=== {task_name} TASK FAILED ===")
+        return JSONResponse({'error': f'Error from OpenAI: {str(e)}'}, status_code=500)
+
+    async def generate():
+        try:
+            async for event, payload in _consultation_turn_events(secrets, conversation, user_message, turn, speak):
+                yield sse_event(payload, event=event)
+        except Exception as e:
+            print(f"Consultation chat stream exception: {e}")
+            print(f"=== {task_name} TASK FAILED ===")
+            yield sse_event({"error": f'Error from OpenAI: {str(e)}'}, event='error')
+            return
+        print(f"=== {task_name} TASK COMPLETED ===")
+
+    return StreamingResponse(generate(), media_type='text/event-stream', headers=SSE_HEADERS)
+
+
+async def _start_consultation_turn(secrets, user_message, conversation, conversation_history):
+    """Prepare the prompt and open the streamed completion: returns (stream, patient payload, tokens saved)."""
+    messages, patient_payload, tokens_saved = await run_in_threadpool(
+        _prepare_consultation_turn, user_message, conversation, conversation_history)
+    client = get_async_openai_client()
+    stream = await acreate_completion(
+        client,
+        model=secrets.AZURE_OPENAI_DEPLOYMENT,
+        messages=messages,
+        max_tokens=256,
+        temperature=0.7,
+        stream=True
+    )
+    return stream, patient_payload, tokens_saved
+
+
+async def _consultation_turn_events(secrets, conversation, user_message, turn, speak, raw_audio=False):
+    """Yield (event, payload) for a started turn: patient, delta and audio events, then done.
+
+    The exchange is appended to the session only once the reply is complete.
+    """
+    stream, patient_payload, tokens_saved = turn
+    if patient_payload:
+        yield 'patient', patient_payload
+
+    speech = AsyncSpeechPipeline(lambda text: _synthesize_speech(secrets, text), raw_audio) if speak else None
+    parts = []
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield 'delta', {"delta": delta}
+                if speech:
+                    speech.feed(delta)
+                    async for segment in speech.ready():
+                        yield 'audio', segment
+        if speech:
+            speech.finish()
+            async for segment in speech.drain():
+                yield 'audio', segment
+    finally:
+        if speech:
+            speech.close()
+        await stream.close()  # Releases the upstream connection if the turn was abandoned
+
+    ai_message = "".join(parts)
+    conversation.append({"role": "user", "content": user_message}, {"role": "assistant", "content": ai_message})
+    response_data = {"response": ai_message, "session_key": conversation.id, "context_tokens_saved": tokens_saved}
+    if patient_payload:
+        response_data["existing_patient"] = patient_payload
+    if speech:
+        response_data["audio_segments"] = speech.count
+    yield 'done', response_data
+
+
+async def generate_report(request):
+    """Async version of /generate_report (same 'mode' and 'stream' options)."""
+    data = await _json_body(request)
+    mode = data.get("mode", "single")
+    stream = bool(data.get("stream", False))
+
+    try:
+        _, conversation_history = await run_in_threadpool(_resolve_conversation, data, False)
+    except SessionNotFound:
+        return _session_not_found()
+
+    if not conversation_history:
+        return JSONResponse({'error': 'Conversation history is required.'}, status_code=400)
+    if mode not in REPORT_MODES:
+        return JSONResponse({'error': f"Unknown report mode '{mode}'."}, status_code=400)
+
+    try:
+        secrets = get_secrets()
+    except Exception as e:
+        return JSONResponse({'error': f'Error loading secrets: {str(e)}'}, status_code=500)
+    deployment = secrets.AZURE_OPENAI_DEPLOYMENT
+
+    if stream:
+        async def generate():
+            parts = []
+            try:
+                client = get_async_openai_client()
+                if mode == "sections":
+                    deltas = astream_report_sections(client, deployment, conversation_history)
+                else:
+                    deltas = astream_report_text(client, deployment, conversation_history)
+                async for delta in deltas:
+                    parts.append(delta)
+                    yield sse_event({"delta": delta}, event='delta')
+            except Exception as e:
+                print(f"Report generation exception: {e}")
+                yield sse_event({"error": f'Error generating report: {str(e)}'}, event='error')
+                return
+            yield sse_event({"report": "".join(parts)}, event='done')
+
+        return StreamingResponse(generate(), media_type='text/event-stream', headers=SSE_HEADERS)
+
+    try:
+        print("=== ASYNC REPORT GENERATION API TASK STARTED ===")
+        client = get_async_openai_client()
+        if mode == "sections":
+            report = await agenerate_report_sections(client, deployment, conversation_history)
+        else:
+            report = await agenerate_report_text(client, deployment, conversation_history)
+        print(f"Generated report length: {len(report)} characters")
+        print("=== ASYNC REPORT GENERATION API TASK COMPLETED ===")
+        return JSONResponse({"report": report})
+    except UpstreamUnavailable as e:
+        return _upstream_unavailable(e)
+    except Exception as e:
+        print(f"Report generation exception: {e}")
+        print("=== ASYNC REPORT GENERATION API TASK FAILED ===")
+        return JSONResponse({'error': f'Error generating report: {str(e)}'}, status_code=500)
+
+
+async def speech_to_text(request):
+    """Async version of /speech-to-text."""
+    try:
+        print("=== ASYNC SPEECH-TO-TEXT TASK STARTED ===")
+        max_bytes = flask_app.config['MAX_CONTENT_LENGTH']
+        if int(request.headers.get('content-length') or 0) > max_bytes:
+            return _upload_too_large()
+        # Starlette spools uploaded files above 1 MB to disk while parsing
+        form = await request.form()
+        file = form.get('file')
+        if file is None or isinstance(file, str):
+            return JSONResponse({'error': 'No audio file provided'}, status_code=400)
+        if file.filename == '':
+            return JSONResponse({'error': 'No file selected'}, status_code=400)
+
+        audio_size = upload_size(file.file)
+        if audio_size > max_bytes:
+            # Chunked uploads carry no Content-Length
+            return _upload_too_large()
+        record_upload(file.file, audio_size)
+        print(f"Audio file size: {audio_size} bytes")
+
+        result = await _transcribe_upload(get_secrets(), file.filename, file.file, audio_size, file.content_type)
+        print("=== ASYNC SPEECH-TO-TEXT TASK COMPLETED ===")
+        return JSONResponse(result)
+    except UpstreamUnavailable as e:
+        return _upstream_unavailable(e)
+    except httpx.HTTPStatusError as e:
+        print(f"HTTP error in speech-to-text: {e}")
+        return JSONResponse({'error': f'Speech-to-text HTTP error: {e.response.status_code}'}, status_code=500)
+    except Exception as e:
+        print(f"Exception in speech-to-text: {e}")
+        print("=== ASYNC SPEECH-TO-TEXT TASK FAILED ===")
+        return JSONResponse({'error': f'Speech-to-text error: {str(e)}'}, status_code=500)
+
+
+async def text_to_speech(request):
+    """Async version of /text-to-speech."""
+    try:
+        print("=== ASYNC TEXT-TO-SPEECH TASK STARTED ===")
+        data = await _json_body(request)
+        text = data.get('text', '')
+        requested_format = data.get('format')
+
+        if not text:
+            return JSONResponse({'error': 'No text provided'}, status_code=400)
+        if requested_format is not None and requested_format not in TTS_FORMATS:
+            return JSONResponse({'error': f"Unsupported format, expected one of: {', '.join(TTS_FORMATS)}"}, status_code=400)
+
+        stream_format = negotiate_tts_response(request.headers.get('accept'), requested_format)
+        audio_format = stream_format or requested_format or TTS_FORMAT
+        secrets = get_secrets()
+        if stream_format:
+            response = await _speech_stream_response(secrets, text, stream_format)
+            print("=== ASYNC TEXT-TO-SPEECH TASK COMPLETED ===")
+            return response
+
+        audio = await _synthesize_speech(secrets, text, audio_format)
+
+        audio_base64 = base64.b64encode(audio).decode('utf-8')
+        print("=== ASYNC TEXT-TO-SPEECH TASK COMPLETED ===")
+        return JSONResponse({"audio": audio_base64, "content_type": TTS_FORMATS[audio_format]})
+    except UpstreamUnavailable as e:
+        return _upstream_unavailable(e)
+    except httpx.HTTPStatusError as e:
+        print(f"HTTP error in text-to-speech: {e}")
+        return JSONResponse({'error': f'Text-to-speech HTTP error: {e.response.status_code}'}, status_code=500)
+    except Exception as e:
+        print(f"Exception in text-to-speech: {e}")
+        print("=== ASYNC TEXT-TO-SPEECH TASK FAILED ===")
+        return JSONResponse({'error': f'Text-to-speech error: {str(e)}'}, status_code=500)
+
+
+async def consultation_session(websocket):
+    """Full-duplex consultation over one WebSocket.
+
+    The history stays server-side for the life of the socket, so each turn
+    carries only the new utterance. Client messages are JSON text frames:
+
+        {"type": "text", "message": "...", "speak": true}
+        {"type": "audio_start", "filename": "turn.webm", "content_type": "audio/webm", "speak": true}
+            ...binary frames with the recording...
+        {"type": "audio_end"}
+        {"type": "cancel"}   (barge-in: stop the reply in progress)
+
+    The first turn may also carry 'session_key' (resume) or 'history' (seed).
+    The server answers with JSON messages tagged with the turn number:
+    session, transcript, patient, delta, audio, done and error (with the HTTP
+    status the REST endpoints would use). An audio message without an
+    'error' is followed by one binary frame holding the sentence's audio.
+    Starting a new turn cancels the previous one.
+    """
+    await websocket.accept()
+    print("=== CONSULTATION SOCKET OPENED ===")
+    send_lock = asyncio.Lock()
+    max_bytes = flask_app.config['MAX_CONTENT_LENGTH']
+    state = {"conversation": None, "task": None, "turn": 0, "upload": None}
+
+    async def send(payload, audio=None):
+        async def transmit():
+            async with send_lock:
+                await websocket.send_json(payload)
+                if audio is not None:
+                    await websocket.send_bytes(audio)
+        # A cancelled turn must not leave an audio message without its binary frame
+        await asyncio.shield(transmit())
+
+    async def run_turn(turn, data, user_message=None, upload=None):
+        try:
+            secrets = get_secrets()
+            if state["conversation"] is None:
+                state["conversation"], _ = await run_in_threadpool(_resolve_conversation, data)
+                await send({"type": "session", "session_key": state["conversation"].id})
+            if upload is not None:
+                file, size = upload
+                record_upload(file, size)
+                result = await _transcribe_upload(secrets, data.get('filename') or 'audio.webm', file, size,
+                                                  data.get('content_type') or 'audio/webm')
+                user_message = result.get("transcription") or ""
+                await send(dict(result, type="transcript", turn=turn, text=user_message))
+                if not user_message.strip():
+                    await send({"type": "error", "turn": turn, "status": 400, "error": "No speech was detected."})
+                    return
+            conversation, conversation_history = await run_in_threadpool(
+                _resolve_conversation, {"session_key": state["conversation"].id})
+            started = await _start_consultation_turn(secrets, user_message, conversation, conversation_history)
+            async for event, payload in _consultation_turn_events(
+                    secrets, conversation, user_message, started, data.get('speak', True), raw_audio=True):
+                if event == 'audio' and 'audio' in payload:
+                    audio = payload.pop('audio')
+                    await send(dict(payload, type=event, turn=turn, content_type=TTS_FORMATS[TTS_FORMAT],
+                                    bytes=len(audio)), audio)
+                else:
+                    await send(dict(payload, type=event, turn=turn))
+            return
+        except SessionNotFound:
+            error = {"error": "Unknown or expired session.", "status": 404}
+        except UpstreamUnavailable as e:
+            print(f"Upstream unavailable: {e}")
+            error = {"error": f'The {e.upstream} service is temporarily unavailable. Please try again shortly.',
+                     "status": 503, "retry_after": int(math.ceil(e.retry_after))}
+        except Exception as e:
+            print(f"Consultation socket exception: {e}")
+            error = {"error": f'Consultation error: {str(e)}', "status": 500}
+        finally:
+            if upload is not None:
+                upload[0].close()
+        with contextlib.suppress(Exception):  # The socket may already be gone
+            await send(dict(error, type="error", turn=turn))
+
+    async def cancel_turn():
+        task = state["task"]
+        if task is not None and not task.done():
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+
+    async def start_turn(data, **kw):
+        await cancel_turn()
+        state["turn"] += 1
+        state["task"] = asyncio.create_task(run_turn(state["turn"], data, **kw))
+
+    def discard_upload():
+        if state["upload"] is not None:
+            state["upload"][1].close()
+            state["upload"] = None
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is not None:
+                upload = state["upload"]
+                if upload is None:
+                    continue
+                upload[1].write(message["bytes"])
+                if upload[1].tell() > max_bytes:
+                    discard_upload()
+                    record_rejected_upload()
+                    await send({"type": "error", "status": 413,
+                                "error": f'Upload too large (limit {max_bytes / (1024 * 1024):g} MB)'})
+                continue
+
+            try:
+                data = json.loads(message.get("text") or "")
+            except json.JSONDecodeError:
+                data = None
+            if not isinstance(data, dict):
+                await send({"type": "error", "status": 400, "error": "Messages must be JSON objects."})
+                continue
+
+            kind = data.get("type")
+            if kind == "text":
+                if not data.get("message"):
+                    await send({"type": "error", "status": 400, "error": "Message is required."})
+                    continue
+                await start_turn(data, user_message=data["message"])
+            elif kind == "audio_start":
+                discard_upload()
+                spool = SpooledTemporaryFile(max_size=flask_app.config['UPLOAD_SPOOL_BYTES'], mode="rb+")
+                state["upload"] = (data, spool)
+            elif kind == "audio_end":
+                if state["upload"] is None:
+                    await send({"type": "error", "status": 400, "error": "No audio in progress."})
+                    continue
+                start, spool = state["upload"]
+                state["upload"] = None
+                size = spool.tell()
+                spool.seek(0)
+                await start_turn(dict(data, **start), upload=(spool, size))
+            elif kind == "cancel":
+                discard_upload()
+                await cancel_turn()
+            elif kind == "ping":
+                await send({"type": "pong"})
+            else:
+                await send({"type": "error", "status": 400, "error": f"Unknown message type: {kind}"})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        discard_upload()
+        await cancel_turn()
+        print("=== CONSULTATION SOCKET CLOSED ===")
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    await aclose_async_clients()
+
+
+routes = [
+    Route('/chat', chat, methods=['POST']),
+    Route('/consultation_chat', consultation_chat, methods=['POST']),
+    Route('/consultation_chat_stream', consultation_chat_stream, methods=['POST']),
+    Route('/consultation_voice_stream', consultation_voice_stream, methods=['POST']),
+    Route('/generate_report', generate_report, methods=['POST']),
+    Route('/speech-to-text', speech_to_text, methods=['POST']),
+    Route('/text-to-speech', text_to_speech, methods=['POST']),
+    WebSocketRoute('/ws/consultation', consultation_session),
+    # Everything else is served by the sync Flask app
+    Mount('/', app=WSGIMiddleware(flask_app)),
+]
+
+app = Starlette(routes=routes, lifespan=lifespan)
@@ -0,0 +1,330 @@
+"""Optional audio preprocessing before speech-to-text.
+
+WAV uploads are decoded, downmixed to mono, resampled to 16 kHz and trimmed
+of leading/trailing silence with a frame-energy voice activity detector,
+then re-encoded as 16-bit PCM WAV. Azure transcribes 16 kHz mono natively,
+so this only removes bytes the upstream would have discarded (or spent
+time on). Requires NumPy; without it, and for anything that is not a PCM
+or float WAV (e.g. browser webm recordings), audio is passed through as is.
+
+Long recordings can also be split at quiet points into bounded chunks for
+parallel transcription (split_for_transcription, or split_wav_file for an
+upload spooled to disk, which is read in slices rather than all at once).
+"""
+import io
+import os
+import struct
+import threading
+import time
+import wave
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TARGET_RATE = 16000
+FRAME_SECONDS = 0.03       # VAD analysis frame
+PAD_SECONDS = 0.2          # Audio kept on either side of detected speech
+SILENCE_FLOOR_DBFS = -50.0 # Frames quieter than this are always silence
+NOISE_MARGIN_DB = 12.0     # Speech must be this far above the noise floor...
+PEAK_MARGIN_DB = 25.0      # ...but anything within this of the peak counts as speech
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+SLICE_SECONDS = 10.0       # Audio read at a time when splitting a file
+
+_stats_lock = threading.Lock()
+_stats = {"requests": 0, "processed": 0, "skipped": 0, "bytes_in": 0, "bytes_out": 0, "seconds": 0.0}
+
+
+class UnsupportedAudio(ValueError):
+    """Raised for input the preprocessor cannot decode."""
+
+
+def available():
+    return np is not None
+
+
+def is_wav(header):
+    """True if the first 12 bytes look like a RIFF/WAVE file."""
+    return len(header) >= 12 and header[:4] == b"RIFF" and header[8:12] == b"WAVE"
+
+
+def wav_layout(file):
+    """Walk the RIFF chunks of a seekable WAV file.
+
+    Returns ((tag, channels, rate, block_align, bits), data offset, data
+    size), the size clipped to what the file holds.
+    """
+    file.seek(0)
+    if not is_wav(file.read(12)):
+        raise UnsupportedAudio("not a WAV file")
+    length = file.seek(0, os.SEEK_END)
+    fmt = None
+    pos = 12
+    while pos + 8 <= length:
+        file.seek(pos)
+        header = file.read(8)
+        chunk_id, size = header[:4], struct.unpack_from("<I", header, 4)[0]
+        body = pos + 8
+        if chunk_id == b"fmt ":
+            if size < 16 or body + 16 > length:
+                raise UnsupportedAudio("truncated fmt chunk")
+            raw = file.read(min(size, 26, length - body))
+            tag, channels, rate, _, block_align, bits = struct.unpack_from("<HHIIHH", raw)
+            if tag == WAVE_FORMAT_EXTENSIBLE and len(raw) >= 26:
+                tag = struct.unpack_from("<H", raw, 24)[0]  # Sub-format GUID starts with the tag
+            fmt = (tag, channels, rate, block_align, bits)
+        elif chunk_id == b"data":
+            if fmt is None:
+                break
+            # Streaming writers may leave the size unset; take what is there
+            tag, channels, rate, block_align, bits = fmt
+            if channels < 1 or rate < 1 or block_align < 1 or block_align != channels * (bits // 8):
+                raise UnsupportedAudio("inconsistent fmt chunk")
+            return fmt, body, min(size, length - body)
+        pos = body + size + (size & 1)
+    raise UnsupportedAudio("missing fmt or data chunk")
+
+
+def decode_samples(samples, fmt):
+    """Decode raw sample bytes in the given fmt into a float32 array of shape (frames, channels)."""
+    tag, channels, rate, block_align, bits = fmt
+    samples = samples[:len(samples) - len(samples) % block_align]
+    if tag == WAVE_FORMAT_PCM and bits == 8:
+        x = (np.frombuffer(samples, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif tag == WAVE_FORMAT_PCM and bits == 16:
+        x = np.frombuffer(samples, dtype="<i2").astype(np.float32) / 32768.0
+    elif tag == WAVE_FORMAT_PCM and bits == 24:
+        b = np.frombuffer(samples, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        x = ((b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)) << 8 >> 8).astype(np.float32) / 8388608.0
+    elif tag == WAVE_FORMAT_PCM and bits == 32:
+        x = np.frombuffer(samples, dtype="<i4").astype(np.float32) / 2147483648.0
+    elif tag == WAVE_FORMAT_IEEE_FLOAT and bits == 32:
+        x = np.frombuffer(samples, dtype="<f4").astype(np.float32)
+    elif tag == WAVE_FORMAT_IEEE_FLOAT and bits == 64:
+        x = np.frombuffer(samples, dtype="<f8").astype(np.float32)
+    else:
+        raise UnsupportedAudio(f"unsupported encoding (format {tag:#x}, {bits} bits)")
+    return x.reshape(-1, channels)
+
+
+def parse_wav(data):
+    """Decode WAV bytes into (float32 array of shape (frames, channels), sample rate)."""
+    if not is_wav(data):
+        raise UnsupportedAudio("not a WAV file")
+    fmt, offset, size = wav_layout(io.BytesIO(data))
+    return decode_samples(data[offset:offset + size], fmt), fmt[2]
+
+
+def downmix(x):
+    """(frames, channels) -> mono."""
+    return x[:, 0] if x.shape[1] == 1 else x.mean(axis=1)
+
+
+def resample(x, rate, target=TARGET_RATE):
+    """Linear-interpolation resampling, with a moving-average low-pass when downsampling."""
+    if rate == target or len(x) == 0:
+        return x
+    if rate > target:
+        width = int(round(rate / target))
+        if width > 1:
+            x = np.convolve(x, np.full(width, 1.0 / width, dtype=np.float32), mode="same")
+    count = int(round(len(x) * target / rate))
+    positions = np.arange(count, dtype=np.float64) * (rate / target)
+    return np.interp(positions, np.arange(len(x)), x).astype(np.float32)
+
+
+def frame_levels(x, rate):
+    """(frame length in samples, dBFS level of each whole frame, speech threshold in dBFS)."""
+    frame = max(1, int(rate * FRAME_SECONDS))
+    count = len(x) // frame
+    if count == 0:
+        return frame, np.zeros(0, dtype=np.float32), SILENCE_FLOOR_DBFS
+    levels = frame_energy(x[:count * frame], frame)
+    return frame, levels, speech_threshold(levels)
+
+
+def frame_energy(x, frame):
+    """dBFS level of each frame of x (whose length is a multiple of frame)."""
+    frames = x.reshape(-1, frame)
+    return 10.0 * np.log10(np.mean(frames * frames, axis=1) + 1e-12)
+
+
+def speech_threshold(levels):
+    """Level above which a frame counts as speech, from the noise floor and the peak."""
+    return max(SILENCE_FLOOR_DBFS, min(np.percentile(levels, 10) + NOISE_MARGIN_DB, levels.max() - PEAK_MARGIN_DB))
+
+
+def speech_bounds(x, rate):
+    """(start, end) sample indices of the detected speech, or None if every frame is silence."""
+    frame, levels, threshold = frame_levels(x, rate)
+    count = len(levels)
+    if count == 0:
+        return 0, len(x)
+    active = np.flatnonzero(levels > threshold)
+    if active.size == 0:
+        return None
+    pad = int(round(PAD_SECONDS / FRAME_SECONDS))
+    start = max(0, active[0] - pad) * frame
+    last = active[-1] + 1 + pad
+    end = len(x) if last >= count else last * frame
+    return start, end
+
+
+def plan_chunks(x, rate, max_seconds, overlap_seconds):
+    """Split points for transcribing x in pieces of at most max_seconds.
+
+    Each cut is placed at the quietest frame in the last third of the
+    window. Returns a list of (start, end, overlaps_previous) sample ranges:
+    a cut that falls in silence splits cleanly, while a cut inside speech
+    (no pause long enough) extends both neighbours by overlap_seconds so no
+    word is lost, and the duplicated words are removed when stitching.
+    """
+    total = len(x)
+    max_len = int(max_seconds * rate)
+    overlap = int(overlap_seconds * rate)
+    if total <= max_len:
+        return [(0, total, False)]
+    frame, levels, threshold = frame_levels(x, rate)
+    return plan_ranges(total, frame, levels, threshold, max_len, overlap)
+
+
+def plan_ranges(total, frame, levels, threshold, max_len, overlap):
+    """plan_chunks on precomputed frame levels; lengths are in samples."""
+    cuts = []  # (sample index, cut is in speech)
+    start = 0
+    while total - start > max_len:
+        lo = (start + (2 * max_len) // 3) // frame
+        hi = max(lo + 1, (start + max_len - 2 * overlap) // frame)
+        index = lo + int(np.argmin(levels[lo:hi]))
+        cut = index * frame + frame // 2
+        cuts.append((cut, bool(levels[index] > threshold)))
+        start = cut
+    ranges = []
+    previous, previous_in_speech = 0, False
+    for cut, in_speech in cuts + [(total, False)]:
+        begin = max(0, previous - overlap) if previous_in_speech else previous
+        end = min(total, cut + overlap) if in_speech else cut
+        ranges.append((begin, end, previous_in_speech))
+        previous, previous_in_speech = cut, in_speech
+    return ranges
+
+
+def split_for_transcription(data, max_seconds=30.0, overlap_seconds=0.5):
+    """Split a WAV into 16 kHz mono WAV chunks for parallel transcription.
+
+    Returns a list of {"index", "start_s", "end_s", "overlaps_previous", "wav"}
+    dicts, or None when the audio fits in one request or cannot be decoded.
+    """
+    return split_wav_file(io.BytesIO(data), max_seconds, overlap_seconds)
+
+
+def split_wav_file(file, max_seconds=30.0, overlap_seconds=0.5):
+    """split_for_transcription for a seekable WAV file of any size.
+
+    The data chunk is read SLICE_SECONDS at a time: a first pass measures
+    frame levels to place the cuts, a second decodes one chunk at a time,
+    so memory stays bounded by the chunk length rather than the recording.
+    """
+    if np is None:
+        return None
+    try:
+        fmt, offset, size = wav_layout(file)
+    except UnsupportedAudio:
+        return None
+    tag, channels, rate, block_align, bits = fmt
+    total = size // block_align
+    if total <= max_seconds * rate:
+        return None
+    try:
+        frame = max(1, int(rate * FRAME_SECONDS))
+        per_slice = max(1, int(SLICE_SECONDS / FRAME_SECONDS)) * frame
+        levels = []
+        file.seek(offset)
+        for start in range(0, total - total % frame, per_slice):
+            count = min(per_slice, total - total % frame - start)
+            mono = downmix(decode_samples(file.read(count * block_align), fmt))
+            levels.append(frame_energy(mono[:len(mono) - len(mono) % frame], frame))
+        levels = np.concatenate(levels)
+        ranges = plan_ranges(total, frame, levels, speech_threshold(levels),
+                             int(max_seconds * rate), int(overlap_seconds * rate))
+        chunks = []
+        for index, (begin, end, overlaps_previous) in enumerate(ranges):
+            file.seek(offset + begin * block_align)
+            mono = downmix(decode_samples(file.read((end - begin) * block_align), fmt))
+            chunks.append({
+                "index": index,
+                "start_s": round(begin / rate, 2),
+                "end_s": round(end / rate, 2),
+                "overlaps_previous": overlaps_previous,
+                "wav": encode_wav(resample(mono, rate)),
+            })
+    except UnsupportedAudio:
+        return None
+    return chunks if len(chunks) >= 2 else None
+
+
+def encode_wav(x, rate=TARGET_RATE):
+    """Mono float samples -> 16-bit PCM WAV bytes."""
+    pcm = (np.clip(x, -1.0, 1.0) * 32767.0).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(rate)
+        out.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def preprocess_audio(data):
+    """Return (wav_bytes or None, info) for an uploaded audio file.
+
+    None means "send the original": NumPy is missing, the input is not a
+    decodable WAV, or preprocessing would not make it smaller. info reports
+    bytes in/out, durations and processing time either way.
+    """
+    started = time.perf_counter()
+    info = {"bytes_in": len(data), "bytes_out": len(data)}
+    output = None
+    try:
+        if np is None:
+            raise UnsupportedAudio("numpy not installed")
+        samples, rate = parse_wav(data)
+        mono = resample(downmix(samples), rate)
+        bounds = speech_bounds(mono, TARGET_RATE)
+        trimmed = mono[bounds[0]:bounds[1]] if bounds else mono
+        info.update({
+            "input_rate": rate,
+            "input_channels": samples.shape[1],
+            "duration_in_s": round(len(samples) / rate, 3),
+            "duration_out_s": round(len(trimmed) / TARGET_RATE, 3),
+        })
+        encoded = encode_wav(trimmed)
+        if len(encoded) < len(data):
+            output = encoded
+            info["bytes_out"] = len(encoded)
+        else:
+            info["skipped"] = "already minimal"
+    except UnsupportedAudio as e:
+        info["skipped"] = str(e)
+    info["processing_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    with _stats_lock:
+        _stats["requests"] += 1
+        _stats["processed" if output is not None else "skipped"] += 1
+        _stats["bytes_in"] += info["bytes_in"]
+        _stats["bytes_out"] += info["bytes_out"]
+        _stats["seconds"] += info["processing_ms"] / 1000
+    return output, info
+
+
+def preprocessing_stats():
+    with _stats_lock:
+        data = dict(_stats)
+    data["seconds"] = round(data["seconds"], 3)
+    data["available"] = available()
+    return data
@@ -0,0 +1,210 @@
+"""Content-addressed byte cache: in-process hot tier over a size-bounded disk tier.
+
+Entries are keyed by a hash of whatever determines their content (see
+cache_key) and are immutable, so a hit can be served without revalidation.
+Both tiers evict least recently used entries once over their byte budget;
+with a TTL, entries older than that are also treated as misses and removed.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+
+def cache_key(*parts):
+    """Stable SHA-256 key for the given JSON-serializable parts."""
+    encoded = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def content_digest(body, chunk_size=64 * 1024):
+    """SHA-256 hex digest of bytes or of a seekable file object (read in chunks, then rewound)."""
+    if isinstance(body, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(body).hexdigest()
+    digest = hashlib.sha256()
+    body.seek(0)
+    for chunk in iter(lambda: body.read(chunk_size), b""):
+        digest.update(chunk)
+    body.seek(0)
+    return digest.hexdigest()
+
+
+class ContentCache:
+    """Thread-safe two-tier (memory + disk) LRU cache of bytes values.
+
+    max_bytes bounds the disk tier, hot_max_bytes the in-process tier and
+    ttl_seconds (None for no expiry) the age of an entry since it was stored.
+    The disk index is rebuilt from file access times at startup, so the cache
+    survives restarts and can be shared by workers on the same host
+    (each worker enforces the cap for the entries it knows about).
+    """
+
+    def __init__(self, directory, max_bytes=200 * 1024 * 1024, hot_max_bytes=16 * 1024 * 1024, ttl_seconds=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hot_max_bytes = hot_max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._hot = OrderedDict()   # key -> (bytes, stored at)
+        self._hot_bytes = 0
+        self._disk = OrderedDict()  # key -> (size, stored at), least recently used first
+        self._disk_bytes = 0
+        self.stats = {"hot_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _load_index(self):
+        """Index existing entries, oldest access first."""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.startswith("."):
+                    continue  # Incomplete write
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_atime, name, stat.st_size, stat.st_mtime))
+        for _, key, size, stored_at in sorted(entries):
+            self._disk[key] = (size, stored_at)
+            self._disk_bytes += size
+        with self._lock:
+            self._evict_disk_locked()
+
+    def _expired(self, stored_at):
+        return self.ttl_seconds is not None and time.time() - stored_at > self.ttl_seconds
+
+    def get(self, key):
+        """Cached bytes for key, or None."""
+        with self._lock:
+            entry = self._hot.get(key)
+            if entry is not None:
+                if not self._expired(entry[1]):
+                    self._hot.move_to_end(key)
+                    self.stats["hot_hits"] += 1
+                    return entry[0]
+                self._forget_hot_locked(key)
+            disk_entry = self._disk.get(key)
+            if disk_entry is not None and self._expired(disk_entry[1]):
+                self._forget_hot_locked(key)
+                self._forget_disk_locked(key)
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                expired = True
+            else:
+                expired = False
+                if disk_entry is not None:
+                    self._disk.move_to_end(key)
+        if expired:
+            self._remove_file(key)
+            return None
+        if disk_entry is not None:
+            try:
+                with open(self._path(key), "rb") as f:
+                    value = f.read()
+            except OSError:
+                value = None
+            if value is not None:
+                try:
+                    # Record recency for the next restart; mtime keeps the store time for the TTL
+                    os.utime(self._path(key), (time.time(), disk_entry[1]))
+                except OSError:
+                    pass
+                with self._lock:
+                    self.stats["disk_hits"] += 1
+                    self._store_hot_locked(key, value, disk_entry[1])
+                return value
+            with self._lock:
+                self._forget_disk_locked(key)
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, key, value):
+        """Store bytes under key in both tiers."""
+        if len(value) > self.max_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(value)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Cache write failed for {key}: {e}")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            return
+        stored_at = time.time()
+        with self._lock:
+            self._forget_disk_locked(key)
+            self._disk[key] = (len(value), stored_at)
+            self._disk_bytes += len(value)
+            self.stats["stores"] += 1
+            self._evict_disk_locked()
+            self._store_hot_locked(key, value, stored_at)
+
+    def get_or_create(self, key, create):
+        """Return the cached value for key, calling create() and storing its result on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = create()
+            self.put(key, value)
+        return value
+
+    def _store_hot_locked(self, key, value, stored_at):
+        if len(value) > self.hot_max_bytes:
+            return
+        self._forget_hot_locked(key)
+        self._hot[key] = (value, stored_at)
+        self._hot_bytes += len(value)
+        while self._hot_bytes > self.hot_max_bytes:
+            _, (evicted, _) = self._hot.popitem(last=False)
+            self._hot_bytes -= len(evicted)
+
+    def _forget_hot_locked(self, key):
+        previous = self._hot.pop(key, None)
+        if previous is not None:
+            self._hot_bytes -= len(previous[0])
+
+    def _forget_disk_locked(self, key):
+        entry = self._disk.pop(key, None)
+        if entry is not None:
+            self._disk_bytes -= entry[0]
+
+    def _remove_file(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict_disk_locked(self):
+        while self._disk_bytes > self.max_bytes and self._disk:
+            key, (size, _) = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self.stats["evictions"] += 1
+            self._remove_file(key)
+
+    def snapshot(self):
+        """Counters plus current tier sizes, for /metrics."""
+        with self._lock:
+            data = dict(self.stats)
+            lookups = data["hot_hits"] + data["disk_hits"] + data["misses"]
+            data.update({
+                "hit_rate": round((data["hot_hits"] + data["disk_hits"]) / lookups, 4) if lookups else None,
+                "entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "hot_entries": len(self._hot),
+                "hot_bytes": self._hot_bytes,
+            })
+        return data
@@ -0,0 +1,269 @@
+"""Long-lived Azure OpenAI and httpx clients shared across requests.
+
+Clients are built once per worker process and reused so each request can
+ride on an already-open TCP/TLS connection. They are rebuilt only when the
+cached secrets are reloaded (see secret_loader.get_reload_count): new
+clients are swapped in at once, and the old ones are closed on a timer
+CLIENT_CLOSE_GRACE seconds later. In-flight calls are not tracked: one
+still using an old client when the timer fires (e.g. a very long stream)
+fails with "client has been closed".
+
+The async variants (AsyncAzureOpenAI, httpx.AsyncClient) serve the ASGI app
+and are bound to the event loop that first used them.
+"""
+import asyncio
+import os
+import threading
+import httpx
+import openai
+from secret_loader import get_secrets, get_reload_count
+
+AZURE_OPENAI_API_VERSION = "2023-05-15"
+
+# Connection pool configuration (overridable via environment variables)
+POOL_MAX_CONNECTIONS = int(os.environ.get("MEDAI_HTTP_MAX_CONNECTIONS", "100"))
+POOL_MAX_KEEPALIVE = int(os.environ.get("MEDAI_HTTP_MAX_KEEPALIVE", "20"))
+POOL_KEEPALIVE_EXPIRY = float(os.environ.get("MEDAI_HTTP_KEEPALIVE_EXPIRY", "60.0"))
+HTTP2_ENABLED = os.environ.get("MEDAI_HTTP2", "0").lower() in ("1", "true", "yes")
+# Seconds replaced clients stay open after a secrets reload before they are closed,
+# whether or not calls are still using them; keep it above the longest upstream call
+CLIENT_CLOSE_GRACE = float(os.environ.get("MEDAI_CLIENT_CLOSE_GRACE", "300.0"))
+
+# Per-upstream timeouts in seconds: (connect, read)
+UPSTREAM_TIMEOUTS = {
+    "llm": (float(os.environ.get("MEDAI_LLM_CONNECT_TIMEOUT", "5.0")), float(os.environ.get("MEDAI_LLM_TIMEOUT", "60.0"))),
+    "stt": (float(os.environ.get("MEDAI_STT_CONNECT_TIMEOUT", "5.0")), float(os.environ.get("MEDAI_STT_TIMEOUT", "30.0"))),
+    "tts": (float(os.environ.get("MEDAI_TTS_CONNECT_TIMEOUT", "5.0")), float(os.environ.get("MEDAI_TTS_TIMEOUT", "60.0"))),
+}
+
+_lock = threading.Lock()
+_registry = {
+    "pid": None,
+    "generation": None,
+    "openai": None,
+    "http": {},
+    "loop": None,
+    "async_openai": None,
+    "async_http": {},
+}
+
+
+def _http2_available():
+    """HTTP/2 needs the optional 'h2' package; fall back to HTTP/1.1 without it."""
+    if not HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        print("MEDAI_HTTP2 is enabled but the 'h2' package is not installed; using HTTP/1.1")
+        return False
+
+
+def _upstream_timeout(upstream):
+    """httpx.Timeout for the given upstream."""
+    connect_timeout, read_timeout = UPSTREAM_TIMEOUTS[upstream]
+    return httpx.Timeout(read_timeout, connect=connect_timeout)
+
+
+def _pool_limits():
+    return httpx.Limits(
+        max_connections=POOL_MAX_CONNECTIONS,
+        max_keepalive_connections=POOL_MAX_KEEPALIVE,
+        keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+    )
+
+
+def _build_http_client(upstream):
+    """Create a pooled httpx.Client configured for the given upstream."""
+    return httpx.Client(
+        timeout=_upstream_timeout(upstream),
+        limits=_pool_limits(),
+        http2=_http2_available(),
+    )
+
+
+def _build_async_http_client(upstream):
+    """Create a pooled httpx.AsyncClient configured for the given upstream."""
+    return httpx.AsyncClient(
+        timeout=_upstream_timeout(upstream),
+        limits=_pool_limits(),
+        http2=_http2_available(),
+    )
+
+
+def _take_clients():
+    """Remove every client from the registry. Returns (sync clients, async clients, their loop). Caller holds the lock."""
+    clients = list(_registry["http"].values())
+    if _registry["openai"] is not None:
+        clients.append(_registry["openai"])
+    async_clients = list(_registry["async_http"].values())
+    if _registry["async_openai"] is not None:
+        async_clients.append(_registry["async_openai"])
+    _registry["openai"] = None
+    _registry["http"] = {}
+    _registry["async_openai"] = None
+    _registry["async_http"] = {}
+    return clients, async_clients, _registry["loop"]
+
+
+def _close_clients(clients, async_clients, loop):
+    """Close sync clients now; async clients are scheduled on their own event loop if it is still running."""
+    for client in clients:
+        try:
+            client.close()
+        except Exception as e:
+            print(f"Error closing client: {e}")
+    if loop is not None and loop.is_running():
+        for client in async_clients:
+            if _on_loop(loop):
+                loop.create_task(_aclose(client))
+            else:
+                asyncio.run_coroutine_threadsafe(_aclose(client), loop)
+
+
+def _close_all():
+    """Close every client in the registry. Caller holds the lock."""
+    _close_clients(*_take_clients())
+
+
+def _retire_all():
+    """Replace every client: later calls build new ones, and the old ones close after CLIENT_CLOSE_GRACE. Caller holds the lock.
+
+    Closing them at once would fail the calls other threads are still making
+    with them ("client has been closed"). The timer is fixed: it does not
+    wait for those calls, so one still running when it fires fails anyway.
+    """
+    retired = _take_clients()
+    if not (retired[0] or retired[1]):
+        return
+    timer = threading.Timer(CLIENT_CLOSE_GRACE, _close_clients, args=retired)
+    timer.daemon = True
+    timer.start()
+
+
+def _on_loop(loop):
+    try:
+        return asyncio.get_running_loop() is loop
+    except RuntimeError:
+        return False
+
+
+async def _aclose(client):
+    try:
+        if isinstance(client, httpx.AsyncClient):
+            await client.aclose()
+        else:
+            await client.close()
+    except Exception as e:
+        print(f"Error closing async client: {e}")
+
+
+def _ensure_current():
+    """Drop clients built with stale secrets or inherited from a parent process. Caller holds the lock."""
+    generation = get_reload_count()
+    pid = os.getpid()
+    if _registry["pid"] != pid:
+        # Connections must not be shared across a fork; start with an empty registry
+        _registry["openai"] = None
+        _registry["http"] = {}
+        _registry["loop"] = None
+        _registry["async_openai"] = None
+        _registry["async_http"] = {}
+        _registry["pid"] = pid
+        _registry["generation"] = generation
+    elif _registry["generation"] != generation:
+        print("Secrets changed, rebuilding upstream clients")
+        _retire_all()
+        _registry["generation"] = generation
+
+
+def get_openai_client():
+    """Return the shared AzureOpenAI client for this worker."""
+    secrets = get_secrets()
+    with _lock:
+        _ensure_current()
+        if _registry["openai"] is None:
+            _registry["openai"] = openai.AzureOpenAI(
+                api_key=secrets.AZURE_OPENAI_API_KEY,
+                api_version=AZURE_OPENAI_API_VERSION,
+                azure_endpoint=secrets.AZURE_OPENAI_ENDPOINT,
+                timeout=_upstream_timeout("llm"),
+                max_retries=0,  # Retries are handled by upstream.py
+                http_client=_build_http_client("llm"),
+            )
+        return _registry["openai"]
+
+
+def get_http_client(upstream):
+    """Return the shared httpx.Client for an upstream ('stt' or 'tts')."""
+    if upstream not in UPSTREAM_TIMEOUTS:
+        raise ValueError(f"Unknown upstream: {upstream}")
+    get_secrets()
+    with _lock:
+        _ensure_current()
+        client = _registry["http"].get(upstream)
+        if client is None:
+            client = _build_http_client(upstream)
+            _registry["http"][upstream] = client
+        return client
+
+
+def _ensure_loop():
+    """Drop async clients created on a different event loop. Caller holds the lock."""
+    loop = asyncio.get_running_loop()
+    if _registry["loop"] is not loop:
+        _registry["async_openai"] = None
+        _registry["async_http"] = {}
+        _registry["loop"] = loop
+
+
+def get_async_openai_client():
+    """Return the shared AsyncAzureOpenAI client for the running event loop."""
+    secrets = get_secrets()
+    with _lock:
+        _ensure_current()
+        _ensure_loop()
+        if _registry["async_openai"] is None:
+            _registry["async_openai"] = openai.AsyncAzureOpenAI(
+                api_key=secrets.AZURE_OPENAI_API_KEY,
+                api_version=AZURE_OPENAI_API_VERSION,
+                azure_endpoint=secrets.AZURE_OPENAI_ENDPOINT,
+                timeout=_upstream_timeout("llm"),
+                max_retries=0,  # Retries are handled by upstream.py
+                http_client=_build_async_http_client("llm"),
+            )
+        return _registry["async_openai"]
+
+
+def get_async_http_client(upstream):
+    """Return the shared httpx.AsyncClient for an upstream ('stt' or 'tts') on the running event loop."""
+    if upstream not in UPSTREAM_TIMEOUTS:
+        raise ValueError(f"Unknown upstream: {upstream}")
+    get_secrets()
+    with _lock:
+        _ensure_current()
+        _ensure_loop()
+        client = _registry["async_http"].get(upstream)
+        if client is None:
+            client = _build_async_http_client(upstream)
+            _registry["async_http"][upstream] = client
+        return client
+
+
+def close_clients():
+    """Close all pooled clients (e.g. at worker shutdown)."""
+    with _lock:
+        _close_all()
+
+
+async def aclose_async_clients():
+    """Close the async clients from their event loop (ASGI shutdown)."""
+    with _lock:
+        clients = list(_registry["async_http"].values())
+        if _registry["async_openai"] is not None:
+            clients.append(_registry["async_openai"])
+        _registry["async_openai"] = None
+        _registry["async_http"] = {}
+    for client in clients:
+        await _aclose(client)
@@ -0,0 +1,201 @@
+"""Context budget for consultation prompts: recent turns verbatim, older turns summarized.
+
+Sending the whole transcript on every turn makes prompt size (and latency) grow
+linearly through the questionnaire. Once the history exceeds the token budget,
+the oldest messages are folded into a running summary stored on the
+conversation session. The summary is built without an LLM call and keeps
+every patient answer verbatim, so nothing the questionnaire has collected is
+lost; the assistant's wording is condensed to the questions it asked. In a
+long consultation the assistant's questions are left out of the prompt to
+make room, and fewer recent turns are kept verbatim; patient answers are
+never dropped, even if that means going over the budget.
+"""
+import re
+import threading
+
+# Rough token estimate (no tokenizer dependency): ~4 characters per token plus per-message overhead
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+# Share of the budget the summary may take before more turns are folded into it
+SUMMARY_SHARE = 0.5
+
+SUMMARY_HEADER = ("\n\nCONVERSATION SUMMARY (earlier turns, condensed; the patient's answers are quoted in full, "
+                  "some of the assistant's questions may be left out):")
+RECORD_HEADER = "\n\nPATIENT RECORD ON FILE (already collected, do not ask again):"
+
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?])\s+')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def estimate_tokens(text):
+    """Approximate token count of a string."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def estimate_message_tokens(message):
+    return estimate_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS
+
+
+def estimate_history_tokens(messages):
+    return sum(estimate_message_tokens(m) for m in messages)
+
+
+def summarize_message(message):
+    """Condense one message into a summary line.
+
+    Patient messages are kept verbatim (they carry the collected answers);
+    assistant messages are reduced to the questions they asked.
+    """
+    content = _WHITESPACE.sub(" ", message.get("content") or "").strip()
+    if message.get("role") != "assistant":
+        return f"- Patient: {content}"
+    questions = [s for s in _SENTENCE_SPLIT.split(content) if s.endswith("?")]
+    condensed = " ".join(questions) if questions else content[:160]
+    return f"- Assistant asked: {condensed}"
+
+
+def omitted_line(count):
+    return f"- ({count} of the assistant's earlier questions left out)"
+
+
+def is_patient_line(line):
+    return line.startswith("- Patient:")
+
+
+def line_tokens(line):
+    """Tokens a summary line adds to the rendered summary (with its newline)."""
+    return estimate_tokens(line) + 1
+
+
+def summary_floor(patient_tokens):
+    """Smallest rendered summary holding patient lines of patient_tokens: header, omission note and the answers."""
+    return estimate_tokens(SUMMARY_HEADER) + line_tokens(omitted_line(0)) + patient_tokens
+
+
+def compact_summary(lines, token_limit):
+    """The summary lines, with the oldest assistant questions left out until they fit token_limit once rendered.
+
+    Patient answers are always kept, so the result can still exceed
+    token_limit. A leading line counts the questions left out.
+    """
+    total = estimate_tokens(SUMMARY_HEADER) + sum(map(line_tokens, lines))
+    if total <= token_limit:
+        return lines
+    total += line_tokens(omitted_line(len(lines)))  # Room for the omission note
+    dropped = set()
+    for index, line in enumerate(lines):
+        if total <= token_limit:
+            break
+        if not is_patient_line(line):
+            dropped.add(index)
+            total -= line_tokens(line)
+    if not dropped:
+        return lines
+    return [omitted_line(len(dropped))] + [line for index, line in enumerate(lines) if index not in dropped]
+
+
+class ConversationSummary:
+    """Incrementally built summary of the first `folded` messages of a conversation."""
+
+    def __init__(self):
+        self.folded = 0
+        self.lines = []
+
+    def render(self, lines=None):
+        lines = self.lines if lines is None else lines
+        if not lines:
+            return ""
+        return SUMMARY_HEADER + "\n" + "\n".join(lines)
+
+
+def render_known_fields(known_fields):
+    """Prompt block listing structured fields already stored for the patient."""
+    if not known_fields:
+        return ""
+    return RECORD_HEADER + "\n" + "\n".join(f"- {label}: {value}" for label, value in known_fields)
+
+
+class ContextManager:
+    """Keeps the history part of a consultation prompt within a token budget.
+
+    The last `keep_turns` exchanges are always sent verbatim (at least one,
+    even when over budget); older messages are folded into the session's
+    summary. Folding is incremental: each message is summarized once. The
+    summary and the patient record count against the budget: the assistant's
+    questions are left out of the summary to fit, and when the patient's
+    answers alone are too long, turns are folded down to the last exchange.
+    Patient answers are never dropped, so only they can push a prompt over
+    the budget.
+    """
+
+    def __init__(self, token_budget=1500, keep_turns=4):
+        self.token_budget = token_budget
+        self.keep_turns = keep_turns
+        self.summary_budget = int(token_budget * SUMMARY_SHARE)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "summarized": 0, "tokens_saved": 0}
+
+    def fit(self, conversation, conversation_history, known_fields=None):
+        """Fit a conversation into the budget.
+
+        conversation is the ConversationSession holding the summary state (or None
+        for a stateless request). known_fields is an optional list of
+        (label, value) pairs from the patient record, included once turns are folded.
+
+        Returns (recent history, context text for the system prompt, tokens saved).
+        """
+        full_tokens = estimate_history_tokens(conversation_history)
+        summary = getattr(conversation, "summary", None) if conversation is not None else None
+        if full_tokens <= self.token_budget and not (summary and summary.folded):
+            self._count(0)
+            return conversation_history, "", 0
+
+        if summary is None:
+            summary = ConversationSummary()
+
+        # Fold the oldest messages until only the kept turns remain and the budget is met
+        lines = list(summary.lines)
+        folded = min(summary.folded, len(conversation_history))
+        target = max(len(conversation_history) - 2 * self.keep_turns, folded)
+        minimum_recent = 2
+        record = render_known_fields(known_fields)
+        record_tokens = estimate_tokens(record)
+        summary_tokens = estimate_tokens(summary.render(lines))
+        patient_tokens = sum(line_tokens(line) for line in lines if is_patient_line(line))
+        recent_tokens = estimate_history_tokens(conversation_history[folded:])
+        # The summary is compacted later: it counts for its share, or for its patient answers if they are more
+        while folded < len(conversation_history) - minimum_recent and (
+                folded < target or min(summary_tokens, max(self.summary_budget, summary_floor(patient_tokens)))
+                + recent_tokens + record_tokens > self.token_budget):
+            message = conversation_history[folded]
+            line = summarize_message(message)
+            lines.append(line)
+            summary_tokens += line_tokens(line)
+            if is_patient_line(line):
+                patient_tokens += line_tokens(line)
+            recent_tokens -= estimate_message_tokens(message)
+            folded += 1
+
+        if conversation is not None:
+            with conversation.lock:
+                current = getattr(conversation, "summary", None)
+                # Keep whichever summary covers more of the conversation (concurrent turns)
+                if current is None or current.folded < folded:
+                    summary.lines = lines
+                    summary.folded = folded
+                    conversation.summary = summary
+
+        # The stored summary keeps every line; the prompt gets what fits beside the recent turns (and every answer)
+        summary_limit = self.token_budget - recent_tokens - record_tokens
+        context = summary.render(compact_summary(lines, summary_limit)) + record
+        recent_history = conversation_history[folded:]
+        tokens_saved = max(0, full_tokens - estimate_history_tokens(recent_history) - estimate_tokens(context))
+        self._count(tokens_saved)
+        return recent_history, context, tokens_saved
+
+    def _count(self, tokens_saved):
+        with self._lock:
+            self.stats["requests"] += 1
+            if tokens_saved:
+                self.stats["summarized"] += 1
+                self.stats["tokens_saved"] += tokens_saved
@@ -0,0 +1,104 @@
+"""Database connection settings: backend URL, connection pool and SQLite pragmas.
+
+The models work on SQLite (the default, in the instance folder) and on
+PostgreSQL; DATABASE_URL picks the backend. SQLite connections are tuned
+for a server with concurrent requests:
+
+- journal_mode=WAL: readers no longer block behind a writer (or the
+  writer behind readers); only writers serialize.
+- synchronous=NORMAL: in WAL mode commits no longer fsync; the WAL is
+  synced at checkpoints. A power loss can drop the last transactions but
+  not corrupt the database.
+- mmap_size, cache_size: reads come from memory-mapped pages and a larger
+  page cache instead of read() calls.
+- busy_timeout: a writer waits this long for the lock instead of failing
+  with "database is locked".
+
+init_database() applies all of this from app.config before anything
+connects.
+"""
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+DEFAULT_URL = 'sqlite:///medical_ai.db'
+JOURNAL_MODES = ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF')
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def database_url(url=None):
+    """The SQLAlchemy URL to use: url if given, else the SQLite default.
+
+    postgres:// URLs (as some hosts export them) are rewritten to
+    postgresql://, the scheme SQLAlchemy recognizes.
+    """
+    if not url:
+        return DEFAULT_URL
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def is_sqlite_memory(url):
+    parsed = make_url(url)
+    return parsed.get_backend_name() == 'sqlite' and parsed.database in (None, '', ':memory:')
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured URL: pool settings (none for in-memory SQLite)."""
+    if is_sqlite_memory(config['SQLALCHEMY_DATABASE_URI']):
+        return {}
+    return {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+    }
+
+
+def sqlite_pragmas(config):
+    """(pragma, value) pairs run on every new SQLite connection."""
+    journal_mode = config['SQLITE_JOURNAL_MODE'].upper()
+    synchronous = config['SQLITE_SYNCHRONOUS'].upper()
+    if journal_mode not in JOURNAL_MODES:
+        raise ValueError(f"Unknown SQLite journal mode: {journal_mode}")
+    if synchronous not in SYNCHRONOUS_MODES:
+        raise ValueError(f"Unknown SQLite synchronous mode: {synchronous}")
+    return [
+        ('journal_mode', journal_mode),
+        ('synchronous', synchronous),
+        ('busy_timeout', int(config['SQLITE_BUSY_TIMEOUT_MS'])),
+        ('mmap_size', int(config['SQLITE_MMAP_BYTES'])),
+        ('cache_size', -int(config['SQLITE_CACHE_KB'])),  # Negative: size in KiB rather than pages
+    ]
+
+
+def init_database(app, db):
+    """Initialize db on the app with the configured engine options and, on SQLite, the pragmas."""
+    options = engine_options(app.config)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))  # Explicit options win
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    db.init_app(app)
+    with app.app_context():
+        engine = db.engine
+        if engine.dialect.name != 'sqlite':
+            return
+        pragmas = sqlite_pragmas(app.config)
+
+        @event.listens_for(engine, 'connect')
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in pragmas:
+                cursor.execute(f'PRAGMA {name}={value}')
+            cursor.close()
+
+
+def database_info(db):
+    """Backend and pool state for /metrics."""
+    engine = db.engine
+    info = {'backend': engine.dialect.name, 'pool': engine.pool.status()}
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as connection:
+            info['journal_mode'] = connection.exec_driver_sql('PRAGMA journal_mode').scalar()
+            info['synchronous'] = connection.exec_driver_sql('PRAGMA synchronous').scalar()
+    return info
@@ -0,0 +1,227 @@
+"""Rule-based extraction of patient record fields from a consultation transcript.
+
+Every rule is an entry in RULES: the field it fills, the keywords that must
+appear in the patient's messages for it to apply, and how the value is
+produced (regexes, a fixed value, or keyword -> phrase lists). Regexes are
+compiled once at import and only run when their rule's keywords are present
+and its field is still empty.
+
+Regexes are not run over the whole transcript either. Each one declares
+where a match can start: at a keyword ("pain ... 7" starts at "pain"), or
+at one of a set of literals (digits for "128 over 82", month names for
+dates). Keyword and literal offsets are found with str.find, which is far
+faster than a regex scan, and the regex is only tried there. The result is
+the same leftmost match a full search would return.
+
+extract_fields() is pure: it returns the field updates and leaves applying
+them (and committing) to the caller. The rules reproduce the original
+extract_patient_info() behaviour exactly, quirks included, so stored
+records do not change.
+"""
+import json
+import re
+
+MONTHS = ("april", "march", "january", "february", "may", "june", "july", "august", "september", "october",
+          "november", "december")
+_MONTHS_RE = "|".join(MONTHS)
+
+# Literal start set for regexes that begin with \d
+DIGITS = tuple("0123456789")
+
+# Patient fields the rules can fill, in rule order
+FIELDS = (
+    "date_of_birth", "address", "emergency_contact", "blood_pressure", "temperature", "heart_rate",
+    "pain_level", "chief_complaint", "past_medical_conditions", "current_medications", "allergies",
+)
+
+
+def _pattern(regex, flags=0, anchor=None):
+    """A compiled regex and where its matches can start.
+
+    anchor is None (anywhere), a keyword (no match starts before its first
+    occurrence) or a tuple of literals (every match starts with one of them).
+    """
+    return re.compile(regex, flags), anchor
+
+
+# Each rule: field, then
+#   any / all   - keywords (lowercase); the rule applies if any / all of them occur in the patient's messages
+#   overwrite   - apply even if the field already has a value
+#   patterns    - regexes tried in order on the transcript ('lower' or original 'text' case);
+#                 the first match gives the value, via template ({0} = whole match, {1}... = groups) or a fixed value
+#   value       - fixed value (after a pattern match, if there are patterns)
+#   phrases     - (keyword, phrase) pairs; the value lists the phrases whose keyword occurs
+RULES = (
+    {"field": "date_of_birth", "all": ("april 15", "1985"), "source": "lower", "value": "04/15/1985", "patterns": (
+        _pattern(r'(\d{1,2}/\d{1,2}/\d{4})', anchor=DIGITS),
+        _pattern(rf'({_MONTHS_RE})\s+(\d{{1,2}}),?\s+(\d{{4}})', anchor=MONTHS),
+        _pattern(rf'(\d{{1,2}})\s+({_MONTHS_RE})\s+(\d{{4}})', anchor=DIGITS),
+    )},
+    {"field": "address", "any": ("lane", "street", "avenue"), "source": "text", "template": "{0}", "patterns": (
+        _pattern(r'(\d+\s+[a-zA-Z\s]+(lane|street|avenue|road|dr|drive)[^,]*[,\s]*[a-zA-Z\s]*[,\s]*[a-zA-Z]{2}[,\s]*\d{5})',
+                 re.IGNORECASE, anchor=DIGITS),
+    )},
+    {"field": "emergency_contact", "any": ("john thompson", "spouse"), "source": "text", "template": "{0}", "patterns": (
+        _pattern(r'(john thompson[^.]*\(\d{3}\)\s*\d{3}-\d{4})', re.IGNORECASE, anchor="john thompson"),
+    )},
+    {"field": "emergency_contact", "all": ("john thompson", "732"), "value": "John Thompson (Spouse) – (732) 555-9123"},
+    {"field": "blood_pressure", "any": ("blood pressure",), "source": "text", "template": "{1}/{2}", "patterns": (
+        _pattern(r'(\d{2,3})[/\s]*(?:over\s*)?(\d{2,3})', anchor=DIGITS),
+    )},
+    {"field": "temperature", "any": ("temperature",), "source": "lower", "template": "{1}°F", "patterns": (
+        _pattern(r'(\d{2,3}\.?\d*)\s*(?:degrees?\s*)?(?:fahrenheit|f|°f)', anchor=DIGITS),
+    )},
+    # Historical precedence: a transcript mentioning "heart rate" re-extracts the field even when it is set
+    {"field": "heart_rate", "any": ("heart rate",), "overwrite": True, "source": "lower", "template": "{1} bpm", "patterns": (
+        _pattern(r'(\d{2,3})\s*(?:beats?\s*per\s*minute|bpm)', anchor=DIGITS),
+    )},
+    {"field": "heart_rate", "any": ("pulse",), "source": "lower", "template": "{1} bpm", "patterns": (
+        _pattern(r'(\d{2,3})\s*(?:beats?\s*per\s*minute|bpm)', anchor=DIGITS),
+    )},
+    {"field": "pain_level", "any": ("pain",), "source": "lower", "template": "{1}", "patterns": (
+        _pattern(r'pain.*?(\d+)', anchor="pain"),
+        _pattern(r'(\d+).*?pain', anchor=DIGITS),
+        _pattern(r'(\d+)/10', anchor=DIGITS),
+        _pattern(r'(\d+) out of 10', anchor=DIGITS),
+    )},
+    {"field": "chief_complaint", "any": ("stomach pain", "bloating"), "value": "Ongoing stomach pain and bloating"},
+    {"field": "past_medical_conditions", "any": ("asthma", "allergies"), "phrases": (
+        ("asthma", "mild asthma"),
+        ("seasonal allergies", "seasonal allergies"),
+    )},
+    {"field": "current_medications", "any": ("albuterol", "loratadine"), "phrases": (
+        ("albuterol", "Albuterol inhaler (as needed)"),
+        ("loratadine", "Loratadine 10mg once daily"),
+    )},
+    {"field": "allergies", "any": ("penicillin", "peanuts"), "phrases": (
+        ("penicillin", "Penicillin (rash)"),
+        ("peanuts", "peanuts (mild swelling)"),
+    )},
+)
+
+
+def transcript_text(messages):
+    """The patient's side of a conversation as one string (how the rules see it)."""
+    return " ".join([msg.get('content', '') for msg in messages if msg.get('role') == 'user'])
+
+
+def literal_offsets(source, literals):
+    """Sorted offsets of every occurrence of any of the literals in source."""
+    find = source.find
+    offsets = []
+    for literal in literals:
+        offset = find(literal)
+        while offset != -1:
+            offsets.append(offset)
+            offset = find(literal, offset + 1)
+    offsets.sort()
+    return offsets
+
+
+class Transcript:
+    """The patient's messages as the rules see them, with memoized keyword and literal offsets."""
+
+    def __init__(self, messages):
+        self.text = transcript_text(messages)
+        self.lower = self.text.lower()
+        self._keywords = {}
+        self._literals = {}
+
+    def offset(self, keyword):
+        """Offset of the keyword's first occurrence in the lowercased transcript, or -1."""
+        if keyword not in self._keywords:
+            self._keywords[keyword] = self.lower.find(keyword)
+        return self._keywords[keyword]
+
+    def contains(self, keyword):
+        return self.offset(keyword) != -1
+
+    def source(self, name):
+        return self.text if name == "text" else self.lower
+
+    def search(self, regex, anchor, source):
+        """regex.search(source), only trying offsets where the anchor says a match can start."""
+        if isinstance(anchor, tuple):
+            # \d also matches non-ASCII digits, which the literals would miss
+            if anchor is DIGITS and not source.isascii():
+                return regex.search(source)
+            # Digits sit at the same offsets in the text and its lowercase (ASCII here)
+            key = (source is self.text and anchor is not DIGITS, anchor)
+            if key not in self._literals:
+                self._literals[key] = literal_offsets(source, anchor)
+            for offset in self._literals[key]:
+                match = regex.match(source, offset)
+                if match:
+                    return match
+            return None
+        # Keyword offsets come from the lowercased text; they only carry over if lowercasing kept the length
+        if anchor and (source is self.lower or len(self.text) == len(self.lower)) and self.contains(anchor):
+            return regex.search(source, self.offset(anchor))
+        return regex.search(source)
+
+
+def _apply_rule(rule, transcript):
+    """The value a rule produces for this transcript, or None."""
+    if "phrases" in rule:
+        phrases = [phrase for keyword, phrase in rule["phrases"] if transcript.contains(keyword)]
+        return ', '.join(phrases) if phrases else None
+
+    patterns = rule.get("patterns")
+    if not patterns:
+        return rule["value"]
+    source = transcript.source(rule["source"])
+    for regex, anchor in patterns:
+        match = transcript.search(regex, anchor, source)
+        if match:
+            return rule["value"] if "value" in rule else rule["template"].format(match.group(0), *match.groups()).strip()
+    return None
+
+
+def extract_fields(messages, existing=None):
+    """Patient fields found in a conversation's user messages.
+
+    existing maps field name -> current value; fields that already have a
+    value are left alone, except where a rule says otherwise. Returns
+    {field: new value} for the fields to update.
+    """
+    existing = existing or {}
+    transcript = Transcript(messages)
+
+    updates = {}
+    for rule in RULES:
+        field = rule["field"]
+        if not rule.get("overwrite") and (updates.get(field) or existing.get(field)):
+            continue
+        if "any" in rule and not any(transcript.contains(k) for k in rule["any"]):
+            continue
+        if not all(transcript.contains(k) for k in rule.get("all", ())):
+            continue
+        value = _apply_rule(rule, transcript)
+        if value is not None:
+            updates[field] = value
+    return updates
+
+
+def extract_sessions(task):
+    """Re-extract one patient's fields from their stored consultations, oldest first.
+
+    task is (patient_id, existing fields, [conversation_history JSON, ...]).
+    Each session fills what is still empty after the ones before it, as
+    successive saves would have. Returns (patient_id, {field: new value},
+    [message count of each session]). Module-level and database-free so a
+    process pool can run it.
+    """
+    patient_id, existing, histories = task
+    current = dict(existing)
+    updates = {}
+    counts = []
+    for raw in histories:
+        try:
+            messages = json.loads(raw) if raw else []
+        except json.JSONDecodeError:
+            messages = []
+        counts.append(len(messages))
+        found = extract_fields(messages, current)
+        current.update(found)
+        updates.update(found)
+    return patient_id, updates, counts
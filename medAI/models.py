@@ -1,7 +1,12 @@
 """Database models for the medical AI consultation system."""
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, validates
 from datetime import datetime
 import json
+from names import normalize_name, contains_words
 
 db = SQLAlchemy()
 
@@ -11,6 +16,7 @@ class Patient(db.Model):
     
     # Patient Identification
     full_name = db.Column(db.String(200), nullable=False, index=True)
+    name_key = db.Column(db.String(200), nullable=True, unique=True, index=True)  # normalize_name(full_name), one patient per key
     date_of_birth = db.Column(db.String(20), nullable=True)
     address = db.Column(db.Text, nullable=True)
     emergency_contact = db.Column(db.Text, nullable=True)
@@ -54,6 +60,11 @@ class Patient(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     last_consultation = db.Column(db.DateTime, default=datetime.utcnow)
     
+    @validates('full_name')
+    def _set_name_key(self, key, value):
+        self.name_key = normalize_name(value) or None
+        return value
+    
     def __repr__(self):
         return f'<Patient {self.full_name}>'
     
@@ -115,6 +126,8 @@ class ConsultationSession(db.Model):
     conversation_history = db.Column(db.Text, nullable=True)  # JSON string of conversation
     report_generated = db.Column(db.Boolean, default=False)
     report_content = db.Column(db.Text, nullable=True)
+    session_key = db.Column(db.String(64), nullable=True, index=True)  # Server-side conversation session id
+    extraction_watermark = db.Column(db.Integer, nullable=True)  # Messages of the history already run through extraction
     
     # Relationship
     patient = db.relationship('Patient', backref=db.backref('sessions', lazy=True))
@@ -134,3 +147,287 @@ class ConsultationSession(db.Model):
     def set_conversation_history(self, history):
         """Set conversation history from a list of dictionaries."""
         self.conversation_history = json.dumps(history)
+
+
+# Columns added after the first release: (model, column name). db.create_all() only
+# creates missing tables, so existing databases get these via ALTER TABLE.
+ADDED_COLUMNS = [
+    (ConsultationSession, 'session_key'),
+    (ConsultationSession, 'extraction_watermark'),
+    (Patient, 'name_key'),
+]
+
+
+def upgrade_schema():
+    """Add columns (and their indexes) that are missing from an existing database."""
+    inspector = db.inspect(db.engine)
+    for model, column_name in ADDED_COLUMNS:
+        table = model.__table__
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        if column_name in existing:
+            continue
+        column = table.columns[column_name]
+        column_type = column.type.compile(dialect=db.engine.dialect)
+        db.session.execute(db.text(f'ALTER TABLE {table.name} ADD COLUMN {column_name} {column_type}'))
+        db.session.commit()
+        for index in table.indexes:
+            if column_name in index.columns:
+                index.create(db.engine, checkfirst=True)
+
+
+# Substring search over patient names: an FTS5 trigram index on Patient.name_key,
+# kept in sync by triggers (SQLite only; other databases fall back to LIKE)
+NAME_FTS_TABLE = 'patient_name_fts'
+NAME_FTS_TRIGGERS = {
+    'patient_name_fts_insert': f"""
+        CREATE TRIGGER IF NOT EXISTS patient_name_fts_insert AFTER INSERT ON patient BEGIN
+            INSERT INTO {NAME_FTS_TABLE}(rowid, name_key) VALUES (new.id, new.name_key);
+        END""",
+    'patient_name_fts_delete': f"""
+        CREATE TRIGGER IF NOT EXISTS patient_name_fts_delete AFTER DELETE ON patient BEGIN
+            INSERT INTO {NAME_FTS_TABLE}({NAME_FTS_TABLE}, rowid, name_key) VALUES ('delete', old.id, old.name_key);
+        END""",
+    'patient_name_fts_update': f"""
+        CREATE TRIGGER IF NOT EXISTS patient_name_fts_update AFTER UPDATE OF name_key ON patient BEGIN
+            INSERT INTO {NAME_FTS_TABLE}({NAME_FTS_TABLE}, rowid, name_key) VALUES ('delete', old.id, old.name_key);
+            INSERT INTO {NAME_FTS_TABLE}(rowid, name_key) VALUES (new.id, new.name_key);
+        END""",
+}
+_name_fts = {'enabled': False}
+
+
+def duplicate_name_key(key, patient_id):
+    """The key kept by a patient whose normalized name an older patient already has.
+
+    normalize_name() never produces '#', so these never equal a looked-up
+    key: exact and prefix lookups find the oldest patient, as they did
+    before keys were unique.
+    """
+    return f'{key}#{patient_id}'
+
+
+def backfill_name_keys(batch_size=5000):
+    """Fill Patient.name_key for rows saved before the column existed. Returns the number of rows updated.
+
+    Rows whose key is already taken (by an older row or earlier in the
+    batch) get duplicate_name_key(). Names without letters or digits keep
+    no key.
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            db.select(Patient.id, Patient.full_name)
+            .where(Patient.name_key.is_(None), Patient.id > last_id)
+            .order_by(Patient.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        keys = [(row.id, normalize_name(row.full_name) or None) for row in rows]
+        taken = set(db.session.execute(db.select(Patient.name_key).where(Patient.name_key.in_({k for _, k in keys if k}))).scalars())
+        updates = []
+        for patient_id, key in keys:
+            if key is None:
+                continue
+            if key in taken:
+                key = duplicate_name_key(key, patient_id)
+            taken.add(key)
+            updates.append({'id': patient_id, 'name_key': key})
+        if updates:
+            db.session.execute(db.update(Patient), updates)
+        db.session.commit()
+        updated += len(updates)
+        last_id = rows[-1].id
+    return updated
+
+
+def unique_name_keys():
+    """Make the name_key index unique on databases where it was created without the constraint.
+
+    Patients sharing a key keep it on the oldest; the others get
+    duplicate_name_key(). Returns the number of keys changed.
+    """
+    index = next(index for index in Patient.__table__.indexes if list(index.columns) == [Patient.__table__.c.name_key])
+    existing = {i['name']: i for i in db.inspect(db.engine).get_indexes(Patient.__tablename__)}
+    if index.name in existing and existing[index.name]['unique']:
+        return 0
+    duplicated = db.session.execute(
+        db.select(Patient.name_key).where(Patient.name_key.is_not(None)).group_by(Patient.name_key).having(db.func.count() > 1)
+    ).scalars().all()
+    changed = 0
+    for key in duplicated:
+        ids = db.session.execute(db.select(Patient.id).where(Patient.name_key == key).order_by(Patient.id)).scalars().all()
+        db.session.execute(db.update(Patient), [{'id': patient_id, 'name_key': duplicate_name_key(key, patient_id)}
+                                                for patient_id in ids[1:]])
+        changed += len(ids) - 1
+    if index.name in existing:
+        db.session.execute(db.text(f'DROP INDEX {index.name}'))
+    db.session.commit()
+    index.create(db.engine)
+    return changed
+
+
+def upsert_patient(full_name):
+    """The patient with this normalized name, inserted if there is none, within the current transaction.
+
+    On SQLite and PostgreSQL this is one INSERT ... ON CONFLICT (name_key)
+    statement, so concurrent saves of a new name end up with the same row.
+    Elsewhere the insert runs in a savepoint and a conflicting insert falls
+    back to the row that won. Nothing is committed.
+    """
+    key = normalize_name(full_name) or None
+    dialect = db.engine.dialect.name
+    if key is not None and dialect in ('sqlite', 'postgresql'):
+        insert = (sqlite if dialect == 'sqlite' else postgresql).insert(Patient).values(full_name=full_name, name_key=key)
+        # A no-op update on conflict, so RETURNING yields the existing row's id
+        statement = insert.on_conflict_do_update(
+            index_elements=[Patient.name_key], set_={'full_name': Patient.__table__.c.full_name}
+        ).returning(Patient.id)
+        patient = db.session.get(Patient, db.session.execute(statement).scalar_one())
+        _pending_name(db.session, patient.id, patient.full_name)
+        return patient
+    try:
+        with db.session.begin_nested():
+            patient = Patient(full_name=full_name)
+            db.session.add(patient)
+        return patient
+    except IntegrityError:
+        return Patient.query.filter_by(name_key=key).one()
+
+
+def setup_name_search():
+    """Create the name trigram index and its triggers if missing (SQLite with FTS5 only).
+
+    A newly created index is built from the existing rows. Returns whether
+    substring searches use it.
+    """
+    _name_fts['enabled'] = False
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    inspector = db.inspect(db.engine)
+    try:
+        if not inspector.has_table(NAME_FTS_TABLE):
+            db.session.execute(db.text(
+                f"CREATE VIRTUAL TABLE {NAME_FTS_TABLE} USING fts5("
+                f"name_key, content='patient', content_rowid='id', tokenize='trigram')"
+            ))
+            db.session.execute(db.text(f"INSERT INTO {NAME_FTS_TABLE}({NAME_FTS_TABLE}) VALUES ('rebuild')"))
+        for trigger in NAME_FTS_TRIGGERS.values():
+            db.session.execute(db.text(trigger))
+        db.session.commit()
+    except Exception as e:
+        # SQLite built without FTS5 or the trigram tokenizer (3.34+)
+        db.session.rollback()
+        print(f"Name search index unavailable, substring lookups will scan: {e}")
+        return False
+    _name_fts['enabled'] = True
+    return True
+
+
+def patients_matching_name(text, limit=None, whole_words=False):
+    """Patients whose normalized name contains the normalized text, by id.
+
+    With whole_words, the text must match whole words of the name ("ann"
+    finds "Mary Ann" but not "Joanne"). Uses the trigram index when there is
+    one and the key is long enough for trigrams (3+ characters).
+    """
+    key = normalize_name(text)
+    if not key:
+        return []
+    if _name_fts['enabled'] and len(key) >= 3:
+        rows = db.session.execute(
+            db.text(f"SELECT rowid, name_key FROM {NAME_FTS_TABLE} WHERE {NAME_FTS_TABLE} MATCH :query ORDER BY rowid"),
+            {'query': '"' + key.replace('"', '""') + '"'}
+        )
+    else:
+        rows = db.session.execute(
+            db.select(Patient.id, Patient.name_key).where(Patient.name_key.contains(key, autoescape=True)).order_by(Patient.id)
+        )
+    ids = []
+    for patient_id, name_key in rows:
+        if whole_words and not contains_words(name_key, key):
+            continue
+        ids.append(patient_id)
+        if limit is not None and len(ids) >= limit:
+            break
+    rows.close()
+    if not ids:
+        return []
+    return Patient.query.filter(Patient.id.in_(ids)).order_by(Patient.id).all()
+
+
+def find_patient_by_exact_name(name):
+    """The oldest patient with the same normalized name as name, or None (one index seek)."""
+    key = normalize_name(name)
+    if not key:
+        return None
+    return Patient.query.filter(Patient.name_key == key).order_by(Patient.id).first()
+
+
+def find_patient_by_name(name):
+    """The patient a typed name refers to, or None.
+
+    Tries, in order: the same normalized name; a name starting with it as
+    whole words ("Sarah" -> "Sarah Thompson"); a name containing it as whole
+    words ("Thompson" -> "Sarah Thompson"). The first two are index range
+    scans on name_key; the last uses the trigram index. Ties go to the
+    oldest record, except for prefixes, which take the first name in
+    alphabetical order.
+    """
+    key = normalize_name(name)
+    if not key:
+        return None
+    patient = find_patient_by_exact_name(key)
+    if patient is None:
+        # Names starting with "key " ("!" sorts right after the space), first in index order
+        patient = Patient.query.filter(Patient.name_key > key + ' ', Patient.name_key < key + '!').order_by(Patient.name_key).first()
+    if patient is None:
+        matches = patients_matching_name(key, limit=1, whole_words=True)
+        patient = matches[0] if matches else None
+    return patient
+
+
+
+_name_tracking = {'enabled': False}
+
+
+def _pending_name(session, patient_id, name):
+    """Queue a patient's name (None: deleted) for the name index, applied when the session commits."""
+    if _name_tracking['enabled']:
+        session.info.setdefault('patient_names', []).append((patient_id, name))
+
+
+def track_patient_names(index):
+    """Keep a name_index.NameIndex in step with Patient inserts, renames and deletes.
+
+    Changes are collected as they are flushed and applied when the
+    transaction commits, so names from rolled-back transactions never reach
+    the index. Bulk UPDATE/DELETE statements bypass these events.
+    """
+    _name_tracking['enabled'] = True
+
+    @event.listens_for(Patient, 'after_insert')
+    def patient_inserted(mapper, connection, target):
+        _pending_name(db.inspect(target).session, target.id, target.full_name)
+
+    @event.listens_for(Patient, 'after_update')
+    def patient_updated(mapper, connection, target):
+        if db.inspect(target).attrs.full_name.history.has_changes():
+            _pending_name(db.inspect(target).session, target.id, target.full_name)
+
+    @event.listens_for(Patient, 'after_delete')
+    def patient_deleted(mapper, connection, target):
+        _pending_name(db.inspect(target).session, target.id, None)
+
+    @event.listens_for(Session, 'after_commit')
+    def apply_name_changes(session):
+        for patient_id, name in session.info.pop('patient_names', ()):
+            if name is None:
+                index.remove(patient_id)
+            else:
+                index.add(patient_id, name)
+
+    @event.listens_for(Session, 'after_rollback')
+    def discard_name_changes(session):
+        session.info.pop('patient_names', None)
@@ -0,0 +1,235 @@
+"""In-memory fuzzy index over patient names, for names that were misheard.
+
+Names often arrive through speech recognition ("Sara Tomson" for "Sarah
+Thompson"), so an exact lookup misses. NameIndex finds the closest stored
+names in two steps:
+
+1. Candidates: each query word is matched against the vocabulary of
+   indexed words. Every word is filed under its sound skeleton (spelling
+   reduced to pronunciation: "thompson" -> "tompson", "smyth" -> "smit")
+   and that skeleton with one or two letters deleted, so words a couple of
+   edits apart meet under a shared entry (SymSpell-style): a few dict
+   lookups, no scan. The names containing a word like the rarest query
+   word are the candidates, at most max_candidates of them.
+2. Ranking: candidates are ordered by how well their words match the
+   query words, and the best few are scored by edit distance on the whole
+   normalized name and on its sound skeleton. Scores run from 0 to 1; 1 is
+   an identical normalized name.
+
+Edit distances use the bit-parallel algorithm (Myers/Hyyrö), one pass of
+integer operations per character. The index is a plain id -> name map and
+knows nothing about the database; models.py keeps it in step with
+committed Patient changes.
+"""
+import heapq
+import re
+import threading
+from itertools import islice, repeat
+
+from names import normalize_name
+
+# Spelling -> pronunciation rewrites for the sound skeleton, applied in order
+_SKELETON_RULES = [(re.compile(pattern), replacement) for pattern, replacement in (
+    (r"ph", "f"), (r"gh", "g"), (r"ck", "k"), (r"sch", "sk"), (r"\bwr", "r"), (r"\bkn", "n"),
+    (r"c(?=[eiy])", "s"), (r"c", "k"), (r"q", "k"), (r"x", "ks"), (r"z", "s"), (r"y", "i"),
+    (r"(?<=[a-z])h", ""), (r"([a-z])\1+", r"\1"),
+)]
+
+
+def sound_skeleton(key):
+    """A normalized name respelled as it sounds ("sarah thompson" -> "sara tompson")."""
+    for pattern, replacement in _SKELETON_RULES:
+        key = pattern.sub(replacement, key)
+    return key
+
+
+def deletions(word):
+    """word with each one of its letters deleted."""
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def skeleton_variants(word):
+    """A word's sound skeleton plus the skeleton with one letter deleted, or up to two beyond 6 letters.
+
+    Two words whose variants meet are within two (four for long words)
+    edits of each other once respelled as they sound ("tomson" and
+    "thompson" meet at "tomson"). Skeletons of 3 letters or fewer only match
+    exactly.
+    """
+    skeleton = sound_skeleton(word)
+    variants = {skeleton}
+    if len(skeleton) > 3:
+        variants |= deletions(skeleton)
+        if len(skeleton) > 6:
+            variants.update(*map(deletions, list(variants - {skeleton})))
+    return variants
+
+
+def edit_distance(a, b):
+    """Levenshtein distance between two strings (bit-parallel, one pass over a)."""
+    if len(a) < len(b):
+        a, b = b, a
+    m = len(b)
+    if m == 0:
+        return len(a)
+    masks = {}
+    for i, ch in enumerate(b):
+        masks[ch] = masks.get(ch, 0) | (1 << i)
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+    positive, negative, distance = full, 0, m
+    for ch in a:
+        eq = masks.get(ch, 0)
+        xv = eq | negative
+        xh = (((eq & positive) + positive) ^ positive) | eq
+        hp = negative | ~(xh | positive)
+        hn = positive & xh
+        if hp & last:
+            distance += 1
+        elif hn & last:
+            distance -= 1
+        hp = (hp << 1) | 1
+        hn <<= 1
+        positive = (hn | ~(xv | hp)) & full
+        negative = hp & xv
+    return distance
+
+
+def similarity(a, b):
+    """1 - edit distance / length of the longer string."""
+    longest = max(len(a), len(b))
+    return 1.0 - edit_distance(a, b) / longest if longest else 1.0
+
+
+class NameIndex:
+    """Thread-safe fuzzy name index: add/remove names by id, search for the closest ones."""
+
+    def __init__(self, word_matches=8, max_candidates=500, shortlist=10, min_word_score=0.5):
+        self.word_matches = word_matches
+        self.max_candidates = max_candidates
+        self.shortlist = shortlist
+        self.min_word_score = min_word_score
+        self._names = {}  # id -> (name, normalized key, sound skeleton, words)
+        self._words = {}  # word -> (sound skeleton, {ids of names containing it})
+        self._variants = {}  # skeleton_variants() of each word -> the word, or {words} if several share it
+        self._lock = threading.Lock()
+        self.stats = {"searches": 0, "words_scored": 0, "candidates": 0}
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, item_id, name):
+        """Index a name under an id, replacing whatever the id had before."""
+        key = normalize_name(name)
+        with self._lock:
+            self._remove(item_id)
+            if not key:
+                return
+            skeletons = []
+            for word in key.split():
+                entry = self._words.get(word)
+                if entry is None:
+                    entry = self._words[word] = (sound_skeleton(word), set())
+                    for variant in skeleton_variants(word):
+                        shared = self._variants.get(variant)
+                        if shared is None:
+                            self._variants[variant] = word
+                        elif isinstance(shared, str):
+                            self._variants[variant] = {shared, word}
+                        else:
+                            shared.add(word)
+                entry[1].add(item_id)
+                skeletons.append(entry[0])
+            # Skeleton rules never reach across a space, so the name's skeleton is its words'
+            self._names[item_id] = (name, key, " ".join(skeletons), tuple(dict.fromkeys(key.split())))
+
+    def remove(self, item_id):
+        with self._lock:
+            self._remove(item_id)
+
+    def _remove(self, item_id):
+        entry = self._names.pop(item_id, None)
+        if entry is None:
+            return
+        for word in entry[3]:
+            ids = self._words[word][1]
+            ids.discard(item_id)
+            if ids:
+                continue
+            # Last name using this word: drop it from the vocabulary
+            del self._words[word]
+            for variant in skeleton_variants(word):
+                shared = self._variants[variant]
+                if isinstance(shared, str):
+                    del self._variants[variant]
+                    continue
+                shared.discard(word)
+                if len(shared) == 1:
+                    self._variants[variant] = shared.pop()
+
+    def load(self, rows):
+        """Index (id, name) pairs in bulk. Returns the number indexed."""
+        count = 0
+        for item_id, name in rows:
+            self.add(item_id, name)
+            count += 1
+        return count
+
+    def _similar_words(self, word):
+        """[(vocabulary word, score)] for the indexed words that sound like word, best first."""
+        candidates = set()
+        for variant in skeleton_variants(word):
+            shared = self._variants.get(variant)
+            if shared is None:
+                continue
+            if isinstance(shared, str):
+                candidates.add(shared)
+            else:
+                candidates |= shared
+        skeleton = sound_skeleton(word)
+        scored = []
+        for candidate in candidates:
+            score = (similarity(word, candidate) + similarity(skeleton, self._words[candidate][0])) / 2
+            if score >= self.min_word_score:
+                scored.append((candidate, score))
+        self.stats["words_scored"] += len(candidates)
+        scored.sort(key=lambda entry: (-entry[1], entry[0]))
+        return scored[:self.word_matches]
+
+    def search(self, name, limit=5, min_score=0.0):
+        """Up to limit (id, name, score) tuples, best first, scoring at least min_score."""
+        key = normalize_name(name)
+        if not key:
+            return []
+        skeleton = sound_skeleton(key)
+        with self._lock:
+            matches = [m for m in map(self._similar_words, dict.fromkeys(key.split())) if m]
+            if not matches:
+                return []
+            # Candidates: names containing a word like the rarest query word (best-matching words first)
+            rarest = min(matches, key=lambda words: sum(len(self._words[w][1]) for w, _ in words))
+            candidates = []
+            for word, _ in rarest:
+                candidates.extend(islice(self._words[word][1], self.max_candidates - len(candidates)))
+                if len(candidates) >= self.max_candidates:
+                    break
+            self.stats["candidates"] += len(candidates)
+
+            # Rank them by how well their words match the query words, then score the best whole names
+            if len(candidates) > self.shortlist:
+                scores = [dict(words) for words in matches]
+
+                def word_score(item_id):
+                    stored = self._names[item_id][3]
+                    return sum(max(map(words.get, stored, repeat(0.0, len(stored)))) for words in scores)
+
+                candidates = heapq.nlargest(self.shortlist, candidates, key=word_score)
+            scored = []
+            for item_id in candidates:
+                stored, stored_key, stored_skeleton, _ = self._names[item_id]
+                score = (similarity(key, stored_key) + similarity(skeleton, stored_skeleton)) / 2
+                if score >= min_score:
+                    scored.append((item_id, stored, round(score, 4)))
+            self.stats["searches"] += 1
+        scored.sort(key=lambda entry: (-entry[2], entry[0]))
+        return scored[:limit]
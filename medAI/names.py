@@ -0,0 +1,29 @@
+"""Patient name normalization.
+
+Names are compared by a normalized key rather than as typed: Unicode
+compatibility-decomposed with diacritics dropped, casefolded, apostrophes
+removed and any other run of punctuation or whitespace collapsed to a
+single space. "  José  O'Brien-Smith " and "jose obrien smith" share the
+key "jose obrien smith". The key is stored on Patient.name_key (indexed)
+so lookups are index seeks instead of table scans.
+"""
+import re
+import unicodedata
+
+_APOSTROPHES = re.compile(r"['’ʼ`]")
+_SEPARATORS = re.compile(r"[\W_]+")
+
+
+def normalize_name(name):
+    """The lookup key for a name ("" for None or a name with no letters or digits)."""
+    if not name:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    folded = _APOSTROPHES.sub("", stripped.casefold())
+    return _SEPARATORS.sub(" ", folded).strip()
+
+
+def contains_words(name_key, key):
+    """True if key occurs in name_key as whole words ("ann" is in "mary ann", not in "joanne")."""
+    return f" {key} " in f" {name_key} "
@@ -0,0 +1,276 @@
+"""Medical consultation report generation: single call, streaming and section-parallel.
+
+Each strategy has a sync version (Flask app, thread pool) and an async version
+(ASGI app, asyncio tasks) taking AzureOpenAI / AsyncAzureOpenAI clients respectively.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from upstream import create_completion, acreate_completion
+
+REPORT_TITLE = "**COMPREHENSIVE MEDICAL CONSULTATION REPORT**"
+
+# Fixed report sections, in display order: (key, heading, bullet lines)
+REPORT_SECTIONS = [
+    ("identification", "**PATIENT IDENTIFICATION:**", [
+        "- Full Name:",
+        "- Date of Birth:",
+        "- Address:",
+        "- Emergency Contact:",
+        "- Date of Consultation: [Current Date]",
+    ]),
+    ("vitals", "**VITAL SIGNS & MEASUREMENTS:**", [
+        "- Temperature:",
+        "- Blood Pressure:",
+        "- Heart Rate:",
+        "- Pain Level (1-10):",
+    ]),
+    ("complaint", "**CHIEF COMPLAINT & PRESENTING SYMPTOMS:**", [
+        "- Primary concern:",
+        "- Symptom duration:",
+        "- Symptom severity:",
+        "- Associated symptoms:",
+    ]),
+    ("history", "**MEDICAL HISTORY:**", [
+        "- Past Medical Conditions:",
+        "- Previous Surgeries:",
+        "- Hospitalizations:",
+        "- Current Medications:",
+        "- Known Allergies:",
+    ]),
+    ("lifestyle", "**LIFESTYLE ASSESSMENT:**", [
+        "- Diet & Nutrition:",
+        "- Physical Activity:",
+        "- Sleep Patterns:",
+        "- Stress Levels:",
+        "- Substance Use:",
+    ]),
+    ("family", "**FAMILY MEDICAL HISTORY:**", [
+        "- Hereditary Conditions:",
+        "- Significant Family History:",
+    ]),
+    ("assessment", "**CLINICAL ASSESSMENT:**", [
+        "- Summary of Findings:",
+        "- Risk Factors:",
+        "- Areas of Concern:",
+    ]),
+    ("recommendations", "**RECOMMENDATIONS:**", [
+        "- Immediate Actions Required:",
+        "- Lifestyle Modifications:",
+        "- Follow-up Care:",
+        "- Specialist Referrals (if needed):",
+        "- Emergency Warning Signs:",
+    ]),
+    ("authorization", "**MEDICAL RECORDS AUTHORIZATION:**", [
+        "- Patient Consent Status for Medical Records Request:",
+        "- Authorized Healthcare Providers:",
+    ]),
+]
+
+REPORT_DISCLAIMER = """**IMPORTANT MEDICAL DISCLAIMER:**
+This consultation report is based on patient-provided information and represents a preliminary assessment. This report does not constitute a medical diagnosis or treatment plan. The patient is strongly advised to:
+1. Consult with a qualified healthcare provider for proper medical evaluation
+2. Seek immediate medical attention for any emergency symptoms
+3. Follow up with appropriate specialists as recommended
+4. Continue taking prescribed medications as directed by their physician"""
+
+REPORT_FOOTER = """Report Generated: [Timestamp]
+Medical Assistant: AI Consultation System"""
+
+
+def _section_template(heading, bullets):
+    return heading + "\n" + "\n".join(bullets)
+
+
+REPORT_SYSTEM_PROMPT = (
+    "You are a medical assistant generating a comprehensive medical consultation report. "
+    "Based on the conversation provided, create a detailed medical report with the following sections:\n\n"
+    + REPORT_TITLE + "\n\n"
+    + "\n\n".join(_section_template(heading, bullets) for _, heading, bullets in REPORT_SECTIONS)
+    + "\n\n" + REPORT_DISCLAIMER + "\n\n" + REPORT_FOOTER + "\n\n"
+    + "Format this report professionally with clear sections and bullet points for easy reading by both patients and healthcare providers."
+)
+
+SECTION_SYSTEM_PROMPT = """You are a medical assistant writing ONE section of a comprehensive medical consultation report. Based on the conversation provided, write only the section below, starting with its heading exactly as shown and filling in each bullet point:
+
+{template}
+
+Use only information from the conversation; write "Not provided" for anything the patient did not mention. Do not add any other sections, titles or disclaimers."""
+
+# Token budget for each section when sections are generated in parallel
+SECTION_MAX_TOKENS = 250
+REPORT_MAX_TOKENS = 800
+
+
+def conversation_to_text(conversation_history):
+    """Flatten the conversation into 'role: content' lines for the report prompt."""
+    return "\n".join([f"{msg['role']}: {msg['content']}" for msg in conversation_history])
+
+
+def build_report_messages(conversation_history):
+    """Messages for generating the whole report in one call."""
+    conversation_text = conversation_to_text(conversation_history)
+    return [
+        {"role": "system", "content": REPORT_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Please generate a comprehensive medical consultation report based on this conversation:\n\n{conversation_text}"}
+    ]
+
+
+def build_section_messages(heading, bullets, conversation_text):
+    """Messages for generating a single report section."""
+    now = datetime.now().strftime('%B %d, %Y')
+    template = _section_template(heading, bullets).replace("[Current Date]", now)
+    return [
+        {"role": "system", "content": SECTION_SYSTEM_PROMPT.format(template=template)},
+        {"role": "user", "content": f"Conversation:\n\n{conversation_text}"}
+    ]
+
+
+def report_preamble():
+    """Static text placed before the generated sections."""
+    return REPORT_TITLE + "\n\n"
+
+
+def report_epilogue():
+    """Static disclaimer and footer placed after the generated sections."""
+    footer = REPORT_FOOTER.replace("[Timestamp]", datetime.now().strftime('%B %d, %Y at %I:%M %p'))
+    return "\n\n" + REPORT_DISCLAIMER + "\n\n" + footer
+
+
+def generate_report_text(client, deployment, conversation_history):
+    """Generate the whole report with one blocking LLM call."""
+    response = create_completion(
+        client,
+        model=deployment,
+        messages=build_report_messages(conversation_history),
+        max_tokens=REPORT_MAX_TOKENS,
+        temperature=0.3
+    )
+    return response.choices[0].message.content
+
+
+def stream_report_text(client, deployment, conversation_history):
+    """Generate the whole report with one streaming LLM call, yielding text deltas."""
+    stream = create_completion(
+        client,
+        model=deployment,
+        messages=build_report_messages(conversation_history),
+        max_tokens=REPORT_MAX_TOKENS,
+        temperature=0.3,
+        stream=True
+    )
+    for chunk in stream:
+        # Azure sends a leading chunk with content filter results and no choices
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
+
+
+def _generate_section(client, deployment, heading, bullets, conversation_text):
+    response = create_completion(
+        client,
+        model=deployment,
+        messages=build_section_messages(heading, bullets, conversation_text),
+        max_tokens=SECTION_MAX_TOKENS,
+        temperature=0.3
+    )
+    return (response.choices[0].message.content or "").strip()
+
+
+def stream_report_sections(client, deployment, conversation_history, max_workers=None):
+    """Generate every section concurrently and yield report text in section order.
+
+    Each section is yielded as soon as it and all sections before it are done, so
+    total time is bounded by the slowest section instead of the sum of all of them.
+    """
+    conversation_text = conversation_to_text(conversation_history)
+    workers = max_workers or len(REPORT_SECTIONS)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        futures = [
+            executor.submit(_generate_section, client, deployment, heading, bullets, conversation_text)
+            for _, heading, bullets in REPORT_SECTIONS
+        ]
+        yield report_preamble()
+        for index, future in enumerate(futures):
+            separator = "\n\n" if index else ""
+            yield separator + future.result()
+        yield report_epilogue()
+    finally:
+        # If the consumer went away or a section failed: drop queued sections and return
+        # without waiting for the running ones (their results are discarded)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def generate_report_sections(client, deployment, conversation_history, max_workers=None):
+    """Generate the report section-parallel and return it as one string."""
+    return "".join(stream_report_sections(client, deployment, conversation_history, max_workers))
+
+
+async def agenerate_report_text(client, deployment, conversation_history):
+    """Async version of generate_report_text."""
+    response = await acreate_completion(
+        client,
+        model=deployment,
+        messages=build_report_messages(conversation_history),
+        max_tokens=REPORT_MAX_TOKENS,
+        temperature=0.3
+    )
+    return response.choices[0].message.content
+
+
+async def astream_report_text(client, deployment, conversation_history):
+    """Async version of stream_report_text."""
+    stream = await acreate_completion(
+        client,
+        model=deployment,
+        messages=build_report_messages(conversation_history),
+        max_tokens=REPORT_MAX_TOKENS,
+        temperature=0.3,
+        stream=True
+    )
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            yield delta
+
+
+async def _agenerate_section(client, deployment, heading, bullets, conversation_text):
+    response = await acreate_completion(
+        client,
+        model=deployment,
+        messages=build_section_messages(heading, bullets, conversation_text),
+        max_tokens=SECTION_MAX_TOKENS,
+        temperature=0.3
+    )
+    return (response.choices[0].message.content or "").strip()
+
+
+async def astream_report_sections(client, deployment, conversation_history):
+    """Async version of stream_report_sections: all sections run as concurrent tasks."""
+    conversation_text = conversation_to_text(conversation_history)
+    tasks = [
+        asyncio.ensure_future(_agenerate_section(client, deployment, heading, bullets, conversation_text))
+        for _, heading, bullets in REPORT_SECTIONS
+    ]
+    try:
+        yield report_preamble()
+        for index, task in enumerate(tasks):
+            separator = "\n\n" if index else ""
+            yield separator + await task
+        yield report_epilogue()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def agenerate_report_sections(client, deployment, conversation_history):
+    """Async version of generate_report_sections."""
+    parts = []
+    async for part in astream_report_sections(client, deployment, conversation_history):
+        parts.append(part)
+    return "".join(parts)
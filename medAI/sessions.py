@@ -0,0 +1,118 @@
+"""Server-side conversation sessions so clients only send the newest message.
+
+Each consultation gets a session id; the server keeps its message history in
+memory (evicted after a period of inactivity) and the client sends only the
+new message on each turn. Once a session has been saved to a
+ConsultationSession row it can be reloaded from the database after eviction
+or a restart.
+"""
+import threading
+import time
+import uuid
+
+
+class SessionNotFound(Exception):
+    """Raised when a session id is unknown or has expired."""
+
+
+class ConversationSession:
+    """Message history and bookkeeping for one consultation."""
+
+    def __init__(self, session_id, history=None):
+        self.id = session_id
+        self.history = list(history or [])
+        self.created_at = time.time()
+        self.last_access = self.created_at
+        self.db_session_id = None  # ConsultationSession.id once saved
+        self.patient_id = None  # Patient.id once known (returning patient or saved)
+        self.summary = None  # context.ConversationSummary once older turns are folded
+        self.lock = threading.Lock()
+
+    def append(self, *messages):
+        """Append messages ({'role', 'content'} dicts) to the history."""
+        with self.lock:
+            self.history.extend({"role": m["role"], "content": m["content"]} for m in messages)
+
+    def snapshot(self):
+        """Copy of the history, safe to use while other requests append."""
+        with self.lock:
+            return list(self.history)
+
+
+class SessionStore:
+    """Thread-safe in-memory session store with TTL eviction and an optional database loader.
+
+    loader(session_id) is called on a cache miss and may return a
+    (history, db_session_id) tuple to rehydrate the session, or None.
+    """
+
+    def __init__(self, ttl_seconds=7200, max_sessions=10000, loader=None, sweep_interval=60):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.loader = loader
+        self.sweep_interval = sweep_interval
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+        self.stats = {"created": 0, "hits": 0, "misses": 0, "loaded": 0, "evicted": 0}
+
+    def create(self, history=None):
+        """Start a new session seeded with an optional history."""
+        session = ConversationSession(uuid.uuid4().hex, history)
+        with self._lock:
+            self._sweep_locked()
+            if len(self._sessions) >= self.max_sessions:
+                # Drop the least recently used session to stay within the cap
+                oldest = min(self._sessions.values(), key=lambda s: s.last_access)
+                del self._sessions[oldest.id]
+                self.stats["evicted"] += 1
+            self._sessions[session.id] = session
+            self.stats["created"] += 1
+        return session
+
+    def get(self, session_id):
+        """Return the live session for an id, reloading it through the loader if needed."""
+        now = time.time()
+        with self._lock:
+            self._sweep_locked(now)
+            session = self._sessions.get(session_id)
+            if session is not None and now - session.last_access > self.ttl_seconds:
+                del self._sessions[session_id]
+                self.stats["evicted"] += 1
+                session = None
+            if session is not None:
+                session.last_access = now
+                self.stats["hits"] += 1
+                return session
+            self.stats["misses"] += 1
+
+        loaded = self.loader(session_id) if self.loader else None
+        if loaded is None:
+            raise SessionNotFound(session_id)
+
+        history, db_session_id = loaded
+        session = ConversationSession(session_id, history)
+        session.db_session_id = db_session_id
+        with self._lock:
+            # Another request may have loaded it concurrently; keep the first copy
+            session = self._sessions.setdefault(session_id, session)
+            self.stats["loaded"] += 1
+        return session
+
+    def discard(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _sweep_locked(self, now=None):
+        """Evict sessions idle for longer than the TTL. Caller holds the lock."""
+        now = now or time.time()
+        if now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        expired = [sid for sid, s in self._sessions.items() if now - s.last_access > self.ttl_seconds]
+        for sid in expired:
+            del self._sessions[sid]
+        self.stats["evicted"] += len(expired)
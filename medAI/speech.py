@@ -0,0 +1,309 @@
+"""Request builders and response parsers for the Azure speech upstreams (STT and TTS)."""
+import asyncio
+import base64
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from cache import cache_key
+
+TTS_MODEL = "gpt-4o-mini-tts"
+TTS_VOICE = "alloy"
+TTS_FORMAT = "mp3"
+
+# Audio formats clients may request, with the content type they are served as
+TTS_FORMATS = {"mp3": "audio/mpeg", "opus": "audio/ogg"}
+# Accept header media types that select a binary audio response
+AUDIO_MEDIA_TYPES = {"audio/mpeg": "mp3", "audio/mp3": "mp3", "audio/ogg": "opus", "audio/opus": "opus"}
+
+
+def uses_azure_speech_format(secrets):
+    """True if STT should use the Azure Speech Services REST format rather than Whisper."""
+    return bool(secrets.AZURE_SPEECH_STT_REGION and 'cognitiveservices' in secrets.AZURE_SPEECH_STT_ENDPOINT)
+
+
+def build_stt_request(secrets, filename, audio_content, content_type):
+    """Build the keyword arguments for the STT upstream POST.
+
+    audio_content may be bytes or a file-like object.
+    """
+    if uses_azure_speech_format(secrets):
+        # Azure Speech Services uses different format
+        return {
+            'url': secrets.AZURE_SPEECH_STT_ENDPOINT,
+            'files': {
+                'audio': (filename, audio_content, 'audio/wav')
+            },
+            'headers': {
+                'Ocp-Apim-Subscription-Key': secrets.AZURE_SPEECH_STT_KEY
+            },
+            'params': {
+                'language': 'en-US',
+                'format': 'simple'
+            },
+        }
+
+    # OpenAI Whisper format (fallback)
+    return {
+        'url': secrets.AZURE_SPEECH_STT_ENDPOINT,
+        'files': {
+            'file': (filename, audio_content, content_type)
+        },
+        'headers': {
+            'api-key': secrets.AZURE_SPEECH_STT_KEY
+        },
+    }
+
+
+def stt_cache_key(secrets, audio_digest):
+    """Cache key for a transcription: the audio plus the endpoint and response format that produced it."""
+    return cache_key("stt", audio_digest, secrets.AZURE_SPEECH_STT_ENDPOINT, uses_azure_speech_format(secrets))
+
+
+def cacheable_stt_result(result):
+    """False for Azure Speech results reporting a service-side error, which may succeed on retry."""
+    return result.get('RecognitionStatus') != 'Error'
+
+
+def parse_stt_result(result):
+    """Extract the transcription from either STT response format."""
+    if 'DisplayText' in result:
+        # Azure Speech Services format
+        return result.get('DisplayText', '')
+    if 'text' in result:
+        # OpenAI Whisper format
+        return result.get('text', '')
+    if 'Text' in result:
+        # Alternative Azure format
+        return result.get('Text', '')
+    return ""
+
+
+def _normalized_words(text):
+    return [re.sub(r"[^\w']", "", word).lower() for word in text.split()]
+
+
+def stitch_transcripts(parts, max_overlap_words=10):
+    """Join chunk transcriptions in order.
+
+    parts is a list of (text, overlaps_previous); text None marks a chunk
+    that failed and is shown as "[...]". Where chunks overlap, the longest
+    run of words ending the previous text and starting the next (ignoring
+    case and punctuation) is dropped from the next.
+    """
+    words = []
+    for text, overlaps_previous in parts:
+        if text is None:
+            words.append("[...]")
+            continue
+        next_words = text.split()
+        if overlaps_previous and words:
+            tail, head = _normalized_words(" ".join(words[-max_overlap_words:])), _normalized_words(" ".join(next_words[:max_overlap_words]))
+            for size in range(min(len(tail), len(head)), 0, -1):
+                if tail[-size:] == head[:size]:
+                    next_words = next_words[size:]
+                    break
+        words.extend(next_words)
+    return " ".join(words)
+
+
+def build_tts_request(secrets, text, audio_format=TTS_FORMAT):
+    """Build the keyword arguments for the TTS upstream POST."""
+    return {
+        'url': secrets.AZURE_SPEECH_TTS_ENDPOINT,
+        'json': {
+            "model": TTS_MODEL,
+            "input": text,
+            "voice": TTS_VOICE,
+            "response_format": audio_format
+        },
+        'headers': {
+            'api-key': secrets.AZURE_SPEECH_TTS_KEY,
+            'Content-Type': 'application/json'
+        },
+    }
+
+
+def tts_cache_key(secrets, text, audio_format=TTS_FORMAT):
+    """Cache key for synthesized audio: everything that determines the TTS output, including the endpoint and deployment."""
+    return cache_key("tts", text, secrets.AZURE_SPEECH_TTS_ENDPOINT, secrets.AZURE_OPENAI_SPEECH_TTS_DEPLOYMENT,
+                     TTS_MODEL, TTS_VOICE, audio_format)
+
+
+def negotiate_tts_response(accept, requested_format=None):
+    """Pick the /text-to-speech response form from the Accept header.
+
+    Returns the audio format ('mp3' or 'opus') to stream as binary audio, or
+    None for the base64 JSON response. JSON stays the default (no Accept,
+    */* or application/json win ties) so existing clients are unaffected.
+    requested_format (the request's "format" field) resolves audio/*.
+    """
+    best_quality, best_format = 0.0, None
+    for item in (accept or "").split(","):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        media_type = media_type.lower()
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if media_type in AUDIO_MEDIA_TYPES:
+            audio_format = AUDIO_MEDIA_TYPES[media_type]
+        elif media_type == "audio/*":
+            audio_format = requested_format or TTS_FORMAT
+        elif media_type in ("application/json", "*/*"):
+            audio_format = None
+        else:
+            continue
+        if quality > best_quality or (quality == best_quality and audio_format is None and quality > 0):
+            best_quality, best_format = quality, audio_format
+    return best_format
+
+
+# Sentence boundaries for incremental TTS: terminal punctuation (plus closing quotes/brackets)
+# followed by whitespace, or a line break
+_SENTENCE_END = re.compile(r'[.!?]+["\')\]]*\s+|\n\s*')
+ABBREVIATIONS = {"dr.", "mr.", "mrs.", "ms.", "st.", "vs.", "e.g.", "i.e.", "etc.", "approx."}
+MIN_SENTENCE_CHARS = 20
+
+
+class SentenceSplitter:
+    """Cut streamed text into sentences so each can be synthesized while generation continues.
+
+    Very short fragments and abbreviations ("Dr.") are merged into the following
+    sentence to avoid choppy audio.
+    """
+
+    def __init__(self, min_chars=MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self.buffer = ""
+
+    def feed(self, text):
+        """Add streamed text; return the sentences completed by it."""
+        self.buffer += text
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self.buffer):
+            candidate = self.buffer[start:match.end()].strip()
+            words = self.buffer[start:match.start() + 1].split()
+            if not candidate or len(candidate) < self.min_chars or (words and words[-1].lower() in ABBREVIATIONS):
+                continue
+            sentences.append(candidate)
+            start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self):
+        """Return whatever text remains once the stream has ended."""
+        rest = self.buffer.strip()
+        self.buffer = ""
+        return [rest] if rest else []
+
+
+def _audio_segment(index, text, audio=None, error=None, raw=False):
+    """Payload for one synthesized sentence (base64 audio, or the error if synthesis failed).
+
+    raw=True keeps the audio as bytes, for transports that can send binary.
+    """
+    segment = {"index": index, "text": text}
+    if error is not None:
+        print(f"TTS failed for segment {index}: {error}")
+        segment["error"] = str(error)
+    else:
+        segment["audio"] = audio if raw else base64.b64encode(audio).decode('utf-8')
+    return segment
+
+
+class SpeechPipeline:
+    """Synthesize the sentences of a streamed reply concurrently, handing back audio in order.
+
+    synthesize(text) returns audio bytes. Call feed() with each text delta,
+    collect finished segments with ready() while streaming, then call
+    finish() and drain() once generation is done.
+    """
+
+    def __init__(self, synthesize, max_workers=4):
+        self.synthesize = synthesize
+        self.splitter = SentenceSplitter()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.pending = deque()  # (index, text, future), in reply order
+        self.count = 0
+
+    def _submit(self, sentences):
+        for sentence in sentences:
+            self.pending.append((self.count, sentence, self.executor.submit(self.synthesize, sentence)))
+            self.count += 1
+
+    def feed(self, text):
+        self._submit(self.splitter.feed(text))
+
+    def finish(self):
+        self._submit(self.splitter.flush())
+
+    def _pop(self):
+        index, text, future = self.pending.popleft()
+        try:
+            return _audio_segment(index, text, audio=future.result())
+        except Exception as e:
+            return _audio_segment(index, text, error=e)
+
+    def ready(self):
+        """Segments that are done, stopping at the first one still being synthesized."""
+        while self.pending and self.pending[0][2].done():
+            yield self._pop()
+
+    def drain(self):
+        """All remaining segments in order, waiting for each."""
+        while self.pending:
+            yield self._pop()
+
+    def close(self):
+        for _, _, future in self.pending:
+            future.cancel()
+        self.executor.shutdown(wait=False)
+
+
+class AsyncSpeechPipeline:
+    """Async version of SpeechPipeline; synthesize(text) is a coroutine function run as tasks.
+
+    With raw_audio=True segments carry audio bytes instead of base64.
+    """
+
+    def __init__(self, synthesize, raw_audio=False):
+        self.synthesize = synthesize
+        self.raw_audio = raw_audio
+        self.splitter = SentenceSplitter()
+        self.pending = deque()
+        self.count = 0
+
+    def _submit(self, sentences):
+        for sentence in sentences:
+            self.pending.append((self.count, sentence, asyncio.ensure_future(self.synthesize(sentence))))
+            self.count += 1
+
+    def feed(self, text):
+        self._submit(self.splitter.feed(text))
+
+    def finish(self):
+        self._submit(self.splitter.flush())
+
+    async def _pop(self):
+        index, text, task = self.pending.popleft()
+        try:
+            return _audio_segment(index, text, audio=await task, raw=self.raw_audio)
+        except Exception as e:
+            return _audio_segment(index, text, error=e)
+
+    async def ready(self):
+        while self.pending and self.pending[0][2].done():
+            yield await self._pop()
+
+    async def drain(self):
+        while self.pending:
+            yield await self._pop()
+
+    def close(self):
+        for _, _, task in self.pending:
+            task.cancel()
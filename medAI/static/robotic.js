@@ -37,6 +37,15 @@ const speechToggleBtn = document.getElementById('speech-toggle-btn');
 let conversationHistory = [];
 let currentPatient = null;
 let isReturningPatient = false;
+// Server-side session key: once set, only new messages are sent to the server
+let consultationSessionKey = null;
+// Consultation WebSocket (served by the ASGI app): one connection per consultation
+let consultationSocket = null; // Promise of the open socket
+let consultationSocketFailed = false; // Could not connect: use HTTP streaming from now on
+let socketTurn = null; // Handlers of the turn in progress on the socket
+let socketTurnNumber = 0;
+// Report tab opened for the current consultation (it streams the report)
+let reportWindow = null;
 
 // SVGs for icons
 // Stylized robot face SVG (modern, friendly)
@@ -47,6 +56,8 @@ const patientSVG = `<svg xmlns="http://www.w3.org/2000/svg" width="32" height="3
 // Configuration for auto-speech
 let autoSpeechEnabled = true; // Default to enabled for voice interaction
 let currentAudio = null; // Track current playing audio
+let audioQueue = []; // Streamed reply audio segments waiting to play
+let audioQueuePlaying = false;
 
 function appendMessage(sender, text) {
     const bubbleDiv = document.createElement('div');
@@ -62,28 +73,7 @@ function appendMessage(sender, text) {
 
     // Add speaker and stop icons for bot messages to indicate TTS capability
     if (sender === 'bot') {
-        const audioControlsDiv = document.createElement('div');
-        audioControlsDiv.style.display = 'inline-block';
-        audioControlsDiv.style.marginLeft = '5px';
-
-        const speakerIcon = document.createElement('span');
-        speakerIcon.innerHTML = '🔊';
-        speakerIcon.style.cursor = 'pointer';
-        speakerIcon.style.fontSize = '14px';
-        speakerIcon.style.marginRight = '5px';
-        speakerIcon.title = 'Click to hear this message';
-        speakerIcon.onclick = () => speakText(text);
-
-        const stopIcon = document.createElement('span');
-        stopIcon.innerHTML = '⏹️';
-        stopIcon.style.cursor = 'pointer';
-        stopIcon.style.fontSize = '14px';
-        stopIcon.title = 'Stop audio playback';
-        stopIcon.onclick = () => stopAudio();
-
-        audioControlsDiv.appendChild(speakerIcon);
-        audioControlsDiv.appendChild(stopIcon);
-        contentDiv.appendChild(audioControlsDiv);
+        contentDiv.appendChild(createAudioControls(text));
     }
 
     bubbleDiv.appendChild(iconDiv);
@@ -91,6 +81,38 @@ function appendMessage(sender, text) {
     chatWindow.appendChild(bubbleDiv);
     chatWindow.scrollTop = chatWindow.scrollHeight;
 
+    recordMessage(sender, text);
+}
+
+// Speaker and stop icons shown next to bot messages
+function createAudioControls(text) {
+    const audioControlsDiv = document.createElement('div');
+    audioControlsDiv.style.display = 'inline-block';
+    audioControlsDiv.style.marginLeft = '5px';
+
+    const speakerIcon = document.createElement('span');
+    speakerIcon.innerHTML = '🔊';
+    speakerIcon.style.cursor = 'pointer';
+    speakerIcon.style.fontSize = '14px';
+    speakerIcon.style.marginRight = '5px';
+    speakerIcon.title = 'Click to hear this message';
+    speakerIcon.onclick = () => speakText(text);
+
+    const stopIcon = document.createElement('span');
+    stopIcon.innerHTML = '⏹️';
+    stopIcon.style.cursor = 'pointer';
+    stopIcon.style.fontSize = '14px';
+    stopIcon.title = 'Stop audio playback';
+    stopIcon.onclick = () => stopAudio();
+
+    audioControlsDiv.appendChild(speakerIcon);
+    audioControlsDiv.appendChild(stopIcon);
+    return audioControlsDiv;
+}
+
+// Add a displayed message to the conversation history and speak bot messages
+// (alreadySpoken: the reply's audio was streamed with it)
+function recordMessage(sender, text, alreadySpoken) {
     // Add to conversation history
     conversationHistory.push({
         role: sender === 'bot' ? 'assistant' : 'user',
@@ -98,7 +120,7 @@ function appendMessage(sender, text) {
     });
 
     // Enhanced text-to-speech for bot messages using Azure TTS
-    if (sender === 'bot' && autoSpeechEnabled) {
+    if (sender === 'bot' && autoSpeechEnabled && !alreadySpoken) {
         // Use Azure TTS with a small delay to avoid overwhelming the user
         setTimeout(() => {
             speakText(text);
@@ -106,11 +128,45 @@ function appendMessage(sender, text) {
     }
 }
 
+// Create an empty bot bubble that is filled in as tokens stream in
+function createStreamingBotBubble() {
+    const bubbleDiv = document.createElement('div');
+    bubbleDiv.className = 'er-bubble bot';
+    const iconDiv = document.createElement('div');
+    iconDiv.className = 'er-bot-icon';
+    iconDiv.innerHTML = botSVG;
+    const contentDiv = document.createElement('div');
+    contentDiv.className = 'er-bubble-content';
+    const textSpan = document.createElement('span');
+    contentDiv.appendChild(textSpan);
+    bubbleDiv.appendChild(iconDiv);
+    bubbleDiv.appendChild(contentDiv);
+    chatWindow.appendChild(bubbleDiv);
+
+    return {
+        update(text) {
+            textSpan.textContent = text;
+            chatWindow.scrollTop = chatWindow.scrollHeight;
+        },
+        finish(text, alreadySpoken) {
+            textSpan.textContent = text;
+            contentDiv.appendChild(createAudioControls(text));
+            chatWindow.scrollTop = chatWindow.scrollHeight;
+            recordMessage('bot', text, alreadySpoken);
+        },
+        remove() {
+            bubbleDiv.remove();
+        }
+    };
+}
+
 function clearChat() {
     chatWindow.innerHTML = '';
     conversationHistory = [];
     currentPatient = null;
     isReturningPatient = false;
+    consultationSessionKey = null;
+    closeConsultationSocket();
 }
 
 // Helper function to extract patient name from conversation
@@ -146,45 +202,482 @@ function sendMessage() {
     if (!text) return;
     appendMessage('patient', text);
     chatInput.value = '';
+    requestConsultationReply(text, true);
+}
+
+// Remove the trailing placeholder bot message ("Processing...", "Generating...")
+function removePlaceholderMessage() {
+    const lastBotMsg = chatWindow.querySelector('.er-bubble.bot:last-child');
+    if (lastBotMsg) {
+        lastBotMsg.remove();
+        conversationHistory.pop(); // Remove placeholder from history
+    }
+}
+
+// Show the returning patient notification (optionally with their stored summary)
+function showReturningPatient(existingPatient, showSummary) {
+    currentPatient = existingPatient;
+    isReturningPatient = true;
+    console.log('Returning patient found:', currentPatient);
+
+    if (showSummary) {
+        const welcomeMessage = `Welcome back, ${currentPatient.name}! I found your previous medical record from ${currentPatient.last_consultation}. Let me review your information and focus on any new concerns or updates since your last visit.`;
+        appendMessage('bot', welcomeMessage);
+
+        // Show patient summary
+        if (currentPatient.summary) {
+            const summaryMessage = `Here's a summary of your existing information: ${currentPatient.summary}`;
+            appendMessage('bot', summaryMessage);
+        }
+    } else {
+        const welcomeMessage = `Welcome back, ${currentPatient.name}! I found your previous medical record from ${currentPatient.last_consultation}.`;
+        appendMessage('bot', welcomeMessage);
+    }
+}
+
+// Offer near-miss patient records: nothing is linked until the patient confirms one
+function showPatientCandidates(match) {
+    appendMessage('bot', `I couldn't find a record under "${match.name}". If you are one of these patients, please select your name; otherwise just continue.`);
+    const choices = document.createElement('div');
+    choices.className = 'er-bubble bot';
+    match.candidates.forEach(candidate => {
+        const button = document.createElement('button');
+        button.textContent = candidate.name;
+        button.onclick = function () {
+            choices.remove();
+            confirmPatientCandidate(match.name, candidate.id);
+        };
+        choices.appendChild(button);
+    });
+    chatWindow.appendChild(choices);
+    chatWindow.scrollTop = chatWindow.scrollHeight;
+}
+
+// Link the record the patient picked to this consultation
+function confirmPatientCandidate(name, patientId) {
+    const payload = { name: name, patient_id: patientId };
+    if (consultationSessionKey) {
+        payload.session_key = consultationSessionKey;
+    }
+    axios.post('/lookup_patient', payload)
+        .then(res => {
+            if (res.data.found) {
+                showReturningPatient({
+                    found: true,
+                    id: res.data.patient.id,
+                    name: res.data.patient.full_name,
+                    last_consultation: res.data.last_consultation,
+                    summary: res.data.summary
+                }, true);
+            }
+        })
+        .catch(err => {
+            console.error('Error confirming patient record:', err);
+        });
+}
+
+// Show whichever patient match a consultation turn reported
+function showPatientMatch(match, showSummary) {
+    if (match.found) {
+        showReturningPatient(match, showSummary);
+    } else if (match.candidates && match.candidates.length) {
+        showPatientCandidates(match);
+    }
+}
+
+// Request body for a consultation turn: only the new message once a server-side session exists
+function consultationPayload(message, history) {
+    if (consultationSessionKey) {
+        return { message: message, session_key: consultationSessionKey };
+    }
+    return { message: message, history: history };
+}
+
+// Stream the consultation reply over Server-Sent Events.
+// Calls onPatient(payload) for a returning patient and onDelta(text) per token chunk;
+// with onAudio(segment), the voice endpoint also streams the reply's audio sentence by sentence.
+// Resolves with the final response body ({response, session_key, ...}).
+function streamConsultationChat(payload, onPatient, onDelta, onAudio) {
+    const url = onAudio ? '/consultation_voice_stream' : '/consultation_chat_stream';
+    return fetch(url, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify(payload)
+    }).then(response => {
+        if (!response.ok || !response.body) {
+            const error = new Error('Streaming request failed with status ' + response.status);
+            error.status = response.status;
+            throw error;
+        }
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let finalPayload = null;
+
+        function handleEvent(rawEvent) {
+            let eventName = 'message';
+            let data = '';
+            rawEvent.split('\n').forEach(line => {
+                if (line.startsWith('event:')) {
+                    eventName = line.slice(6).trim();
+                } else if (line.startsWith('data:')) {
+                    data += line.slice(5).trim();
+                }
+            });
+            if (!data) return;
+            const payload = JSON.parse(data);
+            if (eventName === 'patient') {
+                onPatient(payload);
+            } else if (eventName === 'delta') {
+                onDelta(payload.delta);
+            } else if (eventName === 'audio' && onAudio) {
+                onAudio(payload);
+            } else if (eventName === 'done') {
+                finalPayload = payload;
+            } else if (eventName === 'error') {
+                throw new Error(payload.error);
+            }
+        }
+
+        function pump() {
+            return reader.read().then(({ done, value }) => {
+                if (value) {
+                    buffer += decoder.decode(value, { stream: true });
+                    let boundary;
+                    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                        handleEvent(buffer.slice(0, boundary));
+                        buffer = buffer.slice(boundary + 2);
+                    }
+                }
+                if (done) {
+                    if (finalPayload === null) {
+                        throw new Error('Stream ended before the reply was complete');
+                    }
+                    return finalPayload;
+                }
+                return pump();
+            });
+        }
+        return pump();
+    });
+}
+
+// Open (or reuse) the consultation WebSocket.
+// Audio messages are followed by a binary frame with the sentence's audio, attached as segment.audioData.
+function openConsultationSocket() {
+    if (consultationSocket) {
+        return consultationSocket;
+    }
+    const opening = new Promise((resolve, reject) => {
+        const scheme = window.location.protocol === 'https:' ? 'wss://' : 'ws://';
+        const socket = new WebSocket(scheme + window.location.host + '/ws/consultation');
+        socket.binaryType = 'arraybuffer';
+        let opened = false;
+        let pendingAudio = null;
+
+        socket.onopen = () => {
+            opened = true;
+            socketTurnNumber = 0; // The server numbers turns per connection
+            resolve(socket);
+        };
+        socket.onmessage = event => {
+            if (typeof event.data !== 'string') {
+                if (pendingAudio) {
+                    pendingAudio.audioData = event.data;
+                    handleSocketMessage(pendingAudio);
+                    pendingAudio = null;
+                }
+                return;
+            }
+            const message = JSON.parse(event.data);
+            if (message.type === 'audio' && !message.error) {
+                pendingAudio = message;
+                return;
+            }
+            handleSocketMessage(message);
+        };
+        socket.onclose = () => {
+            if (consultationSocket === opening) {
+                consultationSocket = null;
+            }
+            if (!opened) {
+                // No WebSocket support on this server (e.g. the Flask app): stop trying
+                consultationSocketFailed = true;
+                reject(new Error('Consultation socket unavailable'));
+                return;
+            }
+            finishSocketTurn(new Error('Consultation socket closed'));
+        };
+    });
+    consultationSocket = opening;
+    return opening;
+}
+
+function closeConsultationSocket() {
+    const opening = consultationSocket;
+    consultationSocket = null;
+    finishSocketTurn(Object.assign(new Error('Consultation restarted'), { superseded: true }));
+    if (opening) {
+        opening.then(socket => socket.close(), () => {});
+    }
+}
+
+// End the turn in progress: resolve with the final payload, or reject with an error
+function finishSocketTurn(error, reply) {
+    const turn = socketTurn;
+    socketTurn = null;
+    if (!turn) return;
+    if (error) {
+        turn.reject(error);
+    } else {
+        turn.resolve(reply);
+    }
+}
+
+function handleSocketMessage(message) {
+    if (message.type === 'session') {
+        consultationSessionKey = message.session_key;
+        return;
+    }
+    const turn = socketTurn;
+    if (!turn || (message.turn !== undefined && message.turn !== socketTurnNumber)) {
+        return; // Left over from a cancelled turn
+    }
+    if (message.type === 'transcript') {
+        if (turn.onTranscript) turn.onTranscript(message.text);
+    } else if (message.type === 'patient') {
+        turn.onPatient(message);
+    } else if (message.type === 'delta') {
+        turn.onDelta(message.delta);
+    } else if (message.type === 'audio') {
+        if (turn.onAudio) turn.onAudio(message);
+    } else if (message.type === 'done') {
+        finishSocketTurn(null, message);
+    } else if (message.type === 'error') {
+        finishSocketTurn(Object.assign(new Error(message.error), { status: message.status }));
+    }
+}
+
+// Start a turn on the socket: send(socket) sends its opening message(s).
+// A turn still in progress is cancelled by the server and rejected here as superseded.
+function beginSocketTurn(handlers, send) {
+    return openConsultationSocket().then(socket => new Promise((resolve, reject) => {
+        finishSocketTurn(Object.assign(new Error('Superseded by a new turn'), { superseded: true }));
+        socketTurnNumber += 1;
+        socketTurn = Object.assign({ resolve: resolve, reject: reject }, handlers);
+        send(socket);
+    }));
+}
+
+// Same contract as streamConsultationChat, over the consultation WebSocket.
+// Falls back to HTTP streaming if the socket cannot be opened.
+function streamConsultationSocket(payload, onPatient, onDelta, onAudio) {
+    const handlers = { onPatient: onPatient, onDelta: onDelta, onAudio: onAudio };
+    return beginSocketTurn(handlers, socket => {
+        socket.send(JSON.stringify(Object.assign({ type: 'text', speak: !!onAudio }, payload)));
+    }).catch(error => {
+        if (consultationSocketFailed && !error.status && !error.superseded) {
+            return streamConsultationChat(payload, onPatient, onDelta, onAudio);
+        }
+        throw error;
+    });
+}
+
+// Stop the reply in progress on the socket (barge-in)
+function cancelSocketTurn() {
+    if (!socketTurn || !consultationSocket) return;
+    finishSocketTurn(Object.assign(new Error('Cancelled'), { superseded: true }));
+    consultationSocket.then(socket => socket.send(JSON.stringify({ type: 'cancel' })), () => {});
+}
+
+// Render a streamed reply: returns the stream callbacks plus finish/fail for the outcome
+function streamingReplyView(showSummary) {
+    let placeholderRemoved = false;
+    let bubble = null;
+    let partialText = '';
+
+    function clearPlaceholder() {
+        if (!placeholderRemoved) {
+            removePlaceholderMessage();
+            placeholderRemoved = true;
+        }
+    }
+
+    return {
+        onPatient(existingPatient) {
+            clearPlaceholder();
+            showPatientMatch(existingPatient, showSummary);
+        },
+        onDelta(delta) {
+            clearPlaceholder();
+            if (!bubble) {
+                bubble = createStreamingBotBubble();
+            }
+            partialText += delta;
+            bubble.update(partialText);
+        },
+        // With auto-speech on, audio for each sentence arrives while the reply is still streaming
+        onAudio: autoSpeechEnabled ? segment => {
+            if (segment.index === 0) {
+                stopAudio(); // Cut off the previous reply
+            }
+            enqueueAudioSegment(segment);
+        } : null,
+        rendered() {
+            return placeholderRemoved;
+        },
+        finish(reply) {
+            consultationSessionKey = reply.session_key || consultationSessionKey;
+            clearPlaceholder();
+            if (!bubble) {
+                bubble = createStreamingBotBubble();
+            }
+            bubble.finish(reply.response, reply.audio_segments > 0);
+        },
+        fail(error) {
+            if (error.superseded) {
+                // A newer turn took over: keep what was shown of this one
+                clearPlaceholder();
+                if (bubble) {
+                    bubble.finish(partialText, true);
+                }
+                return;
+            }
+            if (bubble) {
+                bubble.remove();
+            }
+            appendMessage('bot', 'Sorry, there was an error getting advice.');
+        }
+    };
+}
+
+// Get the assistant's reply for a consultation turn, rendering tokens as they arrive.
+// Uses the consultation socket when available, then HTTP streaming, then the non-streaming endpoint.
+function requestConsultationReply(message, showSummary) {
     appendMessage('bot', 'Processing...');
+    const history = conversationHistory.slice(0, -2); // Exclude the current user message and "Processing..." message
+
+    if (!window.fetch || !window.ReadableStream || !window.TextDecoder) {
+        postConsultationChat(message, history, showSummary, true);
+        return;
+    }
+
+    const view = streamingReplyView(showSummary);
+    const stream = window.WebSocket && !consultationSocketFailed ? streamConsultationSocket : streamConsultationChat;
+    stream(consultationPayload(message, history), view.onPatient, view.onDelta, view.onAudio)
+        .then(view.finish)
+        .catch(error => {
+            console.error('Streaming consultation failed:', error);
+            if (error.status === 404) {
+                // Server-side session expired: start a new one from the local history
+                consultationSessionKey = null;
+            }
+            if (!view.rendered() && !error.superseded) {
+                // Nothing rendered yet: retry with the regular endpoint
+                removePlaceholderMessage();
+                appendMessage('bot', 'Processing...');
+                postConsultationChat(message, history, showSummary, false);
+                return;
+            }
+            view.fail(error);
+        });
+}
+
+// Voice turn over the socket: the recording is streamed as it is captured, the server
+// transcribes it and replies on the same connection. Returns the recorder's stop function.
+function recordConsultationTurn(stream, onTranscript, onError) {
+    const recorder = new MediaRecorder(stream);
+    const contentType = (recorder.mimeType || 'audio/webm').split(';')[0];
+    const history = conversationHistory.slice();
+    let view = null;
+    let transcript = null;
+    let active = true; // False once the turn failed or was superseded: don't submit the recording
+
+    const turn = beginSocketTurn({
+        onTranscript: text => {
+            transcript = text;
+            onTranscript(text);
+            appendMessage('bot', 'Processing...');
+            view = streamingReplyView(false);
+        },
+        onPatient: payload => view.onPatient(payload),
+        onDelta: delta => view.onDelta(delta),
+        onAudio: segment => view.onAudio && view.onAudio(segment)
+    }, socket => {
+        const payload = Object.assign({ type: 'audio_start', filename: 'recording.webm', content_type: contentType, speak: autoSpeechEnabled },
+            consultationPayload(undefined, history));
+        delete payload.message;
+        socket.send(JSON.stringify(payload));
+        recorder.ondataavailable = event => {
+            if (event.data.size > 0) {
+                socket.send(event.data);
+            }
+        };
+        recorder.onstop = () => {
+            stream.getTracks().forEach(track => track.stop());
+            if (active) {
+                socket.send(JSON.stringify({ type: 'audio_end' }));
+            }
+        };
+        recorder.start(250); // Send audio every 250 ms while recording
+    });
+
+    turn.then(reply => view.finish(reply))
+        .catch(error => {
+            console.error('Voice turn failed:', error);
+            active = false;
+            if (recorder.state !== 'inactive') {
+                recorder.stop();
+            }
+            stream.getTracks().forEach(track => track.stop());
+            if (!view) {
+                if (!error.superseded) onError(error);
+                return;
+            }
+            if (!view.rendered() && !error.superseded) {
+                removePlaceholderMessage();
+                appendMessage('bot', 'Processing...');
+                postConsultationChat(transcript, history, false, true);
+                return;
+            }
+            view.fail(error);
+        });
+
+    return () => {
+        if (recorder.state !== 'inactive') {
+            recorder.stop();
+        }
+    };
+}
 
+// Non-streaming consultation request (fallback path)
+function postConsultationChat(message, history, showSummary, retryExpiredSession) {
     // Use consultation_chat endpoint for structured consultation
-    axios.post('/consultation_chat', {
-        message: text,
-        history: conversationHistory.slice(0, -2) // Exclude the current user message and "Processing..." message
-    })
+    axios.post('/consultation_chat', consultationPayload(message, history))
         .then(res => {
+            console.log('API response received:', res.data);
+            consultationSessionKey = res.data.session_key || consultationSessionKey;
             // Remove last 'Processing...' message
-            const lastBotMsg = chatWindow.querySelector('.er-bubble.bot:last-child');
-            if (lastBotMsg) {
-                lastBotMsg.remove();
-                conversationHistory.pop(); // Remove "Processing..." from history
-            }
-
-            // Check if an existing patient was found
-            if (res.data.existing_patient && res.data.existing_patient.found) {
-                currentPatient = res.data.existing_patient;
-                isReturningPatient = true;
-console.log('Returning patient found:', currentPatient);
-                // Show returning patient notification
-                const welcomeMessage = `Welcome back, ${currentPatient.name}! I found your previous medical record from ${currentPatient.last_consultation}. Let me review your information and focus on any new concerns or updates since your last visit.`;
-                appendMessage('bot', welcomeMessage);
-
-                // Show patient summary
-                if (currentPatient.summary) {
-                    const summaryMessage = `Here's a summary of your existing information: ${currentPatient.summary}`;
-                    appendMessage('bot', summaryMessage);
-                }
+            removePlaceholderMessage();
+
+            // Check if an existing patient (or near-miss candidates) was found
+            if (res.data.existing_patient) {
+                showPatientMatch(res.data.existing_patient, showSummary);
             }
 
             appendMessage('bot', res.data.response);
         })
-        .catch(() => {
-            const lastBotMsg = chatWindow.querySelector('.er-bubble.bot:last-child');
-            if (lastBotMsg) {
-                lastBotMsg.remove();
-                conversationHistory.pop(); // Remove "Processing..." from history
+        .catch(error => {
+            console.error('API call failed:', error);
+            if (error.response && error.response.status === 404 && consultationSessionKey) {
+                // Server-side session expired: start a new one from the local history
+                consultationSessionKey = null;
+                if (retryExpiredSession) {
+                    postConsultationChat(message, history, showSummary, false);
+                    return;
+                }
             }
+            removePlaceholderMessage();
             appendMessage('bot', 'Sorry, there was an error getting advice.');
         });
 }
@@ -194,32 +687,21 @@ function speakText(text) {
     // Stop any currently playing audio
     stopAudio();
 
-    axios.post('/text-to-speech', { text: text })
+    // Ask for raw MP3 so playback can start before the whole clip has arrived
+    fetch('/text-to-speech', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', 'Accept': 'audio/mpeg' },
+        body: JSON.stringify({ text: text })
+    })
         .then(response => {
-            const audioBase64 = response.data.audio;
-            if (audioBase64) {
-                // Convert base64 to audio blob and play
-                const audioBlob = base64ToBlob(audioBase64, 'audio/mpeg');
-                const audioUrl = URL.createObjectURL(audioBlob);
-                currentAudio = new Audio(audioUrl);
-
-                // Add event listener to clean up when audio ends
-                currentAudio.addEventListener('ended', () => {
-                    currentAudio = null;
-                    URL.revokeObjectURL(audioUrl);
-                });
-
-                // Add event listener to clean up on error
-                currentAudio.addEventListener('error', () => {
-                    currentAudio = null;
-                    URL.revokeObjectURL(audioUrl);
-                });
-
-                currentAudio.play().catch(error => {
-                    console.error('Error playing audio:', error);
-                    currentAudio = null;
-                    URL.revokeObjectURL(audioUrl);
-                });
+            if (!response.ok) {
+                throw new Error(`Text-to-speech request failed with status ${response.status}`);
+            }
+            const contentType = response.headers.get('Content-Type') || 'audio/mpeg';
+            if (response.body && window.MediaSource && MediaSource.isTypeSupported(contentType)) {
+                playAudioStream(response, contentType, text);
+            } else {
+                return response.blob().then(playAudioBlob);
             }
         })
         .catch(error => {
@@ -229,8 +711,149 @@ function speakText(text) {
         });
 }
 
+// Play a complete audio blob
+function playAudioBlob(blob) {
+    const audioUrl = URL.createObjectURL(blob);
+    const audio = new Audio(audioUrl);
+    currentAudio = audio;
+
+    // Clean up when audio ends or fails
+    const cleanup = () => {
+        if (currentAudio === audio) {
+            currentAudio = null;
+        }
+        URL.revokeObjectURL(audioUrl);
+    };
+    audio.addEventListener('ended', cleanup);
+    audio.addEventListener('error', cleanup);
+
+    audio.play().catch(error => {
+        console.error('Error playing audio:', error);
+        cleanup();
+    });
+}
+
+// Play audio while it is still downloading by appending chunks to a MediaSource
+function playAudioStream(response, contentType, text) {
+    const mediaSource = new MediaSource();
+    const audioUrl = URL.createObjectURL(mediaSource);
+    const audio = new Audio(audioUrl);
+    currentAudio = audio;
+    let failed = false;
+
+    const cleanup = () => {
+        if (currentAudio === audio) {
+            currentAudio = null;
+        }
+        URL.revokeObjectURL(audioUrl);
+    };
+    const fail = error => {
+        if (failed) {
+            return;
+        }
+        failed = true;
+        console.error('Error streaming audio:', error);
+        const stopped = currentAudio !== audio;
+        audio.pause();
+        cleanup();
+        if (!stopped) {
+            fallbackTextToSpeech(text);
+        }
+    };
+    audio.addEventListener('ended', cleanup);
+    audio.addEventListener('error', () => fail(audio.error));
+
+    mediaSource.addEventListener('sourceopen', () => {
+        const sourceBuffer = mediaSource.addSourceBuffer(contentType);
+        const reader = response.body.getReader();
+        const appendChunk = chunk => new Promise((resolve, reject) => {
+            sourceBuffer.addEventListener('updateend', resolve, { once: true });
+            sourceBuffer.addEventListener('error', reject, { once: true });
+            sourceBuffer.appendBuffer(chunk);
+        });
+        const pump = () => reader.read().then(({ done, value }) => {
+            if (currentAudio !== audio) {
+                // Stopped (or replaced by newer audio) while downloading
+                reader.cancel();
+                return;
+            }
+            if (done) {
+                if (mediaSource.readyState === 'open') {
+                    mediaSource.endOfStream();
+                }
+                return;
+            }
+            return appendChunk(value).then(pump);
+        });
+        pump().catch(fail);
+    }, { once: true });
+
+    audio.play().catch(error => {
+        // e.g. autoplay blocked or stopped before playback began; decoding errors are handled by fail()
+        console.error('Error playing audio:', error);
+    });
+}
+
+// Play streamed reply audio segments one after another, in order
+function enqueueAudioSegment(segment) {
+    audioQueue.push(segment);
+    if (!audioQueuePlaying) {
+        playNextAudioSegment();
+    }
+}
+
+function playNextAudioSegment() {
+    const segment = audioQueue.shift();
+    if (!segment) {
+        audioQueuePlaying = false;
+        return;
+    }
+    audioQueuePlaying = true;
+
+    if (!segment.audio && !segment.audioData) {
+        // Synthesis failed for this sentence: use the browser's voice for it
+        if ('speechSynthesis' in window) {
+            const utterance = new SpeechSynthesisUtterance(segment.text);
+            utterance.rate = 0.8;
+            utterance.onend = () => {
+                if (!currentAudio) {
+                    playNextAudioSegment();
+                }
+            };
+            speechSynthesis.speak(utterance);
+        } else {
+            playNextAudioSegment();
+        }
+        return;
+    }
+
+    const blob = segment.audioData
+        ? new Blob([segment.audioData], { type: segment.content_type || 'audio/mpeg' }) // Sent as binary over the socket
+        : base64ToBlob(segment.audio, 'audio/mpeg');
+    const audioUrl = URL.createObjectURL(blob);
+    const audio = new Audio(audioUrl);
+    currentAudio = audio;
+    const playNext = () => {
+        URL.revokeObjectURL(audioUrl);
+        if (currentAudio === audio) {
+            currentAudio = null;
+            playNextAudioSegment();
+        }
+    };
+    audio.addEventListener('ended', playNext);
+    audio.addEventListener('error', playNext);
+    audio.play().catch(error => {
+        console.error('Error playing audio segment:', error);
+        playNext();
+    });
+}
+
 // Function to stop current audio playback
 function stopAudio() {
+    // Drop queued reply segments
+    audioQueue = [];
+    audioQueuePlaying = false;
+
     // Stop Azure TTS audio
     if (currentAudio) {
         currentAudio.pause();
@@ -307,6 +930,11 @@ if (micBtn) {
         
         // Check if browser supports speech recognition
         if (!('webkitSpeechRecognition' in window) && !('SpeechRecognition' in window)) {
+            if (window.WebSocket && window.MediaRecorder && !consultationSocketFailed) {
+                // Record and let the server transcribe over the consultation socket
+                startServerRecognition();
+                return;
+            }
             console.log('Speech recognition not supported');
             appendMessage('bot', 'Speech recognition not supported in this browser. Please use Chrome, Edge, or Safari.');
             return;
@@ -441,6 +1069,44 @@ if (micBtn) {
         }
     }
 
+    // Remove the "Listening..." message
+    function removeListeningMessage() {
+        const lastBotMsg = chatWindow.querySelector('.er-bubble.bot:last-child');
+        if (lastBotMsg && lastBotMsg.textContent.includes('Listening...')) {
+            lastBotMsg.remove();
+            conversationHistory.pop();
+        }
+    }
+
+    function startServerRecognition() {
+        stopAudio();
+        cancelSocketTurn(); // Barge-in: stop the reply that is still streaming
+        navigator.mediaDevices.getUserMedia({ audio: true })
+            .then(stream => {
+                isRecording = true;
+                micBtn.style.backgroundColor = '#ff4444';
+                micBtn.innerHTML = '🛑'; // Stop icon
+                const stop = recordConsultationTurn(stream,
+                    text => {
+                        removeListeningMessage();
+                        appendMessage('patient', text);
+                    },
+                    error => {
+                        stopSpeechRecognition();
+                        removeListeningMessage();
+                        appendMessage('bot', error.status === 400
+                            ? 'No speech was detected. Please try again.'
+                            : 'Could not transcribe your recording. Please try typing instead.');
+                    });
+                recognition = { stop: stop };
+                appendMessage('bot', 'Listening... Speak now, then click the microphone again to stop.');
+            })
+            .catch(error => {
+                console.error('Microphone access failed:', error);
+                appendMessage('bot', 'Microphone access was denied. Please allow microphone access and try again.');
+            });
+    }
+
     function stopSpeechRecognition() {
         if (recognition && isRecording) {
             recognition.stop();
@@ -458,54 +1124,15 @@ function sendMessageToConsultation(message) {
     console.log('=== sendMessageToConsultation CALLED ===');
     console.log('Message received:', message);
     console.log('Current conversation history length:', conversationHistory.length);
-    
-    appendMessage('bot', 'Processing...');
-    console.log('Added Processing message, starting API call');
 
-    // Use consultation_chat endpoint for structured consultation
-    axios.post('/consultation_chat', {
-        message: message,
-        history: conversationHistory.slice(0, -2) // Exclude the current user message and "Processing..." message
-    })
-        .then(res => {
-            console.log('API response received:', res.data);
-            const lastBotMsg = chatWindow.querySelector('.er-bubble.bot:last-child');
-            if (lastBotMsg) {
-                lastBotMsg.remove();
-                conversationHistory.pop(); // Remove "Processing..." from history
-                console.log('Removed processing message');
-            }
-
-            // Check if an existing patient was found
-            if (res.data.existing_patient && res.data.existing_patient.found) {
-                currentPatient = res.data.existing_patient;
-                isReturningPatient = true;
-                console.log('Found returning patient:', currentPatient.name);
-
-                // Show returning patient notification
-                const welcomeMessage = `Welcome back, ${currentPatient.name}! I found your previous medical record from ${currentPatient.last_consultation}.`;
-                appendMessage('bot', welcomeMessage);
-            }
-
-            console.log('Adding bot response:', res.data.response);
-            appendMessage('bot', res.data.response);
-        })
-        .catch(error => {
-            console.error('API call failed:', error);
-            const lastBotMsg = chatWindow.querySelector('.er-bubble.bot:last-child');
-            if (lastBotMsg) {
-                lastBotMsg.remove();
-                conversationHistory.pop(); // Remove "Processing..." from history
-            }
-            appendMessage('bot', 'Sorry, there was an error getting advice.');
-        });
+    requestConsultationReply(message, false);
 }
 
 // Restart button
 if (restartBtn) {
     restartBtn.onclick = function () {
         clearChat();
-        appendMessage('bot', 'Welcome to your comprehensive medical consultation! I\'m here to gather detailed information about your health, medical history, and current concerns. If you\'ve been here before, I can access your previous medical records to save time. This consultation will help create a complete medical record that can be shared with healthcare providers. Let\'s begin with your basic information: What is your full name?');
+        appendMessage('bot', WELCOME_MESSAGE);
     };
 }
 
@@ -523,11 +1150,14 @@ if (generateReportBtn) {
         const patientName = extractPatientName(conversationHistory);
 
         if (patientName) {
-            // Save patient information
-            axios.post('/save_patient', {
-                name: patientName,
-                history: conversationHistory.slice(0, -1)
-            })
+            // Save patient information (the server already has the transcript when a session exists)
+            const savePayload = consultationSessionKey
+                ? { name: patientName, session_key: consultationSessionKey }
+                : { name: patientName, history: conversationHistory.slice(0, -1) };
+            if (currentPatient && currentPatient.id) {
+                savePayload.patient_id = currentPatient.id; // A record the patient confirmed
+            }
+            axios.post('/save_patient', savePayload)
                 .then(() => {
                     console.log('Patient data saved successfully');
                 })
@@ -536,101 +1166,103 @@ if (generateReportBtn) {
                 });
         }
 
-        // Generate report
-        axios.post('/generate_report', {
-            history: conversationHistory.slice(0, -1) // Exclude the "Generating..." message
-        })
-            .then(res => {
-                // Remove last 'Generating...' message
-                const lastBotMsg = chatWindow.querySelector('.er-bubble.bot:last-child');
-                if (lastBotMsg) {
-                    lastBotMsg.remove();
-                    conversationHistory.pop(); // Remove "Generating..." from history
-                }
+        // Generate report: the report page streams it from /generate_report as it is written
+        sessionStorage.removeItem('medicalReport');
+        sessionStorage.removeItem('medicalReportPending');
+        const reportRequest = consultationSessionKey
+            ? { session_key: consultationSessionKey, mode: 'sections' }
+            : { history: conversationHistory.slice(0, -1), mode: 'sections' }; // Exclude the "Generating..." message
+        sessionStorage.setItem('medicalReportRequest', JSON.stringify(reportRequest));
+        reportWindow = window.open('/medical_report', '_blank');
+
+        // Remove last 'Generating...' message
+        removePlaceholderMessage();
+        showReportBubble();
+    };
+}
 
-                // Store report data in sessionStorage for the report page
-                sessionStorage.setItem('medicalReport', res.data.report);
-
-                // Create report ready message with button to view report
-                const reportBubble = document.createElement('div');
-                reportBubble.className = 'er-bubble bot report-bubble';
-
-                const iconDiv = document.createElement('div');
-                iconDiv.className = 'er-bot-icon';
-                iconDiv.innerHTML = botSVG;
-
-                const contentDiv = document.createElement('div');
-                contentDiv.className = 'er-bubble-content report-content';
-                contentDiv.innerHTML = `
-                    <h3>📋 Medical Report Generated Successfully!</h3>
-                    <p>Your comprehensive medical consultation report has been prepared and is ready for review.</p>
-                    <p><strong>Report includes:</strong></p>
-                    <ul>
-                        <li>Patient identification and contact information</li>
-                        <li>Vital signs and measurements</li>
-                        <li>Medical history and current medications</li>
-                        <li>Lifestyle assessment</li>
-                        <li>Clinical recommendations</li>
-                        <li>Medical records authorization status</li>
-                    </ul>
-                    <p>Click the button below to view your detailed medical report in a professional format.</p>
-                `;
-
-                // Add view report button
-                const viewReportBtn = document.createElement('button');
-                viewReportBtn.textContent = '📋 View Medical Report';
-                viewReportBtn.className = 'view-report-btn';
-                viewReportBtn.style.cssText = `
-                    background: linear-gradient(135deg, #3182ce, #2c5282);
-                    color: white;
-                    border: none;
-                    padding: 15px 25px;
-                    border-radius: 8px;
-                    font-size: 1.1rem;
-                    font-weight: 600;
-                    cursor: pointer;
-                    margin: 15px 10px 5px 0;
-                    transition: all 0.3s ease;
-                    box-shadow: 0 4px 12px rgba(49, 130, 206, 0.3);
-                `;
-                viewReportBtn.onmouseover = function () {
-                    this.style.background = 'linear-gradient(135deg, #2c5282, #2a4365)';
-                    this.style.transform = 'translateY(-2px)';
-                    this.style.boxShadow = '0 6px 16px rgba(49, 130, 206, 0.4)';
-                };
-                viewReportBtn.onmouseout = function () {
-                    this.style.background = 'linear-gradient(135deg, #3182ce, #2c5282)';
-                    this.style.transform = 'translateY(0)';
-                    this.style.boxShadow = '0 4px 12px rgba(49, 130, 206, 0.3)';
-                };
-                viewReportBtn.onclick = function () {
-                    window.open('/medical_report', '_blank');
-                };
-
-                // Add download button for backup
-                const downloadBtn = document.createElement('button');
-                downloadBtn.textContent = '💾 Download Backup';
-                downloadBtn.className = 'download-report-btn';
-                downloadBtn.onclick = function () {
-                    downloadReport(res.data.report);
-                };
-
-                contentDiv.appendChild(viewReportBtn);
-                contentDiv.appendChild(downloadBtn);
-                reportBubble.appendChild(iconDiv);
-                reportBubble.appendChild(contentDiv);
-                chatWindow.appendChild(reportBubble);
-                chatWindow.scrollTop = chatWindow.scrollHeight;
-            })
-            .catch(() => {
-                const lastBotMsg = chatWindow.querySelector('.er-bubble.bot:last-child');
-                if (lastBotMsg) {
-                    lastBotMsg.remove();
-                    conversationHistory.pop(); // Remove "Generating..." from history
-                }
-                appendMessage('bot', 'Sorry, there was an error generating the report. Please try again.');
-            });
+// Report message with buttons to view or download the report
+function showReportBubble() {
+    // Create report ready message with button to view report
+    const reportBubble = document.createElement('div');
+    reportBubble.className = 'er-bubble bot report-bubble';
+
+    const iconDiv = document.createElement('div');
+    iconDiv.className = 'er-bot-icon';
+    iconDiv.innerHTML = botSVG;
+
+    const contentDiv = document.createElement('div');
+    contentDiv.className = 'er-bubble-content report-content';
+    contentDiv.innerHTML = `
+        <h3>📋 Medical Report In Progress</h3>
+        <p>Your comprehensive medical consultation report is being written in the report tab and appears there section by section.</p>
+        <p><strong>Report includes:</strong></p>
+        <ul>
+            <li>Patient identification and contact information</li>
+            <li>Vital signs and measurements</li>
+            <li>Medical history and current medications</li>
+            <li>Lifestyle assessment</li>
+            <li>Clinical recommendations</li>
+            <li>Medical records authorization status</li>
+        </ul>
+        <p>Click the button below to view your detailed medical report in a professional format.</p>
+    `;
+
+    // Add view report button
+    const viewReportBtn = document.createElement('button');
+    viewReportBtn.textContent = '📋 View Medical Report';
+    viewReportBtn.className = 'view-report-btn';
+    viewReportBtn.style.cssText = `
+        background: linear-gradient(135deg, #3182ce, #2c5282);
+        color: white;
+        border: none;
+        padding: 15px 25px;
+        border-radius: 8px;
+        font-size: 1.1rem;
+        font-weight: 600;
+        cursor: pointer;
+        margin: 15px 10px 5px 0;
+        transition: all 0.3s ease;
+        box-shadow: 0 4px 12px rgba(49, 130, 206, 0.3);
+    `;
+    viewReportBtn.onmouseover = function () {
+        this.style.background = 'linear-gradient(135deg, #2c5282, #2a4365)';
+        this.style.transform = 'translateY(-2px)';
+        this.style.boxShadow = '0 6px 16px rgba(49, 130, 206, 0.4)';
+    };
+    viewReportBtn.onmouseout = function () {
+        this.style.background = 'linear-gradient(135deg, #3182ce, #2c5282)';
+        this.style.transform = 'translateY(0)';
+        this.style.boxShadow = '0 4px 12px rgba(49, 130, 206, 0.3)';
     };
+    viewReportBtn.onclick = function () {
+        // While the report tab is still streaming, bring it back instead of generating the report again
+        if (!sessionStorage.getItem('medicalReport') && reportWindow && !reportWindow.closed) {
+            reportWindow.focus();
+            return;
+        }
+        reportWindow = window.open('/medical_report', '_blank');
+    };
+
+    // Add download button for backup
+    const downloadBtn = document.createElement('button');
+    downloadBtn.textContent = '💾 Download Backup';
+    downloadBtn.className = 'download-report-btn';
+    downloadBtn.onclick = function () {
+        const reportText = sessionStorage.getItem('medicalReport');
+        if (reportText) {
+            downloadReport(reportText);
+        } else {
+            alert('The report is still being generated. Please try again in a moment.');
+        }
+    };
+
+    contentDiv.appendChild(viewReportBtn);
+    contentDiv.appendChild(downloadBtn);
+    reportBubble.appendChild(iconDiv);
+    reportBubble.appendChild(contentDiv);
+    chatWindow.appendChild(reportBubble);
+    chatWindow.scrollTop = chatWindow.scrollHeight;
 }
 
 // Function to download report as text file
@@ -678,7 +1310,7 @@ window.addEventListener('DOMContentLoaded', function () {
     // Only show consultation greeting if we're on the consultation page
     if (chatWindow) {
         clearChat();
-        const welcomeMessage = 'Welcome to your comprehensive medical consultation! I\'m here to gather detailed information about your health, medical history, and current concerns. If you\'ve been here before, I can access your previous medical records to save time. This consultation will help create a complete medical record that can be shared with healthcare providers. Let\'s begin with your basic information: What is your full name?';
+        const welcomeMessage = WELCOME_MESSAGE;
 
         appendMessage('bot', welcomeMessage);
 /*
@@ -0,0 +1,98 @@
+"""Memory-bounded handling of uploaded audio.
+
+Uploaded files are kept in memory up to a threshold and spooled to a
+temporary file beyond it, then forwarded to the STT upstream straight from
+that file object (httpx streams multipart file fields in chunks), so an
+upload is never materialized as one bytes object.
+"""
+import os
+import sys
+import threading
+from tempfile import SpooledTemporaryFile
+from flask import Request, current_app
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_SPOOL_BYTES = 1024 * 1024
+
+_stats_lock = threading.Lock()
+_stats = {"uploads": 0, "upload_bytes": 0, "spooled_to_disk": 0, "rejected_too_large": 0, "largest_upload_bytes": 0}
+
+
+class SpooledRequest(Request):
+    """Flask request whose file uploads spill to disk above UPLOAD_SPOOL_BYTES."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        max_size = current_app.config.get("UPLOAD_SPOOL_BYTES", DEFAULT_SPOOL_BYTES)
+        return SpooledTemporaryFile(max_size=max_size, mode="rb+")
+
+
+class UploadBody:
+    """Read-only view of an upload for use as an httpx multipart file.
+
+    Hides fileno() so httpx sizes the body with seek/tell instead of forcing
+    an in-memory SpooledTemporaryFile onto disk. httpx rewinds the file before
+    each send, so retried requests resend the whole upload.
+    """
+
+    def __init__(self, file):
+        self._file = file
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+
+def upload_size(file):
+    """Size in bytes of a seekable upload, leaving its position unchanged."""
+    position = file.tell()
+    size = file.seek(0, os.SEEK_END)
+    file.seek(position)
+    return size
+
+
+def record_upload(file, size):
+    """Count an accepted upload and whether it was spooled to disk."""
+    on_disk = getattr(file, "_rolled", True)  # Anything but an in-memory SpooledTemporaryFile
+    with _stats_lock:
+        _stats["uploads"] += 1
+        _stats["upload_bytes"] += size
+        _stats["largest_upload_bytes"] = max(_stats["largest_upload_bytes"], size)
+        if on_disk:
+            _stats["spooled_to_disk"] += 1
+
+
+def record_rejected_upload():
+    with _stats_lock:
+        _stats["rejected_too_large"] += 1
+
+
+def _current_rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def memory_stats():
+    """Resident memory now and its high-water mark for this process, in bytes."""
+    max_rss = None
+    if resource is not None:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != "darwin":
+            max_rss *= 1024  # Reported in kilobytes except on macOS
+    return {"rss_bytes": _current_rss_bytes(), "max_rss_bytes": max_rss}
+
+
+def upload_stats():
+    with _stats_lock:
+        return dict(_stats)
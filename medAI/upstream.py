@@ -0,0 +1,426 @@
+"""Resilient calls to the Azure upstreams (LLM, STT, TTS).
+
+Every upstream call goes through an Upstream policy that:
+- retries transient failures (connection errors, 408/429/5xx) a bounded number
+  of times with jittered exponential backoff, honoring Retry-After;
+- opens a circuit after sustained failures so requests are shed immediately
+  (UpstreamUnavailable, served as 503) until a trial call succeeds;
+- optionally hedges idempotent calls: if the first attempt is slower than the
+  recent p95 latency, a second identical request is sent and the first
+  response wins;
+- keeps per-upstream counters and latency percentiles for /metrics.
+
+Sync (call_upstream) and async (acall_upstream) entry points share the same
+policy objects, so the Flask and ASGI apps see one circuit per upstream.
+"""
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from email.utils import parsedate_to_datetime
+import httpx
+import openai
+
+UPSTREAM_NAMES = ("llm", "stt", "tts")
+
+# Retry and circuit breaker configuration (overridable via environment variables)
+MAX_RETRIES = int(os.environ.get("MEDAI_UPSTREAM_MAX_RETRIES", "2"))
+BACKOFF_BASE = float(os.environ.get("MEDAI_UPSTREAM_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.environ.get("MEDAI_UPSTREAM_BACKOFF_MAX", "8.0"))
+MAX_RETRY_AFTER = float(os.environ.get("MEDAI_UPSTREAM_MAX_RETRY_AFTER", "10.0"))  # Longer waits fail fast instead
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("MEDAI_CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.environ.get("MEDAI_CIRCUIT_RESET_TIMEOUT", "30.0"))
+CIRCUIT_TRIAL_TIMEOUT = float(os.environ.get("MEDAI_CIRCUIT_TRIAL_TIMEOUT", "120.0"))  # A trial silent this long is abandoned
+
+# Hedging is off unless enabled per upstream, e.g. MEDAI_HEDGE_UPSTREAMS=llm,tts
+HEDGE_UPSTREAMS = {name.strip() for name in os.environ.get("MEDAI_HEDGE_UPSTREAMS", "").split(",") if name.strip()}
+HEDGE_MIN_SAMPLES = int(os.environ.get("MEDAI_HEDGE_MIN_SAMPLES", "20"))
+LATENCY_WINDOW = 200
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+_hedge_executor = ThreadPoolExecutor(max_workers=int(os.environ.get("MEDAI_HEDGE_WORKERS", "16")))
+
+
+class UpstreamUnavailable(Exception):
+    """Raised without calling the upstream while its circuit is open."""
+
+    def __init__(self, upstream, retry_after):
+        super().__init__(f"{upstream} upstream unavailable (circuit open)")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+def parse_retry_after(headers):
+    """Seconds to wait from Retry-After / retry-after-ms headers, or None."""
+    if headers is None:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000.0)
+        except ValueError:
+            pass
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def classify_error(error):
+    """Return (retryable, retry_after seconds or None) for an exception raised by an upstream call."""
+    if isinstance(error, httpx.HTTPStatusError):
+        status, headers = error.response.status_code, error.response.headers
+    elif isinstance(error, openai.APIStatusError):
+        status, headers = error.status_code, error.response.headers
+    elif isinstance(error, (httpx.TransportError, openai.APIConnectionError)):
+        return True, None
+    else:
+        return False, None
+    if status not in RETRYABLE_STATUS:
+        return False, None
+    return True, parse_retry_after(headers)
+
+
+class CircuitBreaker:
+    """Closed -> open after `failure_threshold` consecutive failures -> half-open after `reset_timeout`.
+
+    In the half-open state a single trial call is let through; its outcome
+    closes or re-opens the circuit. A trial that ends without an outcome
+    (cancelled) frees the slot via release_trial(), and one that has not
+    reported back after `trial_timeout` is presumed lost, so the next call
+    becomes the trial.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, trial_timeout=120.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.trial_timeout = trial_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self._trial_in_flight = False
+        self._trial_started = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self, upstream):
+        """Raise UpstreamUnavailable if the call must be shed; return True if the call is the half-open trial."""
+        with self._lock:
+            if self.state == "closed":
+                return False
+            now = time.monotonic()
+            remaining = self.opened_at + self.reset_timeout - now
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open" and (not self._trial_in_flight or now - self._trial_started >= self.trial_timeout):
+                self._trial_in_flight = True
+                self._trial_started = now
+                return True
+            raise UpstreamUnavailable(upstream, max(remaining, 1.0))
+
+    def release_trial(self):
+        """Free the half-open trial slot without a verdict (the trial call was cancelled or interrupted)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.opens += 1
+            self._trial_in_flight = False
+
+    def is_open(self):
+        with self._lock:
+            return self.state == "open"
+
+
+class Upstream:
+    """Retry, circuit breaker, hedging and counters for one upstream."""
+
+    def __init__(self, name, max_retries=MAX_RETRIES, hedge=False):
+        self.name = name
+        self.max_retries = max_retries
+        self.hedge = hedge
+        self.breaker = CircuitBreaker(CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_TIMEOUT, CIRCUIT_TRIAL_TIMEOUT)
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self.stats = {
+            "calls": 0, "successes": 0, "failures": 0, "retries": 0,
+            "rejected": 0, "hedges": 0, "hedge_wins": 0,
+        }
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def _record_latency(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def percentile(self, fraction):
+        """Latency percentile (seconds) over the recent successful calls, or None."""
+        with self._lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, int(math.ceil(fraction * len(samples))) - 1))
+        return samples[index]
+
+    def _hedge_delay(self, hedge):
+        """Seconds to wait before sending a hedged request, or None to not hedge."""
+        if not (hedge and self.hedge):
+            return None
+        with self._lock:
+            if len(self._latencies) < HEDGE_MIN_SAMPLES:
+                return None
+        return self.percentile(0.95)
+
+    def _backoff(self, attempt, retry_after):
+        """Delay before the next attempt, or None if Retry-After asks for longer than we are willing to wait."""
+        if retry_after is not None:
+            if retry_after > MAX_RETRY_AFTER:
+                return None
+            return retry_after + random.uniform(0, BACKOFF_BASE)
+        # Full jitter: uniform in [0, min(cap, base * 2^attempt)]
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+    def _before_call(self):
+        """Count the call and check the breaker; True if the call is the half-open trial."""
+        self._count("calls")
+        try:
+            return self.breaker.before_call(self.name)
+        except UpstreamUnavailable:
+            self._count("rejected")
+            raise
+
+    def _handle_error(self, error, attempt):
+        """Update the breaker for a failed attempt; return the retry delay or None to give up."""
+        retryable, retry_after = classify_error(error)
+        if not retryable:
+            if isinstance(error, (httpx.HTTPStatusError, openai.APIStatusError)):
+                # The upstream answered (e.g. 400/401): not an outage
+                self.breaker.record_success()
+            # Anything else (e.g. a bug parsing the response) says nothing about the upstream;
+            # a half-open trial that ends this way is freed by the caller's release_trial()
+            self._count("failures")
+            return None
+        self.breaker.record_failure()
+        delay = None
+        if attempt < self.max_retries and not self.breaker.is_open():
+            delay = self._backoff(attempt, retry_after)
+        if delay is None:
+            self._count("failures")
+            return None
+        self._count("retries")
+        print(f"Upstream {self.name} attempt {attempt + 1} failed ({str(error).splitlines()[0] if str(error) else type(error).__name__}); retrying in {delay:.2f}s")
+        return delay
+
+    def _record_success(self, started):
+        self.breaker.record_success()
+        self._record_latency(time.monotonic() - started)
+        self._count("successes")
+
+    def call(self, fn, hedge=False):
+        """Call fn() (one upstream request) under this upstream's policy.
+
+        hedge=True marks the request as safe to send twice (idempotent, replayable body).
+        """
+        trial = self._before_call()
+        try:
+            attempt = 0
+            while True:
+                started = time.monotonic()
+                try:
+                    result = self._attempt(fn, self._hedge_delay(hedge))
+                except Exception as e:
+                    delay = self._handle_error(e, attempt)
+                    if delay is None:
+                        raise
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+                self._record_success(started)
+                return result
+        finally:
+            if trial:
+                # Success and failure already settled the trial; anything else (e.g. an interrupt) must free it
+                self.breaker.release_trial()
+
+    def _attempt(self, fn, hedge_delay):
+        if hedge_delay is None:
+            return fn()
+        primary = _hedge_executor.submit(fn)
+        done, _ = wait([primary], timeout=hedge_delay)
+        if done:
+            return primary.result()
+        self._count("hedges")
+        hedged = _hedge_executor.submit(fn)
+        pending = {primary, hedged}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedged:
+                        self._count("hedge_wins")
+                    # The losing request cannot be interrupted; its result is discarded
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def acall(self, fn, hedge=False):
+        """Async version of call: fn() returns an awaitable performing one upstream request."""
+        trial = self._before_call()
+        try:
+            attempt = 0
+            while True:
+                started = time.monotonic()
+                try:
+                    result = await self._aattempt(fn, self._hedge_delay(hedge))
+                except Exception as e:
+                    delay = self._handle_error(e, attempt)
+                    if delay is None:
+                        raise
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                self._record_success(started)
+                return result
+        finally:
+            if trial:
+                # Settled by success or failure; a cancelled trial (asyncio.CancelledError) must free the slot
+                self.breaker.release_trial()
+
+    async def _aattempt(self, fn, hedge_delay):
+        if hedge_delay is None:
+            return await fn()
+        primary = asyncio.ensure_future(fn())
+        done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+        if done:
+            return primary.result()
+        self._count("hedges")
+        hedged = asyncio.ensure_future(fn())
+        pending = {primary, hedged}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedged:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def snapshot(self):
+        """Counters plus circuit state and latency percentiles (ms)."""
+        with self._lock:
+            data = dict(self.stats)
+        p50, p95, p99 = self.percentile(0.5), self.percentile(0.95), self.percentile(0.99)
+        data.update({
+            "circuit": self.breaker.state,
+            "circuit_opens": self.breaker.opens,
+            "hedging": self.hedge,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "p99_ms": round(p99 * 1000, 1) if p99 is not None else None,
+        })
+        return data
+
+
+UPSTREAMS = {name: Upstream(name, hedge=name in HEDGE_UPSTREAMS) for name in UPSTREAM_NAMES}
+
+
+def call_upstream(name, fn, hedge=False):
+    """Run fn() against the named upstream ('llm', 'stt' or 'tts') with retries and circuit breaking."""
+    return UPSTREAMS[name].call(fn, hedge)
+
+
+async def acall_upstream(name, fn, hedge=False):
+    """Async version of call_upstream; fn() returns an awaitable."""
+    return await UPSTREAMS[name].acall(fn, hedge)
+
+
+def _raise_for_status(response):
+    response.raise_for_status()
+    return response
+
+
+def post(name, client, hedge=False, **kwargs):
+    """POST with an httpx.Client through the named upstream; non-2xx responses raise httpx.HTTPStatusError."""
+    return call_upstream(name, lambda: _raise_for_status(client.post(**kwargs)), hedge)
+
+
+async def apost(name, client, hedge=False, **kwargs):
+    """Async version of post for an httpx.AsyncClient."""
+    async def send():
+        return _raise_for_status(await client.post(**kwargs))
+    return await acall_upstream(name, send, hedge)
+
+
+def post_stream(name, client, **kwargs):
+    """POST and return the response once its headers arrive, with the body left unread.
+
+    Only establishing the response is retried; the caller iterates the body
+    (e.g. response.iter_bytes()) and must close the response. Not hedged,
+    since the losing stream could not be cleaned up.
+    """
+    def send():
+        response = client.send(client.build_request("POST", **kwargs), stream=True)
+        if response.is_error:
+            response.read()  # Make the error body available to callers
+            response.close()
+        return _raise_for_status(response)
+    return call_upstream(name, send)
+
+
+async def apost_stream(name, client, **kwargs):
+    """Async version of post_stream; the caller must aclose() the response."""
+    async def send():
+        response = await client.send(client.build_request("POST", **kwargs), stream=True)
+        if response.is_error:
+            await response.aread()
+            await response.aclose()
+        return _raise_for_status(response)
+    return await acall_upstream(name, send)
+
+
+def create_completion(client, **kwargs):
+    """client.chat.completions.create through the 'llm' upstream (non-streaming calls may be hedged)."""
+    return call_upstream("llm", lambda: client.chat.completions.create(**kwargs), hedge=not kwargs.get("stream"))
+
+
+async def acreate_completion(client, **kwargs):
+    """Async version of create_completion for an AsyncAzureOpenAI client."""
+    return await acall_upstream("llm", lambda: client.chat.completions.create(**kwargs), hedge=not kwargs.get("stream"))
+
+
+def upstream_stats():
+    """Per-upstream counters for /metrics."""
+    return {name: upstream.snapshot() for name, upstream in UPSTREAMS.items()}
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Benchmark for patient name lookup (find_patient_by_name in medAI/models.py).
+
+Builds a throwaway SQLite database of synthetic patients (1M by default),
+with name_key left empty as in a database created before the column
+existed, then times:
+
+  - the backfill of name_key and the build of the trigram index
+  - the previous lookup, Patient.full_name.ilike('%name%').first()
+  - find_patient_by_name() for exact names, first names (prefix),
+    surnames (whole-word substring, trigram index) and unknown names
+  - loading the fuzzy name index (medAI/name_index.py), and its search
+    for misheard names (two random letter edits), with how often the
+    intended patient is in the top 5
+
+    python name_lookup_benchmark.py
+    python name_lookup_benchmark.py --patients 100000 --output names.json
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "medAI"))
+from flask import Flask  # noqa: E402
+from models import db, Patient, backfill_name_keys, setup_name_search, find_patient_by_name  # noqa: E402
+from name_index import NameIndex  # noqa: E402
+from names import normalize_name  # noqa: E402
+
+FIRST_NAMES = ["Sarah", "John", "Maria", "José", "Chloé", "Ann", "Anna", "Joanne", "Mohammed", "Wei", "Priya", "Olusegun",
+               "Zoë", "Liam", "Noah", "Emma", "Olivia", "Søren", "Björn", "Aoife", "Raúl", "Hana", "Kenji", "Fatima"]
+SYLLABLES = ["an", "ber", "cor", "dal", "ev", "fitz", "gar", "hol", "ing", "jo", "kov", "lund", "mac", "nor", "ost", "per",
+             "quin", "ros", "son", "thom", "ul", "van", "wick", "yor", "zel"]
+
+
+def synthetic_name(rng):
+    surname = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+    if rng.random() < 0.1:
+        surname = "O'" + surname
+    middle = f" {rng.choice('ABCDEFGHJKLMNPRSTW')}." if rng.random() < 0.3 else ""
+    return f"{rng.choice(FIRST_NAMES)}{middle} {surname}"
+
+
+def misheard(name, rng, edits=2):
+    """name with random letter substitutions, deletions or insertions (spaces left alone)."""
+    letters = list(name.lower())
+    for _ in range(edits):
+        positions = [i for i, ch in enumerate(letters) if ch != " "]
+        position = rng.choice(positions)
+        roll = rng.random()
+        if roll < 0.4:
+            letters[position] = rng.choice("aeioustnh")
+        elif roll < 0.7 and len(positions) > 4:
+            del letters[position]
+        else:
+            letters.insert(position, rng.choice("aeihs"))
+    return "".join(letters)
+
+
+def build_database(app, count, seed):
+    """Insert count patients with name_key unset. Returns a sample of their names."""
+    rng = random.Random(seed)
+    sample = []
+    batch = []
+    with app.app_context():
+        db.create_all()
+        for index in range(count):
+            name = synthetic_name(rng)
+            batch.append({"full_name": name, "medical_records_consent": False})
+            if index % max(1, count // 200) == 0:
+                sample.append(name)
+            if len(batch) == 50000:
+                db.session.execute(db.insert(Patient), batch)
+                batch = []
+        if batch:
+            db.session.execute(db.insert(Patient), batch)
+        db.session.commit()
+    return sample
+
+
+def time_call(fn, arg, min_seconds, max_calls):
+    """Median per-call time in milliseconds over at least min_seconds (and at least 3 calls)."""
+    timings = []
+    deadline = time.perf_counter() + min_seconds
+    while len(timings) < 3 or (time.perf_counter() < deadline and len(timings) < max_calls):
+        started = time.perf_counter()
+        fn(arg)
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(timings), 4)
+
+
+def baseline_lookup(name):
+    """The previous find_or_create_patient() query."""
+    return Patient.query.filter(Patient.full_name.ilike(f'%{name}%')).first()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark patient name lookup against the previous ILIKE scan.")
+    parser.add_argument("--patients", type=int, default=1000000, help="Number of synthetic patients")
+    parser.add_argument("--queries", type=int, default=20, help="Names timed per query kind")
+    parser.add_argument("--min-seconds", type=float, default=0.2, help="Minimum timing duration per name")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="Write JSON results to this file (default: stdout)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = Flask(__name__)
+        app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + os.path.join(tmp, "names.db")
+        app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+        db.init_app(app)
+
+        started = time.perf_counter()
+        sample = build_database(app, args.patients, args.seed)
+        results = {"patients": args.patients, "insert_s": round(time.perf_counter() - started, 2)}
+
+        with app.app_context():
+            started = time.perf_counter()
+            backfill_name_keys()
+            results["backfill_s"] = round(time.perf_counter() - started, 2)
+            started = time.perf_counter()
+            results["trigram_index"] = setup_name_search()
+            results["index_build_s"] = round(time.perf_counter() - started, 2)
+            print(f"{args.patients:,d} patients: insert {results['insert_s']} s, backfill {results['backfill_s']} s, "
+                  f"trigram index {results['index_build_s']} s", file=sys.stderr)
+
+            rng = random.Random(args.seed + 1)
+            names = rng.sample(sample, min(args.queries, len(sample)))
+            kinds = {
+                "exact": [name.upper() for name in names],
+                "first_name": [name.split()[0] for name in names],
+                "surname": [name.split()[-1] for name in names],
+                "unknown": [f"Nobody {rng.randint(0, 10 ** 6)}x" for _ in names],
+            }
+            results["kinds"] = {}
+            for kind, queries in kinds.items():
+                found = sum(find_patient_by_name(query) is not None for query in queries)
+                baseline = [time_call(baseline_lookup, query, args.min_seconds, 20) for query in queries]
+                indexed = [time_call(find_patient_by_name, query, args.min_seconds, 2000) for query in queries]
+                case = {
+                    "queries": len(queries),
+                    "found": found,
+                    "baseline_ms": round(statistics.median(baseline), 4),
+                    "indexed_ms": round(statistics.median(indexed), 4),
+                }
+                case["speedup"] = round(case["baseline_ms"] / case["indexed_ms"], 1)
+                results["kinds"][kind] = case
+                print(f"{kind:>10s}: found {found}/{len(queries)}  ilike {case['baseline_ms']:>9.3f} ms  "
+                      f"indexed {case['indexed_ms']:>8.3f} ms  ({case['speedup']}x)", file=sys.stderr)
+
+            index = NameIndex()
+            started = time.perf_counter()
+            index.load(db.session.execute(db.select(Patient.id, Patient.full_name)))
+            results["fuzzy_load_s"] = round(time.perf_counter() - started, 2)
+            queries = [(name, misheard(name, rng)) for name in rng.sample(sample, min(args.queries * 10, len(sample)))]
+            hits = sum(any(normalize_name(found) == normalize_name(name) for _, found, _ in index.search(query))
+                       for name, query in queries)
+            timings = [time_call(index.search, query, args.min_seconds / 10, 2000) for _, query in queries]
+            results["fuzzy"] = {
+                "queries": len(queries),
+                "hit_rate_top5": round(hits / len(queries), 3),
+                "median_ms": round(statistics.median(timings), 4),
+                "p90_ms": round(sorted(timings)[int(len(timings) * 0.9)], 4),
+            }
+            print(f"     fuzzy: index load {results['fuzzy_load_s']} s, misheard names in top 5 {hits}/{len(queries)}, "
+                  f"median {results['fuzzy']['median_ms']:.3f} ms, p90 {results['fuzzy']['p90_ms']:.3f} ms", file=sys.stderr)
+            db.session.remove()
+            db.engine.dispose()
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,49 @@
 import importlib.util
 import sys
 import os
- 
+import threading
+import time
+
 SECRET_PATH = r"C:\Users\Evan\Documents\VS Code\API Keys\secrets.py"
 FALLBACK_SECRET_PATH = r"C:\Users\ahmtt\Documents\VS\API KEY\secret.py"
- 
+
+# Optional override for the secrets file location (e.g. on Linux servers)
+SECRET_PATH_ENV_VAR = "MEDAI_SECRET_PATH"
+
+# Point every upstream at the local Azure stand-in (azure_stub.py) instead of Azure:
+# MEDAI_UPSTREAM=stub, optionally MEDAI_STUB_URL and MEDAI_STUB_STT_FORMAT ("whisper" or "azure")
+UPSTREAM_MODE_ENV_VAR = "MEDAI_UPSTREAM"
+STUB_URL = os.environ.get("MEDAI_STUB_URL", "http://127.0.0.1:5055").rstrip("/")
+STUB_STT_FORMAT = os.environ.get("MEDAI_STUB_STT_FORMAT", "whisper")
+STUB_TTS_PATH = "/openai/deployments/stub-tts/audio/speech"
+STUB_WHISPER_STT_PATH = "/openai/deployments/stub-whisper/audio/transcriptions"
+STUB_AZURE_STT_PATH = "/speech/recognition/conversation/cognitiveservices/v1"
+
+# Minimum number of seconds between mtime checks of the cached secrets file
+SECRET_CHECK_INTERVAL = float(os.environ.get("MEDAI_SECRET_CHECK_INTERVAL", "2.0"))
+
+SECRET_FIELDS = (
+    "AZURE_OPENAI_DEPLOYMENT",
+    "AZURE_OPENAI_API_KEY",
+    "AZURE_OPENAI_ENDPOINT",
+    "AZURE_OPENAI_SPEECH_STT_DEPLOYMENT",
+    "AZURE_SPEECH_STT_KEY",
+    "AZURE_SPEECH_STT_ENDPOINT",
+    "AZURE_SPEECH_STT_REGION",
+    "AZURE_OPENAI_SPEECH_TTS_DEPLOYMENT",
+    "AZURE_SPEECH_TTS_KEY",
+    "AZURE_SPEECH_TTS_ENDPOINT",
+    "AZURE_SPEECH_TTS_REGION",
+)
+
+REQUIRED_FIELDS = (
+    "AZURE_OPENAI_DEPLOYMENT",
+    "AZURE_OPENAI_API_KEY",
+    "AZURE_OPENAI_ENDPOINT",
+    "AZURE_OPENAI_SPEECH_STT_DEPLOYMENT",
+    "AZURE_OPENAI_SPEECH_TTS_DEPLOYMENT",
+)
+
 class Secret:
     """Secrets for Azure OpenAI (loaded at runtime)."""
     AZURE_OPENAI_DEPLOYMENT: str = ""
@@ -19,44 +58,176 @@ class Secret:
     AZURE_SPEECH_TTS_KEY: str = ""
     AZURE_SPEECH_TTS_ENDPOINT: str = ""
     AZURE_SPEECH_TTS_REGION: str = ""
- 
- 
+
+    _frozen: bool = False
+
+    def __setattr__(self, name, value):
+        if self._frozen:
+            raise AttributeError("Secret is read-only once loaded; call reload_secrets() instead.")
+        object.__setattr__(self, name, value)
+
+    def freeze(self):
+        """Make this Secret immutable so a cached instance can be shared safely."""
+        object.__setattr__(self, "_frozen", True)
+        return self
+
+
+def _resolve_secret_path():
+    """Return the secrets file to use: env override, primary path, then fallback path."""
+    override = os.environ.get(SECRET_PATH_ENV_VAR)
+    if override:
+        if os.path.exists(override):
+            return override
+        raise RuntimeError(f"secret.py not found at {override} ({SECRET_PATH_ENV_VAR}).")
+    if os.path.exists(SECRET_PATH):
+        return SECRET_PATH
+    if os.path.exists(FALLBACK_SECRET_PATH):
+        return FALLBACK_SECRET_PATH
+    raise RuntimeError(f"secret.py not found at {SECRET_PATH} or {FALLBACK_SECRET_PATH}. Please create it with your Azure OpenAI credentials.")
+
+
+def _secrets_from_env():
+    """Build secrets from environment variables if all required fields are set, else None."""
+    if not all(os.environ.get(field) for field in REQUIRED_FIELDS):
+        return None
+    s = Secret()
+    for field in SECRET_FIELDS:
+        setattr(s, field, os.environ.get(field, ""))
+    return s
+
+
+def stub_enabled():
+    """True if MEDAI_UPSTREAM=stub selects the local Azure stand-in."""
+    return os.environ.get(UPSTREAM_MODE_ENV_VAR, "").lower() == "stub"
+
+
+def _stub_secrets():
+    """Secrets pointing every upstream at the local stub server."""
+    s = Secret()
+    s.AZURE_OPENAI_DEPLOYMENT = "stub-gpt"
+    s.AZURE_OPENAI_API_KEY = "stub-key"
+    s.AZURE_OPENAI_ENDPOINT = STUB_URL
+    s.AZURE_OPENAI_SPEECH_STT_DEPLOYMENT = "stub-whisper"
+    s.AZURE_SPEECH_STT_KEY = "stub-key"
+    if STUB_STT_FORMAT == "azure":
+        # Region plus a 'cognitiveservices' URL selects the Azure Speech Services request format
+        s.AZURE_SPEECH_STT_ENDPOINT = STUB_URL + STUB_AZURE_STT_PATH
+        s.AZURE_SPEECH_STT_REGION = "stub"
+    else:
+        s.AZURE_SPEECH_STT_ENDPOINT = STUB_URL + STUB_WHISPER_STT_PATH
+        s.AZURE_SPEECH_STT_REGION = ""
+    s.AZURE_OPENAI_SPEECH_TTS_DEPLOYMENT = "stub-tts"
+    s.AZURE_SPEECH_TTS_KEY = "stub-key"
+    s.AZURE_SPEECH_TTS_ENDPOINT = STUB_URL + STUB_TTS_PATH
+    s.AZURE_SPEECH_TTS_REGION = "stub"
+    return s
+
+
+def _secrets_source():
+    """Where secrets come from: "stub", "env" or the path of the secrets file."""
+    if stub_enabled():
+        return "stub"
+    if _secrets_from_env() is not None:
+        return "env"
+    return _resolve_secret_path()
+
+
 def load_secrets() -> Secret:
     """Dynamically import secret.py from fixed path or fallback path. Fail gracefully if missing."""
-    # Try primary path first, then fallback path
-    secret_path = SECRET_PATH
-    if not os.path.exists(SECRET_PATH):
-        if os.path.exists(FALLBACK_SECRET_PATH):
-            secret_path = FALLBACK_SECRET_PATH
-        else:
-            raise RuntimeError(f"secret.py not found at {SECRET_PATH} or {FALLBACK_SECRET_PATH}. Please create it with your Azure OpenAI credentials.")
-    
+    # Load-testing switch: talk to the local stub instead of Azure
+    if stub_enabled():
+        return _stub_secrets()
+
+    # Environment variables take precedence over the secrets file
+    env_secrets = _secrets_from_env()
+    if env_secrets is not None:
+        return env_secrets
+
+    # Try override path, primary path, then fallback path
+    secret_path = _resolve_secret_path()
+
     try:
         spec = importlib.util.spec_from_file_location("secret", secret_path)
         secret = importlib.util.module_from_spec(spec)
         sys.modules["secret"] = secret
         spec.loader.exec_module(secret)
         s = Secret()
-        s.AZURE_OPENAI_DEPLOYMENT = getattr(secret, "AZURE_OPENAI_DEPLOYMENT", "")
-        s.AZURE_OPENAI_API_KEY = getattr(secret, "AZURE_OPENAI_API_KEY", "")
-        s.AZURE_OPENAI_ENDPOINT = getattr(secret, "AZURE_OPENAI_ENDPOINT", "")
-        s.AZURE_OPENAI_SPEECH_STT_DEPLOYMENT = getattr(secret, "AZURE_OPENAI_SPEECH_STT_DEPLOYMENT", "")
-        s.AZURE_SPEECH_STT_KEY = getattr(secret, "AZURE_SPEECH_STT_KEY", "")
-        s.AZURE_SPEECH_STT_ENDPOINT = getattr(secret, "AZURE_SPEECH_STT_ENDPOINT", "")
-        s.AZURE_SPEECH_STT_REGION = getattr(secret, "AZURE_SPEECH_STT_REGION", "")
-        s.AZURE_OPENAI_SPEECH_TTS_DEPLOYMENT = getattr(secret, "AZURE_OPENAI_SPEECH_TTS_DEPLOYMENT", "")
-        s.AZURE_SPEECH_TTS_KEY = getattr(secret, "AZURE_SPEECH_TTS_KEY", "")
-        s.AZURE_SPEECH_TTS_ENDPOINT = getattr(secret, "AZURE_SPEECH_TTS_ENDPOINT", "")
-        s.AZURE_SPEECH_TTS_REGION = getattr(secret, "AZURE_SPEECH_TTS_REGION", "")
-        if not all([
-            s.AZURE_OPENAI_DEPLOYMENT,
-            s.AZURE_OPENAI_API_KEY,
-            s.AZURE_OPENAI_ENDPOINT,
-            s.AZURE_OPENAI_SPEECH_STT_DEPLOYMENT,
-            s.AZURE_OPENAI_SPEECH_TTS_DEPLOYMENT,
-        ]):
+        for field in SECRET_FIELDS:
+            setattr(s, field, getattr(secret, field, ""))
+        if not all(getattr(s, field) for field in REQUIRED_FIELDS):
             raise RuntimeError(f"secret.py is missing required fields. Please check your credentials at {secret_path}.")
         return s
     except Exception as e:
         raise RuntimeError(f"Failed to load secrets from secret.py at {secret_path}. Please check the file and try again. [REDACTED]") from None
- 
+
+
+# Process-wide secrets cache, shared by all request threads
+_cache_lock = threading.Lock()
+_cache = {
+    "secret": None,
+    "source": None,  # "stub", "env" or the path of the secrets file
+    "mtime": None,
+    "checked_at": 0.0,
+}
+_reload_count = 0
+
+
+def _source_mtime(source):
+    """Return the mtime of the secrets file backing the cache (None for env or stub secrets)."""
+    if source in (None, "env", "stub"):
+        return None
+    try:
+        return os.stat(source).st_mtime
+    except OSError:
+        return None
+
+
+def _load_into_cache():
+    """Load secrets from their source and store a frozen copy in the cache. Caller holds the lock."""
+    global _reload_count
+    secret = load_secrets()
+    source = _secrets_source()
+    _cache["secret"] = secret.freeze()
+    _cache["source"] = source
+    _cache["mtime"] = _source_mtime(source)
+    _cache["checked_at"] = time.monotonic()
+    _reload_count += 1
+    return _cache["secret"]
+
+
+def get_secrets() -> Secret:
+    """Return the cached secrets, re-executing secret.py only when the file has changed.
+
+    If a changed file fails to load (e.g. caught mid-write), the last good
+    secrets are kept and the reload is retried at the next check. Only a
+    first load that fails raises.
+    """
+    secret = _cache["secret"]
+    now = time.monotonic()
+    if secret is not None and now - _cache["checked_at"] < SECRET_CHECK_INTERVAL:
+        return secret
+
+    with _cache_lock:
+        if _cache["secret"] is None:
+            return _load_into_cache()
+        if now - _cache["checked_at"] < SECRET_CHECK_INTERVAL:
+            return _cache["secret"]
+        _cache["checked_at"] = now
+        if _cache["source"] not in ("env", "stub") and _source_mtime(_cache["source"]) != _cache["mtime"]:
+            print(f"Secrets file changed, reloading from {_cache['source']}")
+            try:
+                return _load_into_cache()
+            except Exception as e:
+                print(f"Error reloading secrets, keeping the previous ones: {e}")
+        return _cache["secret"]
+
+
+def reload_secrets() -> Secret:
+    """Force a reload of the cached secrets (e.g. after rotating keys in the environment)."""
+    with _cache_lock:
+        return _load_into_cache()
+
+
+def get_reload_count() -> int:
+    """Number of times secrets have been (re)loaded into the cache in this process."""
+    return _reload_count